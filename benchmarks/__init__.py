@@ -0,0 +1,17 @@
+from __future__ import annotations
+
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+# A benchmark's setup function takes the parameter (if any) and returns the callable that gets timed,
+# so that building synthetic content is never part of the measurement.
+Setup = Callable[..., Callable[[], object]]
+
+benchmarks: Dict[str, Tuple[Setup, Tuple]] = {}
+
+
+def benchmark(name: str, params: Optional[Iterable] = None):
+    def register(setup: Setup) -> Setup:
+        benchmarks[name] = (setup, tuple(params) if params is not None else ())
+        return setup
+
+    return register
@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import argparse
+import importlib
+import json
+import os
+import platform
+import sys
+import timeit
+from typing import Dict
+
+from . import benchmarks
+
+MODULES = ('benchmarks.bench_rpg', 'benchmarks.bench_bot')
+BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+
+def load_modules():
+    for module in MODULES:
+        try:
+            importlib.import_module(module)
+        except ImportError as e:
+            # the bot benchmarks need discord.py and discord_components
+            print(f'skipping {module}: {e}', file=sys.stderr)
+
+
+# Best of `repeat` runs, in seconds per call
+def measure(run, repeat: int) -> float:
+    timer = timeit.Timer(run)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat, number)) / number
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='Engine and UI microbenchmarks')
+    parser.add_argument('-k', dest='select', default='', help='only run benchmarks whose name contains this')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--compare', metavar='JSON', nargs='?', const=BASELINE,
+                        help=f'compare against a baseline (default {os.path.relpath(BASELINE)})')
+    parser.add_argument('--save', metavar='JSON', nargs='?', const=BASELINE, help='write the results as a baseline')
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help='flag benchmarks that got slower than baseline by this factor')
+    args = parser.parse_args(argv)
+
+    load_modules()
+    baseline: Dict[str, float] = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+
+    results: Dict[str, float] = {}
+    regressions = 0
+    for name, (setup, params) in benchmarks.items():
+        for param in params or (None,):
+            key = name if param is None else f'{name}[{param}]'
+            if args.select not in key:
+                continue
+            run = setup() if param is None else setup(param)
+            results[key] = seconds = measure(run, args.repeat)
+            line = f'{key:<32}{seconds * 1e6:>12.2f} us'
+            if key in baseline:
+                ratio = seconds / baseline[key]
+                flag = '  SLOWER' if ratio > args.threshold else '  faster' if ratio < 1 / args.threshold else ''
+                regressions += ratio > args.threshold
+                line += f'{baseline[key] * 1e6:>12.2f} us  x{ratio:.2f}{flag}'
+            print(line)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'python': platform.python_version(), 'machine': platform.machine(),
+                       'results': results}, f, indent=2, sort_keys=True)
+            f.write('\n')
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,45 @@
+from __future__ import annotations
+
+import itertools
+
+from bot.ui_template import FightUI, CombatLog, Selectable
+from . import benchmark, generators
+
+
+class _Menu(Selectable):
+    async def select_callback(self, inter):
+        pass
+
+
+@benchmark('ui.fight_text', params=(2, 20))
+def fight_text(size: int):
+    fight = generators.fight(size, n_effects=3)
+    ui = FightUI(None, fight)
+    hits = itertools.cycle(fight.lookup)
+
+    def run():
+        next(hits).effective_stats.hp -= 1
+        return ui.get_ui_text()
+
+    return run
+
+
+@benchmark('ui.combat_log', params=(0, 5))
+def combat_log(page: int):
+    log = CombatLog(None, capacity=1000)
+    for line in generators.log_lines(1000):
+        log.add_log(line)
+    return lambda: log.get_embed(page)
+
+
+@benchmark('ui.selectable', params=(10, 1000, 100000))
+def selectable(n: int):
+    menu = _Menu(None, None, generators.options(n), 'Benchmark')
+
+    # every call moves the cursor and drops the cached embeds, so that each one renders a page
+    def run():
+        menu.cursor = (menu.cursor + 1) % len(menu.view)
+        menu.embeds.clear()
+        return menu.get_embed()
+
+    return run
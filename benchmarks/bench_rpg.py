@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+import random
+
+import rpg
+from rpg.simulation import RandomPolicy
+from . import benchmark, generators
+
+PARTY_SIZES = (2, 20, 200)
+
+
+@benchmark('stats.add')
+def stats_add():
+    a, b = rpg.Stats(1, 2, 3, 4), rpg.Stats(5, 6, 7, 8)
+    return lambda: a + b
+
+
+@benchmark('stats.iadd_batch', params=(1000,))
+def stats_iadd_batch(n: int):
+    batch = rpg.StatsBatch.from_stats([rpg.Stats(i, i, i, i) for i in range(n)])
+    delta = rpg.Stats(-1, 0, 0, 0)
+
+    def run():
+        batch.__iadd__(delta)
+
+    return run
+
+
+@benchmark('character.stats')
+def character_stats():
+    c = generators.character(random.Random(0), 'C', 0)
+
+    def run():
+        c.invalidate_stats()
+        return c.stats
+
+    return run
+
+
+def _turn(fight: rpg.Fight, policy: RandomPolicy, rng: random.Random):
+    current = fight.next_turn()
+    decision = policy(fight, current, rng)
+    if decision:
+        fight.turn_action(*decision)
+    else:
+        fight.pass_turn()
+    fight.effect_queue.queue.clear()
+
+
+@benchmark('fight.turn', params=PARTY_SIZES)
+def fight_turn(size: int):
+    fight, policy, rng = generators.fight(size), RandomPolicy(), random.Random(0)
+    return lambda: _turn(fight, policy, rng)
+
+
+@benchmark('fight.turn_effects', params=PARTY_SIZES)
+def fight_turn_effects(size: int):
+    fight, policy, rng = generators.fight(size, n_effects=20), RandomPolicy(), random.Random(0)
+    return lambda: _turn(fight, policy, rng)
+
+
+@benchmark('fight.fork', params=PARTY_SIZES)
+def fight_fork(size: int):
+    fight = generators.fight(size, n_effects=4)
+    return fight.fork
+
+
+@benchmark('fight.area', params=(10, 50))
+def fight_area(size: int):
+    rng = random.Random(0)
+    caster = generators.character(rng, 'L', 0)
+    caster.skills = [rpg.AreaSkill('Quake', 'enemies')]
+    fight = rpg.Fight([caster], [generators.character(rng, 'R', i) for i in range(size)], 0)
+    for c in fight.lookup:
+        c.update_effective_stats()
+    fight.current = caster
+
+    def run():
+        fight.log.clear()
+        return fight.turn_action('Quake', None)
+
+    return run
+
+
+DAMAGE = 'damage = max(0, user.atk * 1.5 - target.defense); target.hp -= damage'
+
+
+@benchmark('formula.scalar')
+def formula_scalar():
+    formula = rpg.compile_formula(DAMAGE)
+    rng = random.Random(0)
+    user, target = generators.character(rng, 'U', 0), generators.character(rng, 'T', 0)
+    for c in (user, target):
+        c.update_effective_stats()
+    return lambda: formula(user, target)
+
+
+# one row per simulated fight
+@benchmark('formula.batch', params=(1000,))
+def formula_batch(n: int):
+    formula = rpg.compile_formula(DAMAGE)
+    users = rpg.StatsBatch.from_stats([rpg.Stats(1e12, 0, 20, 0)] * n)
+    targets = rpg.StatsBatch.from_stats([rpg.Stats(1e12, i % 10, 0, 0) for i in range(n)])
+    return lambda: formula.run_batch(users, targets)
@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+import random
+from typing import List
+
+import rpg
+from rpg.content import attack_skill
+
+WORDS = ('iron', 'rusty', 'cursed', 'holy', 'soggy', 'ancient', 'tiny', 'giant', 'sword', 'shield',
+         'boots', 'helmet', 'potion', 'chicken', 'fish', 'calculator', 'bomb', 'yeezy', 'cloak', 'ring')
+
+SKILLS = [attack_skill('Slash', 1.), attack_skill('Smash', 1.5), attack_skill('Poke', .5)]
+
+
+def name(rng: random.Random, words: int = 3) -> str:
+    return ' '.join(rng.choice(WORDS) for _ in range(words)).title()
+
+
+def effects(rng: random.Random, n: int) -> List[rpg.Effect]:
+    made = []
+    for i in range(n):
+        if i % 2:
+            factor = 1 + rng.random() / 100
+            made.append(rpg.StatsMod(f'Buff {i}', '', 10 ** 9, rpg.stat_mod(atk=lambda x, f=factor: x * f),
+                                     lambda character: ''))
+        else:
+            made.append(rpg.DummyEffect(f'Aura {i}', '', 10 ** 9, lambda character: None))
+    return made
+
+
+# Characters get enough hp that a benchmark never runs out of fight
+def character(rng: random.Random, prefix: str, i: int, n_effects: int = 0, items: int = 3) -> rpg.Character:
+    weapons = [rpg.Weapon(f'{name(rng)} {j}', '', rpg.Stats(0, 0, rng.randint(1, 20), 0)) for j in range(items)]
+    armors = [rpg.Armor(f'{name(rng)} {j}', '', j % 3, rpg.Stats(rng.randint(1, 50), rng.randint(1, 10), 0, 0))
+              for j in range(items)]
+    c = rpg.Character(f'{prefix}{i}', weapons, armors, (), rpg.Stats(1e12, rng.randint(0, 5), rng.randint(5, 20), 5))
+    c.skills = SKILLS
+    c.speed = rng.choice((.5, 1., 1., 2.))
+    if weapons:
+        c.equip_weapon(weapons[0])
+    for armor in armors[:3]:
+        c.equip_armor(armor)
+    for effect in effects(rng, n_effects):
+        c.effects.append(effect)
+    return c
+
+
+def fight(size: int, n_effects: int = 0, seed: int = 0) -> rpg.Fight:
+    rng = random.Random(seed)
+    left = [character(rng, 'L', i, n_effects) for i in range(size // 2)]
+    right = [character(rng, 'R', i, n_effects) for i in range(size - size // 2)]
+    f = rpg.Fight(left, right, seed)
+    for c in f.lookup:
+        c.update_effective_stats()
+    return f
+
+
+def options(n: int, seed: int = 0) -> List[str]:
+    rng = random.Random(seed)
+    return [f'{name(rng)} #{i}' for i in range(n)]
+
+
+def log_lines(n: int, seed: int = 0) -> List[str]:
+    rng = random.Random(seed)
+    return [f'{name(rng, 1)} hits {name(rng, 1)} for {rng.random() * 100:.1f} damage' for _ in range(n)]
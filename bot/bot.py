@@ -1,51 +1,105 @@
-import discord
-from discord_components import ComponentsBot
+import os
+
+from discord.ext import commands
+from discord_components import ComponentsBot, Interaction
 
 import rpg
+from rpg.ai import SearchPolicy
+from rpg.content import Catalog
+from rpg.serialization import registry
 from .ui import Fight, Dialogue, Choice
+from .ui_template import Shop
 from .util import start_wait
+from .session import Session, SessionManager
+from .saves import SaveStore
+from .metrics import configure_from_env
+
+catalog = Catalog.load(os.path.join(os.path.dirname(__file__), 'content.json'))
+registry.sources.append(catalog)
+saves = SaveStore.from_env()
+
+
+# Picks up edits to content.json between games without restarting the bot
+def current_catalog() -> Catalog:
+    global catalog
+    fresh = catalog.reloaded()
+    if fresh is not catalog:
+        registry.sources[registry.sources.index(catalog)] = fresh
+        catalog = fresh
+    return catalog
 
 
 class DungeonBot(ComponentsBot):
     def __init__(self):
         super().__init__(';')
+        self.sessions = SessionManager(self.components_manager)
+        configure_from_env()
+        self.add_command(play)
 
+    # picks up the games that were running when the bot last stopped
     async def on_ready(self):
-        beginning = rpg.Dialogue()
-        najim = rpg.Player('Najim', [rpg.Weapon('MILF hunter sword', 'A sentient sword that likes milfs',
-                                                rpg.Stats(atk=16)),
-                                     rpg.Weapon('Faulty Calculator', 'Adds +1 int, but only if the user knows how '
-                                                                     'to operate calculators', rpg.Stats())],
-                           [rpg.Consumable('Dildo', 'A regular dildo'),
-                            rpg.Consumable('Fleshlight', 'A regular fleshlight')],
-                           [rpg.Armor('Fortnite shoes', 'Shoes that spreads cancer with every step', 1,
-                                      rpg.Stats(hp=69)),
-                            rpg.Armor('Yeezy (singular) ', 'The long lost pair of roar\'s yeezy',
-                                      1, rpg.Stats(hp=32, defense=5))],
-                           rpg.Stats(0, 16, 0, 0))
-        roar = rpg.Player('RoaR', [rpg.Weapon('A fish', '', rpg.Stats())],
-                          [rpg.Consumable('Bomb', '')],
-                          [rpg.Armor('Yeezy', 'Overpriced shoe(singular)', 1, rpg.Stats())]
-                          , rpg.Stats(32, 16, 16, 5))
-        chicken = rpg.Character('Chicken God', [], [], [], rpg.Stats(16, 1, 1, 64))
-        chn: discord.TextChannel = self.get_channel(887345509990285315)
-
-        najim.equip_weapon('MILF hunter sword')
-        najim.equip_armor('Fortnite shoes')
-
-        fight = Fight(self.components_manager,
-                      chn,
-                      [najim, roar],
-                      [chicken])
-
-        beginning.add_line(chicken, 'Let me suck your pp')
-
-        await start_wait(self, Dialogue(self.components_manager, chn, beginning))
-
-        bc = rpg.Choice()
-        bc.add_choice('No', rpg.Dialogue([(najim, 'No'), (roar, 'Weirdo no'), (chicken, 'Too bad')]))
-        bc.add_choice('Ew no fag', rpg.Dialogue([(najim, 'Faggots'), (chicken, 'Alright faggot, bring it on')]))
-
-        await start_wait(self, Choice(self.components_manager, chn, bc))
-
-        await fight.start()
+        for session_id in saves.sessions():
+            channel = self.get_channel(int(session_id))
+            if channel is None:
+                saves.clear(session_id)
+            else:
+                self.sessions.start(channel, resume)
+
+    async def on_button_click(self, inter: Interaction):
+        self.sessions.dispatch(inter)
+
+
+@commands.command()
+async def play(ctx: commands.Context):
+    if ctx.bot.sessions.start(ctx.channel, story) is None:
+        await ctx.send('A game is already running in this channel')
+
+
+async def resume(session: Session):
+    await story(session, True)
+
+
+async def story(session: Session, resumed: bool = False):
+    client = session.client
+    chn = session.channel
+    catalog = current_catalog()
+
+    characters = [catalog.character(name) for name in ('Najim', 'RoaR', 'Chicken God')]
+    cast = {c.name: c for c in characters}
+    world = rpg.World(catalog.script('intro', cast), cast=cast)
+    restored = None
+    if resumed:
+        characters = saves.load_session(session.id, world) or characters
+        restored = saves.load_fight(session.id)
+        if restored is not None:
+            characters = [*restored.left, *restored.right]
+    najim, roar, chicken = characters
+    party = [najim, roar]
+    shop = Shop(client, chn, catalog.shop('default'), party, 0, session.registry())
+    fight = Fight(client, chn, chn, party, [chicken], shop, session.registry(),
+                  policies={chicken.name: SearchPolicy()}, checkpoint=saves.checkpointer(session.id))
+
+    try:
+        node = world.advance() if restored is None else None
+        while node is not None:
+            saves.save_session(session.id, world, characters)
+            if isinstance(node, rpg.Choice):
+                view = Choice(client, chn, node, callbacks=session.registry())
+                await start_wait(session, view)
+                node = world.advance(node[view.index][0])
+            else:
+                await start_wait(session, Dialogue(client, chn, node, session.registry()))
+                node = world.advance()
+
+        saves.save_session(session.id, world, characters)
+        if restored is not None:
+            await fight.resume(restored)
+        else:
+            await start_wait(session, fight, 'sub_continue')
+        await fight.exited
+    except Exception:
+        # a crashed game would only crash again when resumed. Cancellation (the bot shutting down) isn't
+        # an Exception, so those saves are kept.
+        saves.clear(session.id)
+        raise
+    saves.clear(session.id)
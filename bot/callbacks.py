@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+from asyncio.futures import Future
+from typing import Callable, Dict, List, Optional
+from uuid import uuid4
+
+from discord_components import DiscordComponents, Component
+
+from rpg import metrics
+
+
+# Scoped custom_ids look like "<key>:<session>.<view>" (or "<key>:<view>" outside of a session)
+def key_of(custom_id: str) -> str:
+    return custom_id.split(':', 1)[0]
+
+
+def session_of(custom_id: str) -> str:
+    _, _, scope = custom_id.partition(':')
+    session, dot, _ = scope.partition('.')
+    return session if dot else ''
+
+
+# Owns every callback a view registers. Buttons built through custom_id() keep the same id across
+# re-renders, so re-registering overwrites the previous entry instead of adding a new one, and
+# clear() drops all of them (and those of child registries) once the view is done.
+class CallbackRegistry:
+    live = 0
+
+    def __init__(self, client: DiscordComponents, session: str = '',
+                 parent: Optional[CallbackRegistry] = None):
+        self.client = client
+        self.session = session
+        self.scope = f'{session}.{uuid4().hex[:12]}' if session else uuid4().hex[:12]
+        self.parent = parent
+        self.components: Dict[str, Component] = {}
+        self.children: List[CallbackRegistry] = []
+
+    def custom_id(self, key: str) -> str:
+        return f'{key}:{self.scope}'
+
+    def add(self, component: Component, callback: Callable) -> Component:
+        if component.id not in self.components:
+            CallbackRegistry.live += 1
+        self.components[component.id] = component
+        if metrics.enabled and self.session:
+            # callbacks run in the client's tasks, not the session's
+            callback = metrics.bind_session(callback, self.session)
+        return self.client.add_callback(component, callback)
+
+    def child(self) -> CallbackRegistry:
+        registry = CallbackRegistry(self.client, self.session, parent=self)
+        self.children.append(registry)
+        return registry
+
+    def clear(self):
+        for child in self.children[:]:
+            child.clear()
+        for component in self.components.values():
+            self.client.remove_callback(component)
+        CallbackRegistry.live -= len(self.components)
+        self.components.clear()
+        if self.parent and self in self.parent.children:
+            self.parent.children.remove(self)
+
+    def bind(self, future: Future) -> Future:
+        future.add_done_callback(lambda _: self.clear())
+        return future
+
+    def future(self) -> Future:
+        return self.bind(self.client.bot.loop.create_future())
+
+
+def live_callbacks() -> int:
+    return CallbackRegistry.live
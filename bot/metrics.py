@@ -0,0 +1,44 @@
+from __future__ import annotations
+
+import os
+
+import discord
+import discord.abc
+from discord_components import Interaction, ComponentMessage
+
+from rpg import metrics
+
+# Every Discord round trip the views make goes through one of these
+DISCORD_CALLS = (
+    (discord.abc.Messageable, 'send', 'discord.send'),
+    (discord.Message, 'edit', 'discord.edit'),
+    (discord.Message, 'delete', 'discord.delete'),
+    (ComponentMessage, 'edit', 'discord.edit'),
+    (Interaction, 'edit_origin', 'discord.edit_origin'),
+    (Interaction, 'respond', 'discord.respond'),
+)
+
+
+def _discord_hooks():
+    for owner, attribute, name in DISCORD_CALLS:
+        # only methods the class defines itself, inherited ones are already wrapped on the base class
+        if attribute in vars(owner):
+            metrics.instrument(owner, attribute, name)
+
+
+def enable():
+    metrics.enable(_discord_hooks)
+
+
+# DND_METRICS_PORT serves the metrics as JSON on localhost, DND_METRICS_FILE dumps them every
+# DND_METRICS_INTERVAL seconds (60 by default). Metrics stay off when neither is set.
+def configure_from_env():
+    port = os.environ.get('DND_METRICS_PORT')
+    path = os.environ.get('DND_METRICS_FILE')
+    if not port and not path:
+        return
+    enable()
+    if port:
+        metrics.serve(int(port))
+    if path:
+        metrics.dump_every(path, float(os.environ.get('DND_METRICS_INTERVAL', 60)))
@@ -0,0 +1,37 @@
+import asyncio
+from typing import Dict, Tuple, Any
+
+from discord import Message
+
+
+# Collects message edits and sends them together. Edits to the same message are merged, and if a
+# message is still being edited (e.g. stuck behind rate limit backoff) only its latest state is sent next.
+class RenderScheduler:
+    def __init__(self):
+        self.pending: Dict[int, Tuple[Message, Dict[str, Any]]] = {}
+        self.inflight: Dict[int, asyncio.Future] = {}
+
+    def schedule(self, message: Message, **fields: Any):
+        entry = self.pending.get(id(message))
+        if entry:
+            entry[1].update(fields)
+        else:
+            self.pending[id(message)] = (message, fields)
+
+    def discard(self, message: Message):
+        self.pending.pop(id(message), None)
+
+    async def drain(self, key: int):
+        try:
+            while (entry := self.pending.pop(key, None)) is not None:
+                message, fields = entry
+                await message.edit(**fields)
+        finally:
+            self.inflight.pop(key, None)
+
+    async def flush(self):
+        for key in list(self.pending):
+            if key not in self.inflight:
+                self.inflight[key] = asyncio.ensure_future(self.drain(key))
+        if self.inflight:
+            await asyncio.gather(*self.inflight.values())
@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+import os
+from typing import List, Optional
+
+import rpg
+from rpg.serialization import files, dump_session, load_session, load_fight, Checkpointer
+
+
+# Per-channel save files, so games survive a restart of the bot: `<channel>.session` holds the story
+# position, flags and party and is rewritten as the story advances, `<channel>.fight` is rewritten by a
+# Checkpointer after every action of a running fight. Files are written off the event loop (see
+# rpg.serialization.FileWriter). Saving is opt-in: DND_SAVE_DIR sets the directory, nothing is saved
+# when it's unset or empty.
+class SaveStore:
+    def __init__(self, directory: Optional[str]):
+        self.directory = directory
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    @classmethod
+    def from_env(cls) -> SaveStore:
+        return cls(os.environ.get('DND_SAVE_DIR'))
+
+    def path(self, session_id: str, kind: str) -> str:
+        return os.path.join(self.directory, f'{session_id}.{kind}')
+
+    # ids of the sessions that can be resumed
+    def sessions(self) -> List[str]:
+        if not self.directory:
+            return []
+        return sorted(name[:-len('.session')] for name in os.listdir(self.directory) if name.endswith('.session'))
+
+    def save_session(self, session_id: str, world: rpg.World, characters: List[rpg.Character]):
+        if self.directory:
+            files.write(self.path(session_id, 'session'), dump_session(world, characters))
+
+    # Restores the world in place and returns the party, or None if nothing was saved
+    def load_session(self, session_id: str, world: rpg.World) -> Optional[List[rpg.Character]]:
+        if not self.directory:
+            return None
+        files.flush()
+        try:
+            with open(self.path(session_id, 'session'), 'rb') as f:
+                return load_session(f.read(), world)
+        except FileNotFoundError:
+            return None
+
+    def checkpointer(self, session_id: str) -> Optional[Checkpointer]:
+        return Checkpointer(self.path(session_id, 'fight')) if self.directory else None
+
+    def load_fight(self, session_id: str) -> Optional[rpg.Fight]:
+        if not self.directory:
+            return None
+        files.flush()
+        try:
+            with open(self.path(session_id, 'fight'), 'rb') as f:
+                return load_fight(f.read())
+        except FileNotFoundError:
+            return None
+
+    def clear(self, session_id: str):
+        if self.directory:
+            files.remove(self.path(session_id, 'session'))
+            files.remove(self.path(session_id, 'fight'))
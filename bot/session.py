@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from asyncio.futures import Future
+from typing import Dict, Tuple, Callable, Awaitable, Optional
+
+from discord.abc import Messageable
+from discord_components import DiscordComponents, Interaction
+
+from rpg import metrics
+from .callbacks import CallbackRegistry, key_of, session_of
+
+log = logging.getLogger(__name__)
+
+
+# One running game in one channel. Views created for a session get custom_ids scoped to it, so clicks
+# are routed back to this session only.
+class Session:
+    def __init__(self, manager: SessionManager, channel: Messageable):
+        self.manager = manager
+        self.channel = channel
+        self.id = str(channel.id)
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def client(self) -> DiscordComponents:
+        return self.manager.client
+
+    def registry(self) -> CallbackRegistry:
+        return CallbackRegistry(self.client, self.id)
+
+    # resolves with the interaction of the next click on a button with this key in any of the session's views
+    def wait(self, key: str) -> Future:
+        future = self.client.bot.loop.create_future()
+        self.manager.waiters[(self.id, key)] = future
+        return future
+
+
+class SessionManager:
+    def __init__(self, client: DiscordComponents):
+        self.client = client
+        self.sessions: Dict[str, Session] = {}
+        self.waiters: Dict[Tuple[str, str], Future] = {}
+
+    def get(self, channel: Messageable) -> Optional[Session]:
+        return self.sessions.get(str(channel.id))
+
+    def start(self, channel: Messageable, game: Callable[[Session], Awaitable]) -> Optional[Session]:
+        if self.get(channel):
+            return None
+        session = Session(self, channel)
+        self.sessions[session.id] = session
+        # the task copies the current context, so everything the game does is labelled with the session
+        token = metrics.session.set(session.id)
+        session.task = asyncio.ensure_future(game(session))
+        metrics.session.reset(token)
+        session.task.add_done_callback(lambda _: self.end(session))
+        return session
+
+    def end(self, session: Session):
+        self.sessions.pop(session.id, None)
+        for key in [key for key in self.waiters if key[0] == session.id]:
+            future = self.waiters.pop(key)
+            if not future.done():
+                future.cancel()
+        if session.task and not session.task.done():
+            session.task.cancel()
+        elif session.task and not session.task.cancelled() and session.task.exception() is not None:
+            exception = session.task.exception()
+            log.error('Game in channel %s crashed', session.id,
+                      exc_info=(type(exception), exception, exception.__traceback__))
+
+    def dispatch(self, inter: Interaction):
+        future = self.waiters.pop((session_of(inter.custom_id), key_of(inter.custom_id)), None)
+        if future and not future.done():
+            future.set_result(inter)
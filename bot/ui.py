@@ -1,5 +1,7 @@
+import asyncio
 import itertools
-from typing import List, Iterator, Callable, Tuple, Optional
+import random
+from typing import List, Iterator, Callable, Tuple, Optional, Dict
 from asyncio.futures import Future
 
 import discord
@@ -14,6 +16,9 @@ from discord_components import (
 )
 
 import rpg
+from rpg import metrics
+from rpg.serialization import Checkpointer
+from rpg.simulation import Policy
 from .ui_template import (
     Selectable,
     TargetSelect,
@@ -23,54 +28,69 @@ from .ui_template import (
     Shop,
 )
 from .util import remove_callback, start_wait
+from .callbacks import CallbackRegistry, key_of
+from .render import RenderScheduler
 
 
 class Dialogue:
     def __init__(self,
                  client: DiscordComponents,
                  channel: Messageable,
-                 dialogue: rpg.Dialogue):
+                 dialogue: rpg.Dialogue,
+                 callbacks: Optional[CallbackRegistry] = None):
         self.client = client
         self.channel = channel
+        self.callbacks = callbacks or CallbackRegistry(client)
         self.dialogue = dialogue
         self.no_skip = True
         self.index = 0
+        self.embeds: Dict[int, discord.Embed] = {}
+
+    # noinspection PyArgumentList
+    def get_embed(self) -> discord.Embed:
+        if self.index not in self.embeds:
+            author, line = self.dialogue[self.index]
+            self.embeds[self.index] = discord.Embed(title=author.name, description=line,
+                                                    colour=hash(author.name) & 0xFFFFFF)
+        return self.embeds[self.index]
 
     def get_components(self):
         return [
             [
-                self.client.add_callback(
-                    Button(style=ButtonStyle.blue, emoji="◀️"),
+                self.callbacks.add(
+                    Button(style=ButtonStyle.blue, emoji="◀️", custom_id=self.callbacks.custom_id('left')),
                     self.button_left_callback,
                 ),
                 Button(
                     label=f'Page {self.index + 1}/{len(self.dialogue)}',
                     disabled=True,
+                    custom_id=self.callbacks.custom_id('page'),
                 ),
-                self.client.add_callback(
-                    Button(style=ButtonStyle.blue, emoji="▶️"),
+                self.callbacks.add(
+                    Button(style=ButtonStyle.blue, emoji="▶️", custom_id=self.callbacks.custom_id('right')),
                     self.button_right_callback,
                 ),
-                self.client.add_callback(
+                self.callbacks.add(
                     Button(
                         label='Continue',
-                        custom_id='continue',
+                        custom_id=self.callbacks.custom_id('continue'),
                         disabled=self.no_skip,
                     ),
-                    remove_callback
+                    self.continue_callback
                 )
             ]
         ]
 
+    async def continue_callback(self, inter: Interaction):
+        self.callbacks.clear()
+        await remove_callback(inter)
+
     # noinspection PyArgumentList
     async def start(self):
         if len(self.dialogue) == 1:
             self.no_skip = False
-        dialogue = self.dialogue[self.index]
-        embed = discord.Embed(title=dialogue[0].name, description=dialogue[1],
-                              colour=hash(dialogue[0].name) & 0xFFFFFF)
         await self.channel.send(
-            embed=embed, components=self.get_components()
+            embed=self.get_embed(), components=self.get_components()
         )
 
     async def button_left_callback(self, inter: Interaction):
@@ -84,13 +104,8 @@ class Dialogue:
     async def button_callback(self, inter: Interaction):
         if self.index == len(self.dialogue) - 1:
             self.no_skip = False
-        dialogue = self.dialogue[self.index]
-
-        embed = discord.Embed(title=dialogue[0].name, description=dialogue[1],
-                              colour=hash(dialogue[0].name) & 0xFFFFFF)
         await inter.edit_origin(
-            embed=embed, components=self.get_components(),
-
+            embed=self.get_embed(), components=self.get_components(),
         )
 
 
@@ -99,15 +114,17 @@ class Choice(Selectable):
                  client: DiscordComponents,
                  channel: Messageable,
                  choice: rpg.Choice,
-                 select_title: str = 'You are presented with a choice!'):
+                 select_title: str = 'You are presented with a choice!',
+                 callbacks: Optional[CallbackRegistry] = None):
         super().__init__(client, channel, [dialogue[0] for dialogue in choice], select_title,
-                         select_button=Button(label='Continue'), color=0xA020F0)
+                         select_button=Button(label='Continue'), color=0xA020F0, callbacks=callbacks)
         self.choice = choice
 
     async def select_callback(self, inter: Interaction):
+        self.callbacks.clear()
         await remove_callback(inter)
         await Dialogue(client=self.client, channel=self.channel,
-                       dialogue=self.choice[self.index][1]).start()
+                       dialogue=self.choice[self.index][1], callbacks=self.callbacks.child()).start()
 
 
 class Fight:
@@ -117,8 +134,12 @@ class Fight:
                  right_channel: Messageable,
                  party_one: List[rpg.Character],
                  party_two: List[rpg.Character],
-                 shop: Shop):
+                 shop: Shop,
+                 callbacks: Optional[CallbackRegistry] = None,
+                 policies: Optional[Dict[str, Policy]] = None,
+                 checkpoint: Optional[Checkpointer] = None):
         self.client = client
+        self.callbacks = callbacks or CallbackRegistry(client)
         self.channel = channel
         self.right_channel = right_channel
         self.party_one = party_one
@@ -127,9 +148,14 @@ class Fight:
         self.shop_opened = False
         self.inventory_opened = False
 
-        self.inventory = Inventory(client, channel, party_one, self.update)
+        self.inventory = Inventory(client, channel, party_one, self.update, self.callbacks.child())
         self.shop = shop
-        self.exited: Future[bool] = self.client.bot.loop.create_future()
+        self.exited: Future[bool] = self.get_new_future()
+        # characters (by name) whose turns are decided by a policy instead of the players
+        self.policies = policies or {}
+        self.rng = random.Random()
+        # saves the running fight after every action so it can be resumed, see resume()
+        self.checkpoint = checkpoint
 
     def get_embed(self):
         embed = discord.Embed(title='It\'s showtime!', color=0xEC9706)
@@ -156,19 +182,19 @@ class Fight:
     def get_component(self, proceed_disabled: bool = False,
                       shop_disabled: bool = False, inventory_disabled: bool = False) -> List[List[Component]]:
         return [[
-            self.client.add_callback(
+            self.callbacks.add(
                 Button(style=ButtonStyle.blue, label='Proceed',
-                       custom_id='sub_continue', disabled=proceed_disabled),
+                       custom_id=self.callbacks.custom_id('sub_continue'), disabled=proceed_disabled),
                 self.begin_fight,
             ),
-            self.client.add_callback(
+            self.callbacks.add(
                 Button(style=ButtonStyle.green, label='Shops',
-                       disabled=shop_disabled),
+                       custom_id=self.callbacks.custom_id('shop'), disabled=shop_disabled),
                 self.open_shop,
             ),
-            self.client.add_callback(
+            self.callbacks.add(
                 Button(style=ButtonStyle.green, label='Inventory',
-                       disabled=inventory_disabled),
+                       custom_id=self.callbacks.custom_id('inventory'), disabled=inventory_disabled),
                 self.open_inventory
             )
         ]]
@@ -184,7 +210,7 @@ class Fight:
                                           self.inventory_opened))
 
     def get_new_future(self):
-        return self.client.bot.loop.create_future()
+        return self.callbacks.future()
 
     async def open_inventory(self, inter: Interaction):
         self.inventory_opened = True
@@ -192,7 +218,7 @@ class Fight:
 
         await self.inventory.start()
         await self.inventory.exited
-        self.inventory.exited = self.get_new_future()
+        self.inventory.exited = self.inventory.callbacks.future()
 
         self.inventory_opened = False
         await self.update_component_state(inter, False)
@@ -203,43 +229,76 @@ class Fight:
 
         await self.shop.start()
         await self.shop.exited
-        self.shop.exited = self.get_new_future()
+        self.shop.exited = self.shop.callbacks.future()
 
         self.shop_opened = False
         await self.update_component_state(inter, False)
 
     async def begin_fight(self, inter: Interaction):
         await inter.edit_origin(components=self.get_component(True, True, True))
+        for character in (*self.party_one, *self.party_two):
+            character.update_effective_stats()
+        await self.run_fight(rpg.Fight(self.party_one, self.party_two))
+
+    # Shows the menu and continues a fight restored from a checkpoint, e.g. after a restart
+    async def resume(self, fight: rpg.Fight):
+        self.party_one, self.party_two = fight.left, fight.right
+        self.inventory.players = fight.left
+        self.original_message = await self.channel.send(embed=self.get_embed(),
+                                                         components=self.get_component(True, True, True))
+        await self.run_fight(fight)
 
-        fight = rpg.Fight(self.party_one, self.party_two)
+    async def run_fight(self, fight: rpg.Fight):
+        if self.checkpoint is not None:
+            fight.listeners.append(self.checkpoint)
         fight_ui = FightUI(self.channel, fight)
         combat_log = CombatLog(self.channel)
+        renderer = RenderScheduler()
         left_component = None
         right_component = None
-        await fight_ui.send()
-        await combat_log.send()
+        await asyncio.gather(fight_ui.send(), combat_log.send())
 
-        while current := fight.next_turn():
+        while True:
+            with metrics.timed('fight.next_turn'):
+                current = fight.next_turn()
+            if current is None:
+                break
             while not fight.effect_queue.empty():
                 combat_log.add_log(fight.effect_queue.get_nowait())
 
-            await fight_ui.update()
-            await combat_log.update()
+            await fight_ui.update(renderer)
+            await combat_log.update(renderer)
 
             is_left = current in fight.left
             if not is_left and current in fight.right and left_component:
-                await left_component.edit(embed=discord.Embed(title='Currently the opponent\'s turn'),
-                                          components=[[Button(style=ButtonStyle.gray, disabled=True,
-                                                              label='Waiting')]])
+                renderer.schedule(left_component, embed=discord.Embed(title='Currently the opponent\'s turn'),
+                                  components=[[Button(style=ButtonStyle.gray, disabled=True,
+                                                      label='Waiting')]])
             elif is_left and current in fight.left and right_component:
-                await right_component.edit(embed=discord.Embed(title='Currently the opponent\'s turn'),
-                                           components=[[Button(style=ButtonStyle.gray, disabled=True,
-                                                               label='Waiting')]])
+                renderer.schedule(right_component, embed=discord.Embed(title='Currently the opponent\'s turn'),
+                                  components=[[Button(style=ButtonStyle.gray, disabled=True,
+                                                      label='Waiting')]])
+            await renderer.flush()
+
+            policy = self.policies.get(current.name)
+            if policy is not None:
+                # searching can take a while, keep the event loop responsive
+                with metrics.timed('bot.policy'):
+                    decision = await asyncio.get_running_loop().run_in_executor(None, policy, fight, current,
+                                                                                self.rng)
+                if decision is not None:
+                    with metrics.timed('fight.turn_action'):
+                        text = fight.turn_action(*decision)
+                    combat_log.add_log(text)
+                else:
+                    fight.pass_turn()
+                    combat_log.add_log(f'{current.name} waits')
+                continue
+
             channel = self.channel if is_left else self.right_channel
             component = left_component if is_left else right_component
 
-            s = SkillSelect(self.client, channel, current.skills, current.name)
-            t = TargetSelect(self.client, channel, fight)
+            s = SkillSelect(self.client, channel, current.skills, current.name, self.callbacks.child())
 
             await s.start(component)
             await s.exited
@@ -249,24 +308,33 @@ class Fight:
                 left_component = component
             else:
                 right_component = component
-            await t.start(component)
-            await t.exited
-
-            combat_log.add_log(fight.turn_action(s.options[s.index], fight.lookup[t.index].name))
-        if left_component:
-            await left_component.delete()
-        if right_component:
-            await right_component.delete()
-        await fight_ui.remove()
-        await combat_log.remove()
+
+            skill = current.get_skill(s.options[s.index])
+            t = TargetSelect(self.client, channel, fight, self.callbacks.child(), skill, current)
+            # area skills that hit a fixed group (all enemies, all allies, self) need no target
+            if skill.targeting == 'single' or len(t.groups) > 1:
+                await t.start(component)
+                await t.exited
+            else:
+                # never started, so its exited future won't clear the registry
+                t.callbacks.clear()
+
+            with metrics.timed('fight.turn_action'):
+                text = fight.turn_action(skill.name, t.targets)
+            combat_log.add_log(text)
+        await asyncio.gather(*(component.delete() for component in (left_component, right_component) if component),
+                             fight_ui.remove(), combat_log.remove())
+        if self.checkpoint is not None:
+            fight.listeners.remove(self.checkpoint)
+            self.checkpoint.clear()
         if fight.winner() == 'right':
-            await inter.message.delete()
+            await self.original_message.delete()
 
             if self.exited.done():
                 self.exited = self.get_new_future()
             self.exited.set_result(True)
         else:
-            await inter.message.edit(components=self.get_component())
+            await self.original_message.edit(components=self.get_component())
 
     async def update(self):
         await self.original_message.edit(embed=self.get_embed())
@@ -275,7 +343,6 @@ class Fight:
         # noinspection PyArgumentList
         self.original_message = await self.channel.send(embed=self.get_embed(),
                                                         components=self.get_component())
-        await self.client.bot.wait_for('button_click', check=lambda inter: inter.custom_id == 'sub_continue')
 
 
 class Inventory(Selectable):
@@ -283,32 +350,35 @@ class Inventory(Selectable):
                  client: DiscordComponents,
                  channel: Messageable,
                  players: List[rpg.Character],
-                 update_fn: Callable):
+                 update_fn: Callable,
+                 callbacks: Optional[CallbackRegistry] = None):
         super().__init__(client, channel, [player.name for player in players],
                          'Whose inventory do you want to view?',
-                         select_button=Button(label='View', custom_id='view'),
-                         extra_components=[client.add_callback(Button(style=ButtonStyle.red, label='Back'),
-                                                               self.on_exit)])
+                         select_button=Button(label='View'),
+                         extra_components=[(Button(style=ButtonStyle.red, label='Back'), self.on_exit)],
+                         callbacks=callbacks)
         self.client = client
         self.channel = channel
         self.players = players
         self.last_chosen = 'weapons'
         self.update_fn = update_fn
-        self.exited: Future[bool] = self.client.bot.loop.create_future()
+        self.exited: Future[bool] = self.callbacks.future()
 
     async def select_callback(self, inter: Interaction):
-        if inter.custom_id not in {'weapons', 'armors', 'consumables'}:
-            inter.custom_id = 'weapons'
-        prop = inter.custom_id
-        self.last_chosen = inter.custom_id
+        prop = key_of(inter.custom_id)
+        if prop not in {'weapons', 'armors', 'consumables'}:
+            prop = 'weapons'
+        self.last_chosen = prop
         player = self.players[self.index]
+        items = getattr(player, prop)
         embed = discord.Embed(title=f'{player.name}\'s inventory',
                               description='\n\n'.join(
-                                  f'{item.name}{" *(Equipped)*" if item.equipped else ""}\n*{item.flavor_text}*' for
+                                  f'{item.name}{f" x{items.count(item)}" if items.count(item) > 1 else ""}'
+                                  f'{" *(Equipped)*" if item.equipped else ""}\n*{item.flavor_text}*' for
                                   item
-                                  in getattr(player, prop)))
+                                  in items))
         styles = [ButtonStyle.green] * 3
-        styles[{'weapons': 0, 'armors': 1, 'consumables': 2}[inter.custom_id]] = ButtonStyle.gray
+        styles[{'weapons': 0, 'armors': 1, 'consumables': 2}[prop]] = ButtonStyle.gray
         await inter.edit_origin(embed=embed,
                                 components=self.get_inventory_components(style_iter=iter(styles)))
 
@@ -327,34 +397,37 @@ class Inventory(Selectable):
 
         class InventoryEquip(Selectable):
             def __init__(self, inv: Inventory):
+                callbacks = inv.callbacks.child()
                 super().__init__(inv.client, inv.channel,
                                  getattr(inv.players[inv.index], inv.last_chosen),
                                  select_title=f'{inv.players[inv.index].name}\'s {inv.last_chosen}',
-                                 select_button=Button(label='Equip', custom_id='equip',
+                                 select_button=Button(label='Equip', custom_id=callbacks.custom_id('equip'),
                                                       style=ButtonStyle.blue),
                                  extra_components=[
-                                     inv.client.add_callback(Button(label='Unequip', custom_id='unequip',
-                                                                    style=ButtonStyle.blue),
-                                                             self.select_callback),
-                                     inv.client.add_callback(Button(label='Back', style=ButtonStyle.red),
-                                                             inv.select_callback)])
+                                     (Button(label='Unequip', custom_id=callbacks.custom_id('unequip'),
+                                             style=ButtonStyle.blue),
+                                      self.select_callback),
+                                     (Button(label='Back', style=ButtonStyle.red,
+                                             custom_id=callbacks.custom_id('back')),
+                                      self.back_callback)],
+                                 callbacks=callbacks)
                 self.last_option = 0
                 self.inv = inv
                 self.player = self.inv.players[self.inv.index]
                 self.target_inv = getattr(inv.players[inv.index], inv.last_chosen)
 
-            def get_embed(self):
-                desc = ''
-                for i, option in enumerate(self.options):
-                    if i == self.index:
-                        desc += '▶️   '
-                    desc += f'{option.name}{" *(Equipped)*" if option.equipped else ""}\n'
+            def render_state(self):
+                return self.player.stats_version, len(self.options)
+
+            def render_option(self, option: rpg.Item) -> str:
+                return f'{option.name}{" *(Equipped)*" if option.equipped else ""}'
 
-                return discord.Embed(title=self.select_title,
-                                     description=desc)
+            async def back_callback(self, _inter: Interaction):
+                self.callbacks.clear()
+                await self.inv.select_callback(_inter)
 
             async def select_callback(self, _inter: Interaction):
-                if _inter.custom_id == 'equip':
+                if key_of(_inter.custom_id) == 'equip':
                     if self.inv.last_chosen == 'weapons':
                         self.player.equip_weapon(self.options[self.index])
                     else:
@@ -363,7 +436,7 @@ class Inventory(Selectable):
                     if self.inv.last_chosen == 'weapons':
                         self.player.unequip_weapon()
                     else:
-                        self.player.unequip_armor(self.options[self.index])
+                        self.player.unequip_armor(self.options[self.index].piece_type)
 
                 await self.inv.update_fn()
                 await _inter.edit_origin(embed=self.get_embed(), components=self.get_components())
@@ -371,26 +444,28 @@ class Inventory(Selectable):
         await InventoryEquip(self).start(inter)
 
     def get_inventory_components(self, *, style_iter: Iterator[ButtonStyle] = iter(())):
+        custom_id = self.callbacks.custom_id
         return [
             [
-                self.client.add_callback(
-                    Button(style=next(style_iter, ButtonStyle.green), label='Weapons', custom_id='weapons'),
+                self.callbacks.add(
+                    Button(style=next(style_iter, ButtonStyle.green), label='Weapons', custom_id=custom_id('weapons')),
                     self.select_callback,
                 ),
-                self.client.add_callback(
-                    Button(style=next(style_iter, ButtonStyle.green), label='Armor', custom_id='armors'),
+                self.callbacks.add(
+                    Button(style=next(style_iter, ButtonStyle.green), label='Armor', custom_id=custom_id('armors')),
                     self.select_callback,
                 ),
-                self.client.add_callback(
-                    Button(style=next(style_iter, ButtonStyle.green), label='Consumables', custom_id='consumables'),
+                self.callbacks.add(
+                    Button(style=next(style_iter, ButtonStyle.green), label='Consumables',
+                           custom_id=custom_id('consumables')),
                     self.select_callback,
                 ),
-                self.client.add_callback(
-                    Button(style=ButtonStyle.blue, label='Equip', custom_id='equip'),
+                self.callbacks.add(
+                    Button(style=ButtonStyle.blue, label='Equip', custom_id=custom_id('equip')),
                     self.equip_callback,
                 ),
-                self.client.add_callback(
-                    Button(style=ButtonStyle.red, label='Back'),
+                self.callbacks.add(
+                    Button(style=ButtonStyle.red, label='Back', custom_id=custom_id('back')),
                     self.view_selection,
                 )
             ]
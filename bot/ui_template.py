@@ -1,8 +1,11 @@
 from __future__ import annotations
 
 from abc import ABCMeta, abstractmethod
-from typing import List, Optional, Any, Union, Tuple, TYPE_CHECKING
-from itertools import zip_longest
+from bisect import bisect_left
+import gzip
+from collections import deque
+from typing import List, Optional, Any, Union, Tuple, Callable, Deque, Dict, Iterator, Sequence, TYPE_CHECKING
+from itertools import zip_longest, islice
 from asyncio.futures import Future
 
 from discord.abc import Messageable
@@ -14,17 +17,41 @@ from discord_components import (
     Interaction,
     Component,
     ComponentMessage,
+    Select,
+    SelectOption,
 )
 
 from .util import remove_callback, respond_callback
-from rpg import Weapon, Armor, Consumable, Character
+from .callbacks import CallbackRegistry, key_of
+from .render import RenderScheduler
+from rpg import Character, buy_item
 
 if TYPE_CHECKING:
     from rpg import Skill, Fight, Item
 
 
+# Case-insensitive prefix lookup over option labels: labels are kept sorted so that all labels sharing
+# a prefix form one contiguous run found with two bisections.
+class PrefixIndex:
+    def __init__(self, labels: List[str]):
+        self.keys = sorted((label.casefold(), i) for i, label in enumerate(labels))
+        self.labels = [key for key, _ in self.keys]
+
+    def find(self, prefix: str) -> List[int]:
+        prefix = prefix.casefold()
+        lo = bisect_left(self.labels, prefix)
+        hi = bisect_left(self.labels, prefix + '\U0010FFFF', lo)
+        return sorted(i for _, i in self.keys[lo:hi])
+
+    def initials(self) -> List[str]:
+        return sorted({label[:1] for label in self.labels if label})
+
+
 # noinspection PyArgumentList
 class Selectable(metaclass=ABCMeta):
+    # at most this many options are rendered at once, the window follows the cursor
+    page_size = 15
+
     def __init__(self,
                  client: DiscordComponents,
                  channel: Optional[Messageable],
@@ -33,47 +60,156 @@ class Selectable(metaclass=ABCMeta):
                  up_button: Optional[Button] = None,
                  down_button: Optional[Button] = None,
                  select_button: Optional[Button] = None,
-                 extra_components: List[Component] = None,
-                 color: Optional[int] = 0):
+                 extra_components: List[Union[Component, Tuple[Component, Callable]]] = None,
+                 color: Optional[int] = 0,
+                 callbacks: Optional[CallbackRegistry] = None,
+                 page_size: Optional[int] = None,
+                 type_ahead: bool = True):
         self.client = client
         self.channel = channel
+        self.callbacks = callbacks or CallbackRegistry(client)
+        if page_size:
+            self.page_size = page_size
+        self.type_ahead = type_ahead
+        # rendered option lines and embeds, keyed by (index, prefix, render_state())
+        self.lines: Dict[int, str] = {}
+        self.embeds: Dict[Tuple[int, str, Any], Embed] = {}
+        self.rendered_state: Any = None
+        self._prefix_index: Optional[PrefixIndex] = None
+        self.prefix = ''
+        # indices of the options shown, narrowed by the type-ahead filter; `cursor` is a position in it
+        self.view: Sequence[int] = range(0)
+        self.cursor = 0
         self.options = options
         self.select_title = select_title
-        self.up_button = up_button or Button(style=ButtonStyle.blue, emoji='🔼')
-        self.down_button = down_button or Button(style=ButtonStyle.blue, emoji='🔽')
-        self.select_button = select_button or Button(style=ButtonStyle.blue, label='Select')
+        self.up_button = up_button or Button(style=ButtonStyle.blue, emoji='🔼',
+                                             custom_id=self.callbacks.custom_id('up'))
+        self.down_button = down_button or Button(style=ButtonStyle.blue, emoji='🔽',
+                                                 custom_id=self.callbacks.custom_id('down'))
+        self.select_button = select_button or Button(style=ButtonStyle.blue, label='Select',
+                                                     custom_id=self.callbacks.custom_id('select'))
+        # either plain components or (component, callback) pairs registered on every render
         self.extra_components = extra_components or []
-        self.index = 0
         self._component: Optional[ComponentMessage] = None
         self.color = color
 
+    @property
+    def options(self) -> List[Any]:
+        return self._options
+
+    @options.setter
+    def options(self, options: List[Any]):
+        self._options = options
+        self._prefix_index = None
+        self.invalidate()
+        self.set_prefix(self.prefix)
+
+    @property
+    def index(self) -> int:
+        return self.view[self.cursor] if self.view else 0
+
+    @index.setter
+    def index(self, index: int):
+        if self.prefix:
+            self.set_prefix('')
+        self.cursor = index
+
+    @property
+    def prefix_index(self) -> PrefixIndex:
+        if self._prefix_index is None:
+            self._prefix_index = PrefixIndex([self.render_option(option) for option in self.options])
+        return self._prefix_index
+
+    def set_prefix(self, prefix: str):
+        self.prefix = prefix
+        self.view = self.prefix_index.find(prefix) if prefix else range(len(self.options))
+        self.cursor = 0
+
+    @property
+    def windowed(self) -> bool:
+        return len(self.options) > self.page_size
+
+    # re-reads the options after they changed in place, keeping the cursor where it was if possible
+    def refresh(self):
+        cursor = self.cursor
+        self._prefix_index = None
+        self.invalidate()
+        self.set_prefix(self.prefix)
+        self.cursor = min(cursor, max(len(self.view) - 1, 0))
+
+    def invalidate(self):
+        self.lines.clear()
+        self.embeds.clear()
+
+    # Views whose option text depends on outside state return something that changes with it
+    def render_state(self) -> Any:
+        return None
+
+    def render_option(self, option: Any) -> str:
+        return f'{option}'
+
+    def line(self, index: int) -> str:
+        if index not in self.lines:
+            self.lines[index] = self.render_option(self.options[index])
+        return self.lines[index]
+
     def get_components(self):
-        return [
+        rows = [
             [
-                self.client.add_callback(
+                self.callbacks.add(
                     self.up_button,
                     self.button_up_callback,
                 ),
-                self.client.add_callback(
+                self.callbacks.add(
                     self.down_button,
                     self.button_down_callback,
                 ),
-                self.client.add_callback(
+                self.callbacks.add(
                     self.select_button,
                     self.select_callback,
                 ),
-            ] + self.extra_components
+            ] + [self.callbacks.add(*extra) if isinstance(extra, tuple) else extra
+                 for extra in self.extra_components]
         ]
+        if self.windowed:
+            custom_id = self.callbacks.custom_id
+            rows.append([
+                self.callbacks.add(Button(style=ButtonStyle.gray, emoji='⏪', custom_id=custom_id('page_up')),
+                                   self.page_up_callback),
+                self.callbacks.add(Button(style=ButtonStyle.gray, emoji='⏩', custom_id=custom_id('page_down')),
+                                   self.page_down_callback),
+            ])
+            if self.type_ahead:
+                # a select menu holds at most 25 options, "All" clears the filter
+                initials = self.prefix_index.initials()[:24]
+                rows.append([self.callbacks.add(
+                    Select(placeholder=f'Starts with: {self.prefix.upper()}' if self.prefix else 'Jump to letter',
+                           options=[SelectOption(label='All', value='')] +
+                                   [SelectOption(label=initial.upper(), value=initial) for initial in initials],
+                           custom_id=custom_id('filter')),
+                    self.filter_callback,
+                )])
+        return rows
 
     def get_embed(self):
-        desc = ''
-        for i, option in enumerate(self.options):
-            if i == self.index:
-                desc += '▶️   '
-            desc += f'{option}\n'
-
-        return Embed(title=self.select_title,
-                     description=desc, color=self.color)
+        state = self.render_state()
+        if state != self.rendered_state:
+            self.rendered_state = state
+            self.refresh()
+        key = (self.index, self.prefix, state)
+        if key not in self.embeds:
+            start = self.cursor - self.cursor % self.page_size
+            window = self.view[start:start + self.page_size]
+            lines = [self.line(i) for i in window]
+            at = self.cursor - start
+            desc = '\n'.join(lines[:at] + [f'▶️   {lines[at]}'] + lines[at + 1:]) if lines else ''
+            embed = Embed(title=self.select_title, description=desc[:4096], color=self.color)
+            if len(self.view) > self.page_size or self.prefix:
+                pages = -(-len(self.view) // self.page_size)
+                embed.set_footer(text=f'Page {start // self.page_size + 1}/{max(pages, 1)}'
+                                      f'{f" · starting with {self.prefix.upper()}" if self.prefix else ""}')
+            self.embeds[key] = embed
+        return self.embeds[key]
 
     async def start(self, inter_or_comp: Optional[Union[ComponentMessage, Interaction]] = None):
         if isinstance(inter_or_comp, Interaction):
@@ -89,11 +225,25 @@ class Selectable(metaclass=ABCMeta):
                                                       components=self.get_components())
 
     async def button_up_callback(self, inter: Interaction):
-        self.index = (self.index - 1) % len(self.options)
+        if self.view:
+            self.cursor = (self.cursor - 1) % len(self.view)
         await self.button_callback(inter)
 
     async def button_down_callback(self, inter: Interaction):
-        self.index = (self.index + 1) % len(self.options)
+        if self.view:
+            self.cursor = (self.cursor + 1) % len(self.view)
+        await self.button_callback(inter)
+
+    async def page_up_callback(self, inter: Interaction):
+        self.cursor = max(self.cursor - self.page_size, 0)
+        await self.button_callback(inter)
+
+    async def page_down_callback(self, inter: Interaction):
+        self.cursor = max(min(self.cursor + self.page_size, len(self.view) - 1), 0)
+        await self.button_callback(inter)
+
+    async def filter_callback(self, inter: Interaction):
+        self.set_prefix(inter.values[0] if inter.values else '')
         await self.button_callback(inter)
 
     @abstractmethod
@@ -111,14 +261,14 @@ class Selectable(metaclass=ABCMeta):
 
 class SkillSelect(Selectable):
     def __init__(self, client: DiscordComponents, channel: Messageable, skills: List[Skill],
-                 player_name: str):
+                 player_name: str, callbacks: Optional[CallbackRegistry] = None):
         super().__init__(client, channel, [skill.name for skill in skills],
                          f'{player_name}\'s turn, select your skill!',
-                         color=0xBC544B)
+                         color=0xBC544B, callbacks=callbacks)
         self.exited: Future[bool] = self.create_future()
 
     def create_future(self):
-        return self.client.bot.loop.create_future()
+        return self.callbacks.future()
 
     async def select_callback(self, inter: Interaction):
         await respond_callback(inter)
@@ -128,14 +278,27 @@ class SkillSelect(Selectable):
         self.exited.set_result(True)
 
 
+# Offers the fight's target groups for `skill`: every character for single-target skills (or when no
+# skill is given), one option per row or a single "all" option for area skills
 class TargetSelect(Selectable):
-    def __init__(self, client: DiscordComponents, channel: Messageable, _fight: Fight):
-        super().__init__(client, channel, [c.name for c in _fight.lookup], 'Select your target',
-                         color=0xFFC9AD)
+    def __init__(self, client: DiscordComponents, channel: Messageable, _fight: Fight,
+                 callbacks: Optional[CallbackRegistry] = None, skill: Optional[Skill] = None,
+                 user: Optional[Character] = None):
+        self.groups: List[Tuple[str, List[Character]]] = (
+            _fight.target_groups(skill, user) if skill is not None else [(c.name, [c]) for c in _fight.lookup])
+        super().__init__(client, channel, [label for label, _ in self.groups], 'Select your target',
+                         color=0xFFC9AD, callbacks=callbacks)
         self.exited: Future[bool] = self.create_future()
 
+    # names of the characters in the selected group, or None if there is nothing to choose from
+    @property
+    def targets(self) -> Optional[List[str]]:
+        if not self.groups:
+            return None
+        return [character.name for character in self.groups[self.index][1]]
+
     def create_future(self):
-        return self.client.bot.loop.create_future()
+        return self.callbacks.future()
 
     async def select_callback(self, inter: Interaction):
         await respond_callback(inter)
@@ -145,94 +308,167 @@ class TargetSelect(Selectable):
         self.exited.set_result(True)
 
 
+# The layout (which characters share a line, where "VS" goes) is fixed when the fight starts. Each
+# character's segment (name, health bar, effect lines) is cached until its hp or effects change, and
+# the message is only edited when the rendered text differs from what was last sent.
 class FightUI:
     def __init__(self, channel: Messageable, fight: Fight):
         self.channel = channel
         self.fight = fight
         self.message: Optional[Message] = None
+        self.pairs: List[Tuple[Optional[Character], Optional[Character]]] = list(
+            zip_longest(fight.left, fight.right, fillvalue=None))
+        self.segments: Dict[int, Tuple[Any, Tuple[str, str, List[str]]]] = {}
+        self.text: Optional[str] = None
+
+    @staticmethod
+    def segment_key(character: Character):
+        return (character.effective_stats.hp, character.stats_version,
+                character.effects.version, character.effects.tick)
+
+    def segment(self, character: Optional[Character]) -> Tuple[str, str, List[str]]:
+        if character is None:
+            return '', '', []
+        key = self.segment_key(character)
+        cached = self.segments.get(id(character))
+        if cached is None or cached[0] != key:
+            effects = [f'{effect.name} ({effect.duration} Turns)' for effect in character.effects]
+            cached = self.segments[id(character)] = (key, (character.name, self.get_health_bar(character), effects))
+        return cached[1]
 
     def get_ui_text(self):
-        buf = '```swift\n'
-        t = iter((f'{"VS"}',))
-        for lc, rc in zip_longest(self.fight.left, self.fight.right, fillvalue=Character('')):
-            buf += f'{lc.name:<12}{next(t, ""):^18}{rc.name}\n' \
-                   f'{self.get_health_bar(lc) if lc.name else "": <16}' \
-                   f'{self.get_health_bar(rc) if rc.name else "": >26}\n' \
-                   f'{"Effects" if lc.name else "":<10} {"Effects" if rc.name else "":>26}'
-            for l_effect, r_effect in zip_longest(lc.effects, rc.effects, fillvalue=None):
-                buf += '\n'
-                l_effect_str = f'{l_effect.name} ({l_effect.duration} Turns)' if l_effect else ''
-                r_effect_str = f'{r_effect.name} ({r_effect.duration} Turns)' if r_effect else ''
-                buf += f'{l_effect_str:<30}{r_effect_str}'
-            buf += '\n\n'
-        buf += '```'
-        return buf
+        parts = ['```swift\n']
+        for row, (lc, rc) in enumerate(self.pairs):
+            (l_name, l_bar, l_effects), (r_name, r_bar, r_effects) = self.segment(lc), self.segment(rc)
+            parts.append(f'{l_name:<12}{"VS" if row == 0 else "":^18}{r_name}\n'
+                         f'{l_bar: <16}{r_bar: >26}\n'
+                         f'{"Effects" if lc else "":<10} {"Effects" if rc else "":>26}')
+            for l_effect, r_effect in zip_longest(l_effects, r_effects, fillvalue=''):
+                parts.append(f'\n{l_effect:<30}{r_effect}')
+            parts.append('\n\n')
+        parts.append('```')
+        return ''.join(parts)
 
     async def send(self):
-        for character in self.fight.lookup:
-            character.update_effective_stats()
-
-        self.message = await self.channel.send(content=self.get_ui_text())
-
-    async def update(self):
-        await self.message.edit(content=self.get_ui_text())
+        self.text = self.get_ui_text()
+        self.message = await self.channel.send(content=self.text)
+
+    async def update(self, renderer: Optional[RenderScheduler] = None):
+        text = self.get_ui_text()
+        if text == self.text:
+            return
+        self.text = text
+        if renderer:
+            renderer.schedule(self.message, content=text)
+        else:
+            await self.message.edit(content=text)
 
     async def remove(self):
         await self.message.delete()
         self.message = None
+        self.text = None
 
     @staticmethod
     def get_health_bar(character: Character):
-        return "[" + "#" * int(character.effective_stats.hp / character.stats.hp * 10) + \
-               "-" * (10 - int(character.effective_stats.hp / character.stats.hp * 10)) + "]"
+        filled = int(character.effective_stats.hp / character.stats.hp * 10)
+        return f'[{"#" * filled}{"-" * (10 - filled)}]'
 
 
+# Keeps the newest `capacity` lines in a ring buffer along with their total length, lines pushed out
+# of the buffer are appended to `spill_path` (gzip, one line per entry) when it is set.
 class CombatLog:
-    def __init__(self, channel: Messageable):
-        self.logs: List[str] = []
+    limit = 4096
+
+    def __init__(self, channel: Messageable, capacity: int = 1000, spill_path: Optional[str] = None):
+        self.logs: Deque[str] = deque()
+        self.size = 0
+        self.capacity = capacity
+        self.spill_path = spill_path
+        self.spilled: List[str] = []
+        self.page = 0
         self.channel = channel
         self.message: Optional[Message] = None
 
-    def get_embed(self) -> Embed:
+    # newest lines first, grouped into pages that fit the embed description limit
+    def iter_pages(self) -> Iterator[List[str]]:
+        page, size = [], -1
+        for line in reversed(self.logs):
+            line = line[:self.limit]
+            if size + len(line) + 1 > self.limit:
+                yield page[::-1]
+                page, size = [], -1
+            page.append(line)
+            size += len(line) + 1
+        if page:
+            yield page[::-1]
+
+    def page_count(self) -> int:
+        return sum(1 for _ in self.iter_pages())
+
+    def get_embed(self, page: Optional[int] = None) -> Embed:
+        page = self.page if page is None else page
         embed = Embed(title='Combat Log', color=0x63C5DA)
-        embed.description = '\n'.join(self.logs)
-        if len(embed.description) >= 4096:
-            self.logs = ['---------- Truncated ----------']
+        if page == 0 and self.size <= self.limit + 1:
             embed.description = '\n'.join(self.logs)
+        else:
+            embed.description = '\n'.join(next(islice(self.iter_pages(), page, None), []))
+        if page:
+            embed.set_footer(text=f'{page} page(s) back')
         return embed
 
     async def send(self):
         self.message = await self.channel.send(embed=self.get_embed())
 
-    async def update(self):
-        await self.message.edit(embed=self.get_embed())
+    async def update(self, renderer: Optional[RenderScheduler] = None):
+        if renderer:
+            renderer.schedule(self.message, embed=self.get_embed())
+        else:
+            await self.message.edit(embed=self.get_embed())
 
     def clear_log(self):
         self.logs.clear()
+        self.size = 0
+        self.page = 0
 
     def add_log(self, message: str):
         self.logs.append(message)
+        self.size += len(message) + 1
+        if len(self.logs) > self.capacity:
+            line = self.logs.popleft()
+            self.size -= len(line) + 1
+            if self.spill_path:
+                self.spilled.append(line)
+                if len(self.spilled) >= 64:
+                    self.flush_spill()
+
+    def flush_spill(self):
+        if self.spill_path and self.spilled:
+            with gzip.open(self.spill_path, 'at', encoding='utf-8') as f:
+                f.writelines(line.replace('\n', '\\n') + '\n' for line in self.spilled)
+        self.spilled.clear()
 
     async def remove(self):
+        self.flush_spill()
         await self.message.delete()
 
 
 class Shop(Selectable):
     def __init__(self, client: DiscordComponents, channel: Messageable,
                  catalogue: List[Tuple[Item, int]], players: List[Character],
-                 balance: int):
+                 balance: int, callbacks: Optional[CallbackRegistry] = None):
         super().__init__(client, channel, [x[0].name for x in catalogue],
-                         'Shop Selection')
+                         'Shop Selection', callbacks=callbacks)
         self.catalogue = catalogue
         self.extra_components = self.get_extra_components()
         self.players = players
         self.balance = balance
-        self.exited: Future[bool] = self.client.bot.loop.create_future()
+        self.exited: Future[bool] = self.callbacks.future()
 
     def get_extra_components(self, disabled: bool = False):
         return [
-            self.client.add_callback(
-                Button(label='Exit', style=ButtonStyle.red, disabled=disabled),
+            (
+                Button(label='Exit', style=ButtonStyle.red, disabled=disabled,
+                       custom_id=self.callbacks.custom_id('exit')),
                 self.on_exit,
             )
         ]
@@ -243,52 +479,44 @@ class Shop(Selectable):
 
     async def select_callback(self, inter: Interaction):
         await inter.edit_origin(components=self.get_components())
-        sd = ShopDesc(self.client, self.catalogue[self.index], [player.name for player in self.players], self.balance)
+        sd = ShopDesc(self.client, self.catalogue[self.index], [player.name for player in self.players], self.balance,
+                      self.callbacks.child())
         await sd.start(inter)
         choice = await sd.promise
 
         if choice != -1:
             item, price = self.catalogue[self.index]
-            player = self.players[choice]
-            if self.balance >= price:
-                if isinstance(item, Weapon):
-                    if item.name not in (weapon.name for weapon in player.weapons):
-                        player.weapons.append(item)
-                        self.balance -= price
-                elif isinstance(item, Armor):
-                    if item.name not in (armor.name for armor in player.armors):
-                        self.balance -= price
-                        player.armors.append(item)
-                elif isinstance(item, Consumable):
-                    player.consumables.append(item)
-                    self.balance -= price
+            self.balance = buy_item(item, price, self.players[choice], self.balance)
 
         await inter.message.edit(embed=self.get_embed(), components=self.get_components())
 
 
 class ShopDesc:
     def __init__(self, client: DiscordComponents, catalogue_info: Tuple[Item, int], players: List[str],
-                 balance: int):
+                 balance: int, callbacks: Optional[CallbackRegistry] = None):
         self.client = client
+        self.callbacks = callbacks or CallbackRegistry(client)
         self.catalogue_info = catalogue_info
         self.players = players
         self.balance = balance
-        self.promise: Future[int] = self.client.bot.loop.create_future()
+        self.promise: Future[int] = self.callbacks.future()
 
     def get_components(self):
         return [
             [
-                self.client.add_callback(
+                self.callbacks.add(
                     Button(
                         label='Buy',
                         style=ButtonStyle.green,
+                        custom_id=self.callbacks.custom_id('buy'),
                     ),
                     self.buy,
                 ),
-                self.client.add_callback(
+                self.callbacks.add(
                     Button(
                         label='Back',
                         style=ButtonStyle.red,
+                        custom_id=self.callbacks.custom_id('back'),
                     ),
                     self.done,
                 )
@@ -306,7 +534,7 @@ class ShopDesc:
         return embed
 
     async def buy(self, inter: Interaction):
-        player_select = SimpleSelect(self.client, None, self.players, 'Selection')
+        player_select = SimpleSelect(self.client, None, self.players, 'Selection', self.callbacks.child())
         await player_select.start(inter)
         self.promise.set_result(await player_select.selection)
         await respond_callback(inter)
@@ -321,21 +549,21 @@ class ShopDesc:
 
 class SimpleSelect(Selectable):
     def __init__(self, client: DiscordComponents, channel: Optional[Messageable], options: List[str],
-                 title: str):
+                 title: str, callbacks: Optional[CallbackRegistry] = None):
         super().__init__(client, channel, options, title, extra_components=[
-            client.add_callback(
+            (
                 Button(
                     label='Back',
                     style=ButtonStyle.red,
                 ),
                 self.select_callback,
             )
-        ])
-        self.selection: Future[int] = self.client.bot.loop.create_future()
+        ], callbacks=callbacks)
+        self.selection: Future[int] = self.callbacks.future()
 
     async def select_callback(self, inter: Interaction):
         await inter.respond(type=6)
-        if inter.custom_id == 'back':
+        if key_of(inter.custom_id) == 'back':
             self.selection.set_result(self.index)
             await remove_callback(inter)
         self.selection.set_result(self.index)
@@ -1,14 +1,17 @@
-from typing import Protocol, Callable, Optional, Any
+from __future__ import annotations
+
+from typing import Protocol, Callable, Any, TYPE_CHECKING
 
 from discord_components import Interaction
 
+from rpg import metrics
 
-class Startable(Protocol):
-    start: Callable
+if TYPE_CHECKING:
+    from .session import Session
 
 
-class Waitable(Protocol):
-    wait_for: Callable
+class Startable(Protocol):
+    start: Callable
 
 
 async def remove_callback(inter: Interaction):
@@ -19,8 +22,10 @@ async def respond_callback(inter: Interaction, _type: int = 7):
     await inter.respond(type=_type)
 
 
-async def start_wait(bot: Waitable, startable: Startable, event: str = 'button_click',
-                     check: Optional[Callable[[Interaction], Any]] = None,
-                     start_args: Any = ()):
-    await startable.start(*start_args)
-    await bot.wait_for(event=event, check=check or (lambda inter: inter.custom_id == 'continue'))
+async def start_wait(session: Session, startable: Startable, key: str = 'continue',
+                     start_args: Any = ()) -> Interaction:
+    waiter = session.wait(key)
+    with metrics.timed('bot.start'):
+        await startable.start(*start_args)
+    with metrics.timed('bot.wait'):
+        return await waiter
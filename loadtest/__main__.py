@@ -0,0 +1,39 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+
+import bot.bot
+from bot.bot import story
+from bot.saves import SaveStore
+from .driver import run
+from .fake import FakeGateway
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m loadtest',
+                                     description='Play the bot story with synthetic players against a fake gateway')
+    parser.add_argument('--players', type=int, default=100)
+    parser.add_argument('--ramp', type=float, default=.01, help='seconds between session starts')
+    parser.add_argument('--latency', type=float, default=.05, help='simulated Discord round trip, seconds')
+    parser.add_argument('--jitter', type=float, default=.02)
+    parser.add_argument('--rate', type=int, default=5, help='message sends/edits per channel per --per seconds, '
+                                                           '0 to disable rate limiting')
+    parser.add_argument('--per', type=float, default=5.)
+    parser.add_argument('--think', type=float, nargs=2, default=(.2, 1.), metavar=('MIN', 'MAX'),
+                        help='player think time between clicks, seconds')
+    parser.add_argument('--max-clicks', type=int, default=300)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    # synthetic sessions aren't worth resuming, whatever DND_SAVE_DIR says
+    bot.bot.saves = SaveStore(None)
+    gateway = FakeGateway(args.latency, args.jitter, args.rate, args.per, args.seed)
+    report = asyncio.run(run(story, args.players, gateway, ramp=args.ramp, think=tuple(args.think),
+                             max_clicks=args.max_clicks, seed=args.seed))
+    print(json.dumps(report.to_dict(gateway), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+from __future__ import annotations
+
+import asyncio
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from rpg.metrics import Histogram
+from bot.session import Session
+from .fake import FakeGateway, FakeClient, FakeChannel, FakeMessage
+
+# Buttons that move a player forward are clicked more often than the ones that page or go back, so
+# that a random walk through the story still reaches the end.
+WEIGHTS = {'Continue': 6, 'Proceed': 6, 'Select': 4, 'View': 2, 'Equip': 2, 'Buy': 2, 'Exit': 2}
+
+Game = Callable[[Session], Awaitable]
+
+
+class Report:
+    def __init__(self):
+        self.started = 0
+        self.finished = 0
+        self.stuck = 0
+        self.clicks = 0
+        self.elapsed = 0.
+        # click until the first visible change in the player's channel
+        self.response = Histogram()
+        self.lag = Histogram()
+
+    def to_dict(self, gateway: FakeGateway) -> Dict[str, Any]:
+        return {'sessions': {'started': self.started, 'finished': self.finished, 'stuck': self.stuck},
+                'clicks': self.clicks, 'clicks_per_second': self.clicks / self.elapsed if self.elapsed else 0.,
+                'elapsed': self.elapsed, 'response': self.response.to_dict(), 'loop_lag': self.lag.to_dict(),
+                'gateway': dict(gateway.stats),
+                'last_error': repr(gateway.last_error) if gateway.last_error else None}
+
+
+class Player:
+    def __init__(self, client: FakeClient, channel: FakeChannel, session: Session, rng: random.Random,
+                 think: Tuple[float, float] = (.2, 1.), max_clicks: int = 300, idle: float = 30.,
+                 patience: float = 2., unanswered: int = 10):
+        self.client = client
+        self.channel = channel
+        self.session = session
+        self.rng = rng
+        self.think = think
+        self.max_clicks = max_clicks
+        self.idle = idle
+        # how long a click may go without any visible effect (some only acknowledge the interaction)
+        self.patience = patience
+        # this many clicks in a row without any effect and the session counts as stuck
+        self.unanswered = unanswered
+
+    def choose(self) -> Optional[Tuple[FakeMessage, Any]]:
+        choices = [(message, button) for message in self.channel.messages for button in message.buttons()]
+        if not choices:
+            return None
+        weights = [WEIGHTS.get(button.label, 1) for _, button in choices]
+        return self.rng.choices(choices, weights)[0]
+
+    async def changed(self, timeout: float) -> bool:
+        try:
+            await asyncio.wait_for(self.channel.changed.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def run(self, report: Report):
+        clicks = 0
+        silent = 0
+        while not self.session.task.done() and clicks < self.max_clicks:
+            choice = self.choose()
+            if choice is None:
+                self.channel.changed.clear()
+                if not await self.changed(self.idle):
+                    report.stuck += 1
+                    return
+                continue
+
+            await asyncio.sleep(self.rng.uniform(*self.think))
+            if choice[0].deleted:
+                continue
+            self.channel.changed.clear()
+            start = time.perf_counter()
+            self.client.click(*choice)
+            clicks += 1
+            report.clicks += 1
+            if await self.changed(self.patience):
+                report.response.observe(time.perf_counter() - start)
+                silent = 0
+            else:
+                silent += 1
+                if silent >= self.unanswered:
+                    report.stuck += 1
+                    return
+        if self.session.task.done():
+            report.finished += 1
+
+
+async def monitor_lag(report: Report, interval: float = .01):
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        report.lag.observe(max(0., loop.time() - start - interval))
+
+
+# Starts `players` sessions of `game`, `ramp` seconds apart, and lets synthetic players click
+# through them until every session ended, got stuck or used up its clicks.
+async def run(game: Game, players: int, gateway: FakeGateway, *, ramp: float = .01,
+              think: Tuple[float, float] = (.2, 1.), max_clicks: int = 300, seed: int = 0) -> Report:
+    report = Report()
+    client = FakeClient(gateway, asyncio.get_running_loop())
+    rng = random.Random(seed)
+    lag = asyncio.ensure_future(monitor_lag(report))
+    start = time.perf_counter()
+
+    async def play(i: int):
+        await asyncio.sleep(i * ramp)
+        channel = FakeChannel(gateway)
+        session = client.sessions.start(channel, game)
+        report.started += 1
+        player = Player(client, channel, session, random.Random(rng.getrandbits(32)), think, max_clicks)
+        try:
+            await player.run(report)
+        finally:
+            client.sessions.end(session)
+
+    try:
+        await asyncio.gather(*(play(i) for i in range(players)))
+    finally:
+        report.elapsed = time.perf_counter() - start
+        lag.cancel()
+    return report
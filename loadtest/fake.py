@@ -0,0 +1,201 @@
+from __future__ import annotations
+
+import asyncio
+import itertools
+import random
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from discord_components import Interaction, ComponentMessage, Component
+
+from bot.session import SessionManager
+
+# In-process stand-in for the part of Discord the bot talks to. Messages and interactions subclass the
+# discord_components classes so that the views' isinstance checks behave like they do live, but none of
+# their constructors run: there is no connection state behind them.
+
+_ids = itertools.count(1)
+
+
+# Token bucket: `rate` calls per `per` seconds, callers over the limit wait like discord.py does
+class RateLimiter:
+    def __init__(self, rate: int, per: float):
+        self.rate = rate
+        self.per = per
+        self.tokens = float(rate)
+        self.updated = 0.
+
+    async def acquire(self, gateway: FakeGateway):
+        loop = asyncio.get_running_loop()
+        while True:
+            now = loop.time()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate / self.per)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            gateway.stats['rate_limited'] += 1
+            await asyncio.sleep((1 - self.tokens) * self.per / self.rate)
+
+
+class FakeGateway:
+    def __init__(self, latency: float = .05, jitter: float = .02, rate: int = 5, per: float = 5.,
+                 seed: Optional[int] = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate = rate
+        self.per = per
+        self.rng = random.Random(seed)
+        self.stats: Dict[str, int] = {'send': 0, 'edit': 0, 'delete': 0, 'edit_origin': 0, 'respond': 0,
+                                      'click': 0, 'rate_limited': 0, 'errors': 0}
+        self.last_error: Optional[BaseException] = None
+
+    async def round_trip(self, kind: str, channel: Optional[FakeChannel] = None):
+        self.stats[kind] += 1
+        if channel is not None and self.rate:
+            await channel.limiter.acquire(self)
+        await asyncio.sleep(max(0., self.latency + self.rng.uniform(-self.jitter, self.jitter)))
+
+
+class FakeChannel:
+    def __init__(self, gateway: FakeGateway):
+        self.gateway = gateway
+        self.id = next(_ids)
+        self.messages: List[FakeMessage] = []
+        self.limiter = RateLimiter(gateway.rate, gateway.per)
+        # set whenever a message in the channel is sent, edited or deleted
+        self.changed = asyncio.Event()
+
+    def touch(self):
+        self.changed.set()
+
+    async def send(self, content: Optional[str] = None, *, embed=None, components=None, **_) -> FakeMessage:
+        await self.gateway.round_trip('send', self)
+        message = FakeMessage(self, content, embed, components)
+        self.messages.append(message)
+        self.touch()
+        return message
+
+
+# noinspection PyMissingConstructor
+class FakeMessage(ComponentMessage):
+    def __init__(self, channel: FakeChannel, content: Optional[str], embed, components):
+        self.id = next(_ids)
+        self.channel = channel
+        self.content = content
+        self.embeds = [embed] if embed is not None else []
+        self.components = components or []
+        self.deleted = False
+
+    def __repr__(self):
+        return f'<FakeMessage id={self.id} deleted={self.deleted}>'
+
+    def update(self, fields: Dict[str, Any]):
+        if 'content' in fields:
+            self.content = fields['content']
+        if 'embed' in fields:
+            self.embeds = [fields['embed']] if fields['embed'] is not None else []
+        if 'components' in fields:
+            self.components = fields['components'] or []
+        self.channel.touch()
+
+    async def edit(self, **fields):
+        await self.channel.gateway.round_trip('edit', self.channel)
+        if fields.get('delete_after') is not None:
+            return await self.delete()
+        self.update(fields)
+
+    async def delete(self, **_):
+        await self.channel.gateway.round_trip('delete', self.channel)
+        if not self.deleted:
+            self.deleted = True
+            self.channel.messages.remove(self)
+            self.channel.touch()
+
+    def buttons(self) -> List[Component]:
+        return [component for row in self.components for component in (row if isinstance(row, list) else [row])
+                if not getattr(component, 'disabled', False) and hasattr(component, 'label')
+                and not hasattr(component, 'options')]
+
+
+# noinspection PyMissingConstructor
+class FakeInteraction(Interaction):
+    def __init__(self, client: FakeClient, message: FakeMessage, component: Component,
+                 values: Sequence[str] = ()):
+        self.client = client
+        self.message = message
+        self.channel = message.channel
+        self.component = component
+        self.custom_id = component.id
+        self.values = list(values)
+        self.responded = False
+
+    async def respond(self, *, type: int = 4, **fields):
+        await self.message.channel.gateway.round_trip('respond')
+        self.responded = True
+        if type == 4 and fields:
+            await self.channel.send(**fields)
+
+    async def edit_origin(self, **fields):
+        await self.message.channel.gateway.round_trip('edit_origin')
+        self.responded = True
+        if fields.get('delete_after') is not None:
+            if not self.message.deleted:
+                self.message.deleted = True
+                self.channel.messages.remove(self.message)
+                self.channel.touch()
+            return
+        self.message.update(fields)
+
+
+class FakeBot:
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+
+
+# The DiscordComponents surface: component callbacks, button_click events and wait_for
+class FakeClient:
+    def __init__(self, gateway: FakeGateway, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.gateway = gateway
+        self.bot = FakeBot(loop or asyncio.get_event_loop())
+        self.callbacks: Dict[str, Callable] = {}
+        self.sessions = SessionManager(self)
+        self.listeners: List[Tuple[asyncio.Future, Callable[[FakeInteraction], bool]]] = []
+        self.tasks: set = set()
+
+    def add_callback(self, component: Component, callback: Callable) -> Component:
+        self.callbacks[component.id] = callback
+        return component
+
+    def remove_callback(self, component: Component):
+        self.callbacks.pop(component.id, None)
+
+    def callback_done(self, task: asyncio.Task):
+        self.tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            self.gateway.stats['errors'] += 1
+            self.gateway.last_error = task.exception()
+
+    def wait_for(self, event: str, check: Callable[[FakeInteraction], bool] = lambda _: True) -> asyncio.Future:
+        if event != 'button_click':
+            raise ValueError(f'Unsupported event {event}')
+        future = self.bot.loop.create_future()
+        self.listeners.append((future, check))
+        return future
+
+    def click(self, message: FakeMessage, component: Component, values: Sequence[str] = ()) -> FakeInteraction:
+        self.gateway.stats['click'] += 1
+        inter = FakeInteraction(self, message, component, values)
+        callback = self.callbacks.get(component.id)
+        if callback is not None:
+            task = asyncio.ensure_future(callback(inter))
+            self.tasks.add(task)
+            task.add_done_callback(self.callback_done)
+        for listener in self.listeners[:]:
+            future, check = listener
+            if future.done():
+                self.listeners.remove(listener)
+            elif check(inter):
+                self.listeners.remove(listener)
+                future.set_result(inter)
+        self.sessions.dispatch(inter)
+        return inter
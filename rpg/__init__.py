@@ -5,3 +5,5 @@ from .skills import *
 from .effects import *
 from .items import *
 from .util import *
+from .common import *
+from .randomness import *
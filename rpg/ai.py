@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+import random
+import time
+from typing import Dict, List, Optional, Tuple, Literal
+
+from .characters import Character
+from .script import Fight
+from .simulation import Decision, alive, opponents
+
+Action = Tuple[str, Optional[str]]
+
+
+# Single-target skills are tried on every living opponent, area skills once per target group (a row
+# is named by its first member)
+def actions(fight: Fight, character: Character) -> List[Action]:
+    targets = [c.name for c in opponents(fight, character) if alive(c)]
+    moves: List[Action] = []
+    for skill in character.skills:
+        if skill.targeting == 'single':
+            moves.extend((skill.name, target) for target in targets)
+        elif skill.targeting == 'row':
+            moves.extend((skill.name, members[0].name) for _, members in fight.target_groups(skill, character))
+        else:
+            moves.append((skill.name, None))
+    return moves
+
+
+# Remaining hp share of `side` minus that of the other side, +-1000 once a side is wiped out
+def evaluate(fight: Fight, side: str) -> float:
+    if fight.scheduler.finished():
+        # Fight.winner() names the side that got wiped out
+        return -1000. if fight.winner() == side else 1000.
+    score = 0.
+    for character in fight.lookup:
+        share = max(character.effective_stats.hp, 0.) / (character.stats.hp or 1.)
+        score += share if fight.scheduler.side_of(character) == side else -share
+    return score
+
+
+class _Timeout(Exception):
+    pass
+
+
+# Depth-limited search over forked fights. Turns of `character`'s own side maximise the evaluation,
+# opponents either minimise it ("min") or are averaged over as if they played at random ("expect").
+# Depth is deepened one ply at a time until the time budget runs out, the move of the deepest
+# completed search is played. Values are cached per (state, depth) across moves.
+class SearchPolicy:
+    def __init__(self, depth: int = 3, budget: float = 0.25, opponent: Literal['min', 'expect'] = 'expect',
+                 cache_size: int = 100_000):
+        self.depth = depth
+        self.budget = budget
+        self.opponent = opponent
+        self.cache_size = cache_size
+        self.cache: Dict[Tuple, float] = {}
+        self.deadline = 0.
+        self.nodes = 0
+
+    @staticmethod
+    def state_key(fight: Fight) -> Tuple:
+        characters = tuple((c.effective_stats.hp, c.effects.tick,
+                            tuple((effect.name, effect.duration) for effect in c.effects))
+                           for c in fight.lookup)
+        index = {id(character): i for i, character in enumerate(fight.lookup)}
+        heap = tuple(sorted((t, index[id(c)]) for t, _, c in fight.scheduler.heap if alive(c)))
+        return characters, heap
+
+    def __call__(self, fight: Fight, character: Character, rng: random.Random) -> Decision:
+        moves = actions(fight, character)
+        if not moves:
+            return None
+        if len(self.cache) > self.cache_size:
+            self.cache.clear()
+        side = fight.scheduler.side_of(character)
+        self.deadline = time.perf_counter() + self.budget
+        best = rng.choice(moves)
+        for depth in range(1, self.depth + 1):
+            try:
+                scores = [(self.search(self.play(fight, move), depth - 1, side), move) for move in moves]
+            except _Timeout:
+                break
+            top = max(score for score, _ in scores)
+            best = rng.choice([move for score, move in scores if score == top])
+        return best
+
+    @staticmethod
+    def play(fight: Fight, move: Action) -> Fight:
+        clone = fight.fork()
+        clone.turn_action(*move)
+        return clone
+
+    def search(self, fight: Fight, depth: int, side: str) -> float:
+        self.nodes += 1
+        if self.nodes % 64 == 0 and time.perf_counter() > self.deadline:
+            raise _Timeout
+        if depth <= 0 or fight.scheduler.finished():
+            return evaluate(fight, side)
+
+        key = (self.state_key(fight), depth, side)
+        if key in self.cache:
+            return self.cache[key]
+
+        current = fight.next_turn()
+        moves = actions(fight, current) if current else []
+        if current is None:
+            value = evaluate(fight, side)
+        elif not moves:
+            fight.pass_turn()
+            value = self.search(fight, depth - 1, side)
+        else:
+            values = [self.search(self.play(fight, move), depth - 1, side) for move in moves]
+            if fight.scheduler.side_of(current) == side:
+                value = max(values)
+            elif self.opponent == 'min':
+                value = min(values)
+            else:
+                value = sum(values) / len(values)
+        self.cache[key] = value
+        return value
@@ -1,14 +1,14 @@
 from __future__ import annotations
 
-from typing import List, Iterable, TYPE_CHECKING, Optional, Union
-import copy
+from typing import List, Iterable, TYPE_CHECKING, Optional, Union, Dict, Tuple
 
 from .common import Stats
-from .items import Weapon, Armor, Consumable
+from .items import Weapon, Armor, Consumable, Inventory
+from .effects import EffectSet
+from .util import shallow_copy
 
 if TYPE_CHECKING:
     from .skills import Skill
-    from .effects import Effect
 
 hands = Weapon('bare h a n d s', '', Stats())
 nothing = Armor('', '', -1, Stats())
@@ -16,54 +16,121 @@ nothing = Armor('', '', -1, Stats())
 
 class Character:
     def __init__(self, name: str,
-                 weapons: List[Weapon] = (), armors: List[Armor] = (), consumables: List[Consumable] = (),
+                 weapons: Iterable[Weapon] = (), armors: Iterable[Armor] = (), consumables: Iterable[Consumable] = (),
                  stats: Stats = None):
         self.name = name
-        self.weapons = weapons
-        self.consumables = consumables
-        self.armors = armors
-        self.base_stats = stats
+        self.weapons: Inventory[Weapon] = Inventory(weapons)
+        self.consumables: Inventory[Consumable] = Inventory(consumables)
+        self.armors: Inventory[Armor] = Inventory(armors)
+        self.stats_version = 0
+        self._item_stats: Optional[Stats] = None
+        self._stats: Optional[Stats] = None
+        self._base_stats = stats
         self.equipped_weapon: Weapon = hands
         self.equipped_armors: List[Armor] = [nothing, nothing, nothing]
         self.effective_stats: Optional[Stats] = None
-        self.effects: List[Effect] = []
-        self.skills: List[Skill] = []
+        self.effects = EffectSet()
+        self.skills: Tuple[Skill, ...] = ()
+        self.speed = 1.
+        # formation row, 0 is the front; row-targeting skills hit everyone in one row of a side
+        self.row = 0
 
+    # the returned Stats is shared with the cache and must be treated as read-only
     def get_item_stats(self) -> Stats:
-        return self.equipped_weapon.stats + sum((armor.stats for armor in self.equipped_armors), Stats())
+        if self._item_stats is None:
+            stats = self.equipped_weapon.stats.copy()
+            for armor in self.equipped_armors:
+                stats += armor.stats
+            self._item_stats = stats
+        return self._item_stats
 
-    def equip_weapon(self, weapon_name: str):
-        weapon = next((w for w in self.weapons if w.name == weapon_name), None)
+    # must be called after mutating base_stats (or an equipped item's stats) in place
+    def invalidate_stats(self):
+        self._item_stats = None
+        self._stats = None
+        self.stats_version += 1
+
+    def equip_weapon(self, weapon_name: Union[str, Weapon]):
+        weapon = self.weapons.get(weapon_name)
         if weapon:
             self.unequip_weapon()
             weapon.equipped = True
             self.equipped_weapon = weapon
+            self.invalidate_stats()
 
-    def equip_armor(self, armor_name: str):
-        armor = next((a for a in self.armors if a.name == armor_name), None)
+    def equip_armor(self, armor_name: Union[str, Armor]):
+        armor = self.armors.get(armor_name)
         if armor:
             self.unequip_armor(armor.piece_type)
             self.equipped_armors[armor.piece_type] = armor
             armor.equipped = True
+            self.invalidate_stats()
 
     def unequip_weapon(self):
         self.equipped_weapon.equipped = False
         self.equipped_weapon = hands
+        self.invalidate_stats()
 
     def unequip_armor(self, piece_type: int):
         self.equipped_armors[piece_type].equipped = False
         self.equipped_armors[piece_type] = nothing
+        self.invalidate_stats()
+
+    # Copy for branching a fight: effective stats, effects, inventories and equipment are copied, so
+    # equipping, using items or gaining effects on one side doesn't show on the other. Skills (a tuple),
+    # base stats and item Stats are shared, they are only ever replaced.
+    def fork(self) -> Character:
+        clone = shallow_copy(self)
+        clone.effective_stats = self.effective_stats.copy() if self.effective_stats is not None else None
+        clone.effects = self.effects.fork()
+        clone.weapons = self.weapons.copy()
+        clone.armors = self.armors.copy()
+        clone.consumables = self.consumables.copy()
+        # equipped items normally come from the inventories, point at the copies there
+        weapon = self.equipped_weapon
+        if weapon is not hands:
+            clone.equipped_weapon = clone.weapons.items.get(weapon.name) or shallow_copy(weapon)
+        armors = clone.armors.items
+        clone.equipped_armors = [armor if armor is nothing else armors.get(armor.name) or shallow_copy(armor)
+                                 for armor in self.equipped_armors]
+        return clone
 
     def update_effective_stats(self):
-        self.effective_stats = copy.copy(self.stats)
+        self.effective_stats = self.stats.copy()
 
     def get_skill(self, skill_name: str) -> Optional[Skill]:
-        return next((skill for skill in self.skills if skill_name == skill.name), None)
+        return self.skill_index.get(skill_name)
 
     def use_skill(self, skill_name: str, targets: Optional[Union[Character, List[Character]]]):
         skill = self.get_skill(skill_name)
         skill.use(self, targets)
 
+    # a tuple, so the only way to change the skills is assigning them, which keeps skill_index in sync
+    @property
+    def skills(self) -> Tuple[Skill, ...]:
+        return self._skills
+
+    @skills.setter
+    def skills(self, skills: Iterable[Skill]):
+        self._skills = tuple(skills)
+        self.skill_index = {}
+        for skill in self._skills:
+            self.skill_index.setdefault(skill.name, skill)
+
+    @property
+    def base_stats(self) -> Stats:
+        return self._base_stats
+
+    @base_stats.setter
+    def base_stats(self, stats: Stats):
+        self._base_stats = stats
+        self.invalidate_stats()
+
+    # same read-only contract as get_item_stats
     @property
-    def stats(self):
-        return self.base_stats + self.get_item_stats()
+    def stats(self) -> Stats:
+        if self._stats is None:
+            stats = self.get_item_stats().copy()
+            stats += self._base_stats
+            self._stats = stats
+        return self._stats
@@ -1,7 +1,12 @@
 from __future__ import annotations
 
+from array import array
+from typing import Iterable, Iterator, Union
+
 
 class Stats:
+    __slots__ = ('hp', 'defense', 'atk', 'int')
+
     def __init__(self, hp: float = .0,
                  defense: float = .0,
                  atk: float = .0,
@@ -12,14 +17,174 @@ class Stats:
         self.atk = atk
         self.int = intelligence
 
+    def copy(self) -> Stats:
+        return Stats(self.hp, self.defense, self.atk, self.int)
+
+    def __iter__(self) -> Iterator[float]:
+        yield self.hp
+        yield self.defense
+        yield self.atk
+        yield self.int
+
+    def __eq__(self, other):
+        if not isinstance(other, Stats):
+            return NotImplemented
+        return self.hp == other.hp and self.defense == other.defense and \
+            self.atk == other.atk and self.int == other.int
+
+    def __repr__(self):
+        return f'Stats(hp={self.hp}, defense={self.defense}, atk={self.atk}, int={self.int})'
+
     def __add__(self, other: Stats):
+        if not isinstance(other, Stats):
+            return NotImplemented
         return Stats(self.hp + other.hp, self.defense + other.defense,
                      self.atk + other.atk, self.int + other.int)
 
-    def __sub__(self, other):
-        return self + -1 * other
+    # lets sum() start from the implicit 0
+    def __radd__(self, other):
+        if other == 0:
+            return self.copy()
+        return NotImplemented
+
+    def __iadd__(self, other: Stats):
+        if not isinstance(other, Stats):
+            return NotImplemented
+        self.hp += other.hp
+        self.defense += other.defense
+        self.atk += other.atk
+        self.int += other.int
+        return self
+
+    def __sub__(self, other: Stats):
+        if not isinstance(other, Stats):
+            return NotImplemented
+        return Stats(self.hp - other.hp, self.defense - other.defense,
+                     self.atk - other.atk, self.int - other.int)
+
+    def __isub__(self, other: Stats):
+        if not isinstance(other, Stats):
+            return NotImplemented
+        self.hp -= other.hp
+        self.defense -= other.defense
+        self.atk -= other.atk
+        self.int -= other.int
+        return self
 
     def __mul__(self, multiplier: float):
+        if isinstance(multiplier, Stats):
+            return NotImplemented
         return Stats(self.hp * multiplier, self.defense * multiplier,
                      self.atk * multiplier, self.int * multiplier)
 
+    __rmul__ = __mul__
+
+    def __imul__(self, multiplier: float):
+        if isinstance(multiplier, Stats):
+            return NotImplemented
+        self.hp *= multiplier
+        self.defense *= multiplier
+        self.atk *= multiplier
+        self.int *= multiplier
+        return self
+
+    def __neg__(self):
+        return Stats(-self.hp, -self.defense, -self.atk, -self.int)
+
+
+# Stats of N characters packed into a single flat array, four fields per row. This is a compact
+# layout, not SIMD: the arithmetic below still runs one element at a time in the interpreter, it just
+# avoids allocating a Stats object per row.
+class StatsBatch:
+    __slots__ = ('data',)
+    width = 4
+    fields = Stats.__slots__
+
+    def __init__(self, n: int = 0):
+        self.data = array('d', bytes(8 * self.width * n))
+
+    @classmethod
+    def from_stats(cls, stats: Iterable[Stats]) -> StatsBatch:
+        batch = cls()
+        for s in stats:
+            batch.data.extend((s.hp, s.defense, s.atk, s.int))
+        return batch
+
+    def to_stats(self) -> list:
+        data = self.data
+        return [Stats(*data[i:i + 4]) for i in range(0, len(data), 4)]
+
+    def __len__(self):
+        return len(self.data) // self.width
+
+    def __getitem__(self, index: int) -> Stats:
+        if index < 0:
+            index += len(self)
+        return Stats(*self.data[index * 4:index * 4 + 4])
+
+    def __setitem__(self, index: int, stats: Stats):
+        if index < 0:
+            index += len(self)
+        self.data[index * 4:index * 4 + 4] = array('d', (stats.hp, stats.defense, stats.atk, stats.int))
+
+    def column(self, field: str) -> array:
+        return self.data[self.fields.index(field)::4]
+
+    def set_column(self, field: str, values: Iterable[float]):
+        column = array('d', values)
+        if len(column) != len(self):
+            raise ValueError(f'Batch size mismatch ({len(self)} != {len(column)})')
+        self.data[self.fields.index(field)::4] = column
+
+    def copy(self) -> StatsBatch:
+        batch = StatsBatch()
+        batch.data = array('d', self.data)
+        return batch
+
+    def _operand(self, other: Union[StatsBatch, Stats]):
+        if isinstance(other, StatsBatch):
+            if len(other) != len(self):
+                raise ValueError(f'Batch size mismatch ({len(self)} != {len(other)})')
+            return other.data
+        if isinstance(other, Stats):
+            row = tuple(other)
+            return (row[i & 3] for i in range(len(self.data)))
+        return None
+
+    def __iadd__(self, other: Union[StatsBatch, Stats]):
+        operand = self._operand(other)
+        if operand is None:
+            return NotImplemented
+        self.data = array('d', map(float.__add__, self.data, operand))
+        return self
+
+    def __isub__(self, other: Union[StatsBatch, Stats]):
+        operand = self._operand(other)
+        if operand is None:
+            return NotImplemented
+        self.data = array('d', map(float.__sub__, self.data, operand))
+        return self
+
+    def __imul__(self, multiplier: float):
+        if isinstance(multiplier, (Stats, StatsBatch)):
+            return NotImplemented
+        multiplier = float(multiplier)
+        self.data = array('d', (x * multiplier for x in self.data))
+        return self
+
+    def __add__(self, other):
+        return self.copy().__iadd__(other)
+
+    # lets sum() start from the implicit 0, like Stats
+    def __radd__(self, other):
+        if isinstance(other, int) and other == 0:
+            return self.copy()
+        return self.__add__(other)
+
+    def __sub__(self, other):
+        return self.copy().__isub__(other)
+
+    def __mul__(self, multiplier: float):
+        return self.copy().__imul__(multiplier)
+
+    __rmul__ = __mul__
@@ -0,0 +1,260 @@
+from __future__ import annotations
+
+import copy
+import json
+import logging
+import os
+from typing import Dict, List, Any, Optional, Tuple, Callable, Mapping
+
+from .common import Stats
+from .characters import Character
+from .items import Item, Weapon, Armor, Consumable
+from .skills import Skill, GenericSkill, DummySkill, AreaSkill, FormulaSkill
+from .formula import compile_formula
+from .script import Script, Dialogue, Choice
+
+log = logging.getLogger(__name__)
+
+CACHE_VERSION = 2
+STAT_FIELDS = ('hp', 'defense', 'atk', 'int')
+KINDS = ('weapons', 'armors', 'consumables', 'skills', 'characters', 'scripts', 'shops')
+
+# Content file layout (JSON):
+# {
+#   "weapons":     [{"name": ..., "flavor": ..., "stats": {"atk": 16}}],
+#   "armors":      [{"name": ..., "flavor": ..., "piece": 1, "stats": {"hp": 69}}],
+#   "consumables": [{"name": ..., "flavor": ...}],
+#   "skills":      [{"name": ..., "kind": "attack", "scale": 1.5, "text": "{user} hits {target} for {damage}"},
+#                   {"name": ..., "kind": "area", "targeting": "row", "scale": 0.8, "stat": "int", "heal": false},
+#                   {"name": ..., "kind": "formula", "formula": "target.hp -= max(0, user.atk - target.defense)",
+#                    "targeting": "single", "text": "{user} hits {target}"}],
+#   "characters":  [{"name": ..., "stats": {...}, "weapons": [...], "armors": [...], "consumables": [...],
+#                    "equip": [...], "skills": [...], "speed": 1, "row": 0}],
+#   "scripts":     {"intro": [{"dialogue": [[speaker, line], ...]},
+#                             {"choice": [[option, [[speaker, line]], goto label (optional), {flag: value}]]},
+#                             {"label": name}, {"jump": label, "if": condition}, {"set": flag, "value": ...}]},
+#   "shops":       {"default": [[item name, price], ...]}
+# }
+
+
+def _stats(data: Mapping[str, float]) -> List[float]:
+    unknown = set(data) - set(STAT_FIELDS)
+    if unknown:
+        raise ValueError(f'Unknown stat(s) {", ".join(sorted(unknown))}')
+    return [float(data.get(field, 0.)) for field in STAT_FIELDS]
+
+
+# Turns the raw file into plain name-indexed tables. The result only holds JSON types, so it can be
+# cached as JSON and reads back unchanged.
+def compile_content(data: Mapping[str, Any]) -> Dict[str, Any]:
+    compiled: Dict[str, Any] = {kind: {} for kind in KINDS}
+    for kind in ('weapons', 'armors', 'consumables', 'skills', 'characters'):
+        for entry in data.get(kind, ()):
+            entry = dict(entry)
+            if 'stats' in entry:
+                entry['stats'] = _stats(entry['stats'])
+            if entry['name'] in compiled[kind]:
+                raise ValueError(f'Duplicate {kind[:-1]} {entry["name"]}')
+            if kind == 'skills' and 'formula' in entry:
+                # fail on load rather than on first use
+                compile_formula(entry['formula'])
+            compiled[kind][entry['name']] = entry
+    compiled['scripts'] = dict(data.get('scripts', {}))
+    compiled['shops'] = {name: [list(entry) for entry in shop] for name, shop in data.get('shops', {}).items()}
+    compiled['ids'] = {kind: {name: i for i, name in enumerate(compiled[kind])} for kind in KINDS}
+    return compiled
+
+
+def attack_skill(name: str, scale: float = 1., text: str = '{user} hits {target} for {damage:g} damage') -> Skill:
+    def use(user: Character, target: Character) -> str:
+        damage = max(0., user.effective_stats.atk * scale - target.effective_stats.defense)
+        target.effective_stats.hp -= damage
+        return text.format(user=user.name, target=target.name, damage=damage)
+
+    return GenericSkill(name, use)
+
+
+def dummy_skill(name: str, text: str = '{user} does nothing') -> Skill:
+    return DummySkill(name, lambda user, target: text.format(user=user.name, target=target.name if target else ''))
+
+
+def area_skill(name: str, targeting: str = 'enemies', scale: float = 1., stat: str = 'atk', heal: bool = False,
+               text: Optional[str] = None) -> Skill:
+    return AreaSkill(name, targeting, scale, stat, heal, text=text)
+
+
+def formula_skill(name: str, formula: str, text: Optional[str] = None, targeting: str = 'single') -> Skill:
+    return FormulaSkill(name, formula, text, targeting)
+
+
+skill_kinds: Dict[str, Callable[..., Skill]] = {
+    'attack': attack_skill,
+    'dummy': dummy_skill,
+    'area': area_skill,
+    'formula': formula_skill,
+}
+
+
+# Templates are built on first use and shared: item instances are shallow copies that reuse the
+# template's name, flavor text and Stats, only the equipped flag is per instance.
+class Catalog:
+    def __init__(self, compiled: Dict[str, Any]):
+        self.data = compiled
+        self.ids: Dict[str, Dict[str, int]] = compiled['ids']
+        self.templates: Dict[str, Dict[str, Any]] = {kind: {} for kind in KINDS}
+        # file and (version, mtime, size) it was loaded from, see reloaded()
+        self.path: Optional[str] = None
+        self.key: Optional[Tuple] = None
+
+    @classmethod
+    def load(cls, path: str, cache: bool = True) -> Catalog:
+        stat = os.stat(path)
+        key = (CACHE_VERSION, stat.st_mtime_ns, stat.st_size)
+        cache_path = f'{path}.cache'
+        if cache:
+            # compiled JSON, never unpickled, so a planted or corrupt cache file can't run code. Anything
+            # unexpected in it just means a rebuild.
+            try:
+                with open(cache_path, encoding='utf-8') as f:
+                    cached = json.load(f)
+                if cached['key'] == list(key):
+                    return cls(cached['content'])._loaded_from(path, key)
+            except Exception:
+                pass
+
+        with open(path, encoding='utf-8') as f:
+            compiled = compile_content(json.load(f))
+        if cache:
+            try:
+                tmp = f'{cache_path}.tmp'
+                with open(tmp, 'w', encoding='utf-8') as f:
+                    json.dump({'key': list(key), 'content': compiled}, f)
+                os.replace(tmp, cache_path)
+            except OSError:
+                pass
+        return cls(compiled)._loaded_from(path, key)
+
+    def _loaded_from(self, path: str, key: Tuple) -> Catalog:
+        self.path = path
+        self.key = key
+        return self
+
+    # The catalog as currently on disk: self if the file is unchanged, else a freshly loaded catalog
+    # (whose templates, formula skills included, are rebuilt on first use). A broken edit (bad JSON, an
+    # invalid formula, a missing file) is logged and self is kept, so a running game never sees it.
+    def reloaded(self) -> Catalog:
+        if self.path is None:
+            return self
+        try:
+            stat = os.stat(self.path)
+            if (CACHE_VERSION, stat.st_mtime_ns, stat.st_size) == self.key:
+                return self
+            return type(self).load(self.path)
+        except Exception:
+            log.exception('Could not reload %s, keeping the previous content', self.path)
+            return self
+
+    def id(self, kind: str, name: str) -> int:
+        return self.ids[kind][name]
+
+    def names(self, kind: str) -> List[str]:
+        return list(self.data[kind])
+
+    def entry(self, kind: str, name: str) -> Dict[str, Any]:
+        try:
+            return self.data[kind][name]
+        except KeyError:
+            raise ValueError(f'{kind[:-1].capitalize()} {name} is not in the catalog') from None
+
+    def template(self, kind: str, name: str):
+        templates = self.templates[kind]
+        if name not in templates:
+            templates[name] = self.build(kind, self.entry(kind, name))
+        return templates[name]
+
+    def build(self, kind: str, entry: Dict[str, Any]):
+        if kind == 'weapons':
+            return Weapon(entry['name'], entry.get('flavor', ''), Stats(*entry.get('stats', ())))
+        if kind == 'armors':
+            return Armor(entry['name'], entry.get('flavor', ''), entry.get('piece', 0), Stats(*entry.get('stats', ())))
+        if kind == 'consumables':
+            return Consumable(entry['name'], entry.get('flavor', ''))
+        if kind == 'skills':
+            params = {k: v for k, v in entry.items() if k != 'kind'}
+            try:
+                return skill_kinds[entry.get('kind', 'attack')](**params)
+            except KeyError:
+                raise ValueError(f'Unknown skill kind {entry.get("kind")} for skill {entry["name"]}') from None
+        raise ValueError(f'{kind} have no template')
+
+    def item(self, name: str) -> Item:
+        for kind in ('weapons', 'armors', 'consumables'):
+            if name in self.data[kind]:
+                return copy.copy(self.template(kind, name))
+        raise ValueError(f'Item {name} is not in the catalog')
+
+    def skill(self, name: str) -> Skill:
+        return self.template('skills', name)
+
+    def character(self, name: str) -> Character:
+        entry = self.entry('characters', name)
+        character = Character(name,
+                              [self.item(item) for item in entry.get('weapons', ())],
+                              [self.item(item) for item in entry.get('armors', ())],
+                              [self.item(item) for item in entry.get('consumables', ())],
+                              Stats(*entry.get('stats', ())))
+        character.skills = [self.skill(skill) for skill in entry.get('skills', ())]
+        character.speed = entry.get('speed', 1.)
+        character.row = entry.get('row', 0)
+        for item in entry.get('equip', ()):
+            if item in self.data['weapons']:
+                character.equip_weapon(item)
+            else:
+                character.equip_armor(item)
+        return character
+
+    # speakers are looked up in `cast` first so that lines point at the session's own characters
+    def script(self, name: str, cast: Optional[Mapping[str, Character]] = None) -> Script:
+        cast = dict(cast or {})
+
+        def speaker(speaker_name: str) -> Character:
+            if speaker_name not in cast:
+                cast[speaker_name] = self.character(speaker_name)
+            return cast[speaker_name]
+
+        def dialogue(lines) -> Dialogue:
+            return Dialogue([(speaker(author), line) for author, line in lines])
+
+        script = Script()
+        for node in self.entry('scripts', name):
+            if 'dialogue' in node:
+                script.add_dialogue(dialogue(node['dialogue']))
+            elif 'choice' in node:
+                choice = Choice()
+                for option, lines, *branch in node['choice']:
+                    goto = branch[0] if branch else None
+                    sets = branch[1] if len(branch) > 1 else None
+                    choice.add_choice(option, dialogue(lines), goto, sets)
+                script.add_choice(choice)
+            elif 'label' in node:
+                script.label(node['label'])
+            elif 'jump' in node:
+                script.jump(node['jump'], node.get('if'))
+            elif 'set' in node:
+                script.set_flag(node['set'], node.get('value', True))
+            else:
+                raise ValueError(f'Unknown node {node} in script {name}')
+        for character in cast.values():
+            script.add_protagonist(character)
+        return script
+
+    def shop(self, name: str) -> List[Tuple[Item, int]]:
+        return [(self.item(item), price) for item, price in self.entry('shops', name)]
+
+    # Registry source, lets snapshots refer to catalog content without registering it up front
+    def lookup(self, kind: str, key: str):
+        if kind == 'Item' and any(key in self.data[k] for k in ('weapons', 'armors', 'consumables')):
+            return self.item(key)
+        if kind == 'Skill' and key in self.data['skills']:
+            return self.skill(key)
+        return None
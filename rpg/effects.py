@@ -1,7 +1,18 @@
+from __future__ import annotations
+
+import heapq
 from abc import ABCMeta, abstractmethod
-from typing import Optional, Callable, List, Tuple
+from typing import Optional, Callable, List, Tuple, Dict, Iterable, Iterator, Type, TypeVar, Union, TYPE_CHECKING
+
+from .common import Stats
+from .formula import Formula, compile_formula
+from .util import StatModifier, shallow_copy
 
-from .characters import Character, Stats
+if TYPE_CHECKING:
+    from .characters import Character
+    from .skills import Skill
+
+E = TypeVar('E', bound='Effect')
 
 
 class Effect(metaclass=ABCMeta):
@@ -39,6 +50,23 @@ class DummyEffect(Effect):
             return self.text_func(character)
 
 
+# Runs a formula over the affected character every turn, e.g. "target.hp -= 5" for poison; `text` is
+# formatted with target, effect and the formula's locals
+class FormulaEffect(Effect):
+    def __init__(self, effect_name: str, effect_desc: str, duration: int, formula: Union[str, Formula],
+                 text: Optional[str] = None):
+        super().__init__(effect_name, effect_desc, duration)
+        self.formula = compile_formula(formula, ('target',)) if isinstance(formula, str) else formula
+        self.text = text
+
+    def modify(self, character: Character) -> Optional[str]:
+        if self.duration:
+            self.duration -= 1
+            values = self.formula(character)
+            if self.text:
+                return self.text.format(target=character.name, effect=self.name, **values)
+
+
 class TurnSkip(Effect):
     def __init__(self, effect_name: str, effect_desc: str, duration: int,
                  text_func: Callable[[Character], str]):
@@ -68,11 +96,30 @@ class StatsMod(Effect):
         return self.modify_func(character)
 
 
+# All active StatsMod effects folded into one transform. Consecutive stat_mod modifiers are composed
+# field by field; an arbitrary modify_func computes stats from scratch, so it discards whatever came before it.
+class StatsPipeline:
+    def __init__(self, modifiers: Iterable[StatsMod]):
+        self.source: Optional[Callable[[Character], Stats]] = None
+        self.modifier: Optional[StatModifier] = None
+        for modifier in modifiers:
+            func = modifier.modify_func
+            if isinstance(func, StatModifier):
+                self.modifier = self.modifier.then(func) if self.modifier else func
+            else:
+                self.source = func
+                self.modifier = None
+
+    def __call__(self, character: Character) -> Stats:
+        stats = self.source(character) if self.source else character.stats
+        return self.modifier.apply(stats) if self.modifier else stats.copy()
+
+
 class SkillReplaceEffect(Effect):
     def __init__(self, effect_name: str, effect_desc: str, duration: int,
                  skill):
         super().__init__(effect_name, effect_desc, duration)
-        self.cached_skills: Optional[List[Skill]] = None
+        self.cached_skills: Optional[Tuple[Skill, ...]] = None
         self.skill = skill
 
     def modify(self, character: Character) -> Optional[str]:
@@ -85,3 +132,121 @@ class SkillReplaceEffect(Effect):
             if self.duration == 0:
                 character.skills = self.cached_skills
             return
+
+
+# Effects of a single character, indexed by every Effect class in their MRO. Expiry is tracked in a
+# min-heap of the tick (number of update rounds) at which each effect's duration runs out.
+class EffectSet:
+    def __init__(self, effects: Iterable[Effect] = ()):
+        self.effects: Dict[int, Effect] = {}
+        self.by_type: Dict[type, Dict[int, Effect]] = {}
+        self.seq_of: Dict[int, int] = {}
+        self.expiry: List[Tuple[int, int]] = []
+        self.seq = 0
+        self.tick = 0
+        self.version = 0
+        self.pipeline: Optional[StatsPipeline] = None
+        self.pipeline_version = -1
+        self.modified: Optional[Stats] = None
+        self.modified_key: Optional[Tuple[int, int]] = None
+        for effect in effects:
+            self.append(effect)
+
+    def append(self, effect: Effect):
+        if id(effect) in self.seq_of:
+            return
+        seq = self.seq
+        self.seq += 1
+        self.effects[seq] = effect
+        self.seq_of[id(effect)] = seq
+        for cls in type(effect).__mro__:
+            if cls is object:
+                break
+            self.by_type.setdefault(cls, {})[seq] = effect
+        if effect.duration >= 0:
+            heapq.heappush(self.expiry, (self.tick + effect.duration, seq))
+        self.version += 1
+
+    def remove(self, effect: Effect):
+        seq = self.seq_of.pop(id(effect), None)
+        if seq is None:
+            raise ValueError(f'Effect {effect.name} is not in the set')
+        del self.effects[seq]
+        for cls in type(effect).__mro__:
+            if cls is object:
+                break
+            del self.by_type[cls][seq]
+        self.version += 1
+
+    def discard(self, effect: Effect):
+        if id(effect) in self.seq_of:
+            self.remove(effect)
+
+    def clear(self):
+        if self.effects:
+            self.version += 1
+        self.effects.clear()
+        self.by_type.clear()
+        self.seq_of.clear()
+        self.expiry.clear()
+
+    def of_type(self, cls: Type[E]) -> List[E]:
+        return list(self.by_type.get(cls, {}).values())
+
+    def has(self, cls: Type[Effect]) -> bool:
+        return bool(self.by_type.get(cls))
+
+    # Advances one update round and drops every effect whose duration reached 0
+    def expire(self) -> List[Effect]:
+        self.tick += 1
+        expired = []
+        while self.expiry and self.expiry[0][0] <= self.tick:
+            _, seq = heapq.heappop(self.expiry)
+            effect = self.effects.get(seq)
+            if effect is None:
+                continue
+            if effect.duration == 0:
+                self.remove(effect)
+                expired.append(effect)
+            elif effect.duration > 0:
+                heapq.heappush(self.expiry, (self.tick + effect.duration, seq))
+        return expired
+
+    # Stats with every StatsMod applied, None if there are none. Cached until the set or the
+    # character's stats change; the result is shared and must be treated as read-only. A pipeline
+    # starting from an arbitrary modify_func is not cached, it may read anything (e.g. current hp).
+    def modified_stats(self, character: Character) -> Optional[Stats]:
+        if self.pipeline_version != self.version:
+            mods = self.of_type(StatsMod)
+            self.pipeline = StatsPipeline(mods) if mods else None
+            self.pipeline_version = self.version
+            self.modified_key = None
+        if self.pipeline is None:
+            return None
+        if self.pipeline.source is not None:
+            return self.pipeline(character)
+
+        key = (self.version, character.stats_version)
+        if self.modified_key != key:
+            self.modified = self.pipeline(character)
+            self.modified_key = key
+        return self.modified
+
+    # Copies of the set hold copies of the effects (durations change every round); seq_of is keyed by
+    # id(), so it is rebuilt for them
+    def fork(self) -> EffectSet:
+        clone = shallow_copy(self)
+        clone.effects = {seq: shallow_copy(effect) for seq, effect in self.effects.items()}
+        clone.by_type = {cls: {seq: clone.effects[seq] for seq in table} for cls, table in self.by_type.items()}
+        clone.seq_of = {id(effect): seq for seq, effect in clone.effects.items()}
+        clone.expiry = list(self.expiry)
+        return clone
+
+    def __iter__(self) -> Iterator[Effect]:
+        return iter(list(self.effects.values()))
+
+    def __len__(self):
+        return len(self.effects)
+
+    def __contains__(self, effect: Effect):
+        return id(effect) in self.seq_of
@@ -0,0 +1,288 @@
+from __future__ import annotations
+
+import ast
+import math
+from array import array
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, TYPE_CHECKING
+
+from .common import StatsBatch
+from .randomness import rng
+
+if TYPE_CHECKING:
+    import random
+    from .characters import Character
+
+# A tiny language for skill and effect formulas, e.g.
+#
+#     damage = max(0, user.atk * 1.5 - target.defense); target.hp -= damage
+#
+# Statements are assignments (=, +=, -=, *=, /=) to local names or to user.<stat> / target.<stat>,
+# separated by ";" or newlines. Expressions may use numbers, those stats, user.max_hp / target.max_hp
+# (read-only), locals assigned earlier, arithmetic, comparisons, and/or/not, "a if cond else b" and
+# the functions in FUNCTIONS. random() and uniform(a, b) draw from rpg.rng(), so formulas stay
+# replayable. Arithmetic can't raise mid-fight: division (/, //, % and /=) by zero gives 0, and so do
+# sqrt() of a negative number, round/floor/ceil of inf or nan and a ** b when it has no real result or
+# overflows; b is capped to +-MAX_EXPONENT. Formulas are parsed with ast, checked against that whitelist and compiled to two plain
+# Python functions: one for a single (user, target) pair and one looping over StatsBatch rows.
+
+STATS = StatsBatch.fields
+READ_ONLY = ('max_hp',)
+
+
+# round(), floor() and ceil() raise on inf and nan
+def _finite(function: Callable[..., float]) -> Callable[..., float]:
+    return lambda x, *args: function(x, *args) if math.isfinite(x) else 0.
+
+
+FUNCTIONS: Dict[str, Callable[..., float]] = {
+    'min': min,
+    'max': max,
+    'abs': abs,
+    'round': _finite(round),
+    'floor': _finite(math.floor),
+    'ceil': _finite(math.ceil),
+    'sqrt': lambda x: math.sqrt(x) if x > 0 else 0.,
+    'clamp': lambda x, lo, hi: lo if x < lo else hi if x > hi else x,
+}
+RANDOM_FUNCTIONS = ('random', 'uniform')
+MAX_EXPONENT = 64.
+
+
+def _power(a: float, b: float) -> float:
+    try:
+        result = float(a) ** max(-MAX_EXPONENT, min(float(b), MAX_EXPONENT))
+    except (ZeroDivisionError, OverflowError):
+        return 0.
+    # a negative number to a fractional power
+    return 0. if isinstance(result, complex) else result
+
+
+# compiled to calls of these, so that e.g. dividing by zero gives 0
+GUARDED: Dict[type, Callable[[float, float], float]] = {
+    ast.Div: lambda a, b: a / b if b else 0.,
+    ast.FloorDiv: lambda a, b: a // b if b else 0.,
+    ast.Mod: lambda a, b: a % b if b else 0.,
+    ast.Pow: _power,
+}
+
+_BINARY = (ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow)
+_AUGMENTED = (ast.Add, ast.Sub, ast.Mult, ast.Div)
+_UNARY = (ast.UAdd, ast.USub, ast.Not)
+_COMPARE = (ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.Eq, ast.NotEq)
+
+
+# Checks the parsed formula against the whitelist and rewrites it into plain Python over local
+# variables: user.atk becomes user_atk, the local damage becomes v_damage, min() becomes f_min(),
+# a / b becomes g_Div(a, b) and so on
+class _Compiler(ast.NodeTransformer):
+    def __init__(self, source: str, roots: Sequence[str]):
+        self.source = source
+        self.roots = roots
+        self.reads: Dict[Tuple[str, str], None] = {}
+        self.writes: Dict[Tuple[str, str], None] = {}
+        self.locals: Dict[str, None] = {}
+        self.random = False
+
+    def error(self, node: ast.AST, message: str) -> ValueError:
+        return ValueError(f'{message} at column {getattr(node, "col_offset", 0) + 1} of formula {self.source!r}')
+
+    def generic_visit(self, node: ast.AST):
+        raise self.error(node, f'{type(node).__name__} is not allowed')
+
+    def visit_Module(self, node: ast.Module):
+        if not node.body:
+            raise self.error(node, 'Empty formula')
+        node.body = [self.visit(statement) for statement in node.body]
+        return node
+
+    def visit_Expr(self, node: ast.Expr):
+        raise self.error(node, 'Statements must be assignments, e.g. target.hp -= 10')
+
+    def stat(self, node: ast.Attribute, store: bool) -> ast.Name:
+        if not isinstance(node.value, ast.Name) or node.value.id not in self.roots:
+            raise self.error(node, f'Only {", ".join(self.roots)} have attributes')
+        if node.attr not in STATS and (store or node.attr not in READ_ONLY):
+            raise self.error(node, f'{node.value.id}.{node.attr} is not a{"" if store else " readable"} stat')
+        key = (node.value.id, node.attr)
+        (self.writes if store else self.reads)[key] = None
+        return ast.copy_location(ast.Name(f'{node.value.id}_{node.attr}', ast.Store() if store else ast.Load()), node)
+
+    def target(self, node: ast.expr) -> ast.Name:
+        if isinstance(node, ast.Attribute):
+            return self.stat(node, True)
+        if isinstance(node, ast.Name) and node.id not in self.roots and node.id not in FUNCTIONS:
+            return ast.copy_location(ast.Name(f'v_{node.id}', ast.Store()), node)
+        raise self.error(node, 'Can only assign to locals and stats')
+
+    def visit_Assign(self, node: ast.Assign):
+        if len(node.targets) != 1:
+            raise self.error(node, 'Chained assignment is not allowed')
+        node.value = self.visit(node.value)
+        node.targets = [self.target(node.targets[0])]
+        if isinstance(node.targets[0].ctx, ast.Store) and node.targets[0].id.startswith('v_'):
+            self.locals[node.targets[0].id[2:]] = None
+        return node
+
+    def visit_AugAssign(self, node: ast.AugAssign):
+        if not isinstance(node.op, _AUGMENTED):
+            raise self.error(node, f'{type(node.op).__name__}= is not allowed')
+        node.value = self.visit(node.value)
+        if isinstance(node.target, ast.Attribute):
+            # reads the stat as well
+            current = self.stat(node.target, False)
+        elif isinstance(node.target, ast.Name) and node.target.id in self.locals:
+            current = ast.copy_location(ast.Name(f'v_{node.target.id}', ast.Load()), node.target)
+        elif isinstance(node.target, ast.Name):
+            raise self.error(node, f'{node.target.id} is used before it is assigned')
+        else:
+            raise self.error(node, 'Can only assign to locals and stats')
+        node.target = self.target(node.target)
+        if type(node.op) in GUARDED:
+            value = self.guarded(node.op, current, node.value, node)
+            return ast.copy_location(ast.Assign([node.target], value), node)
+        return node
+
+    @staticmethod
+    def guarded(op: ast.operator, left: ast.expr, right: ast.expr, node: ast.AST) -> ast.Call:
+        function = ast.Name(f'g_{type(op).__name__}', ast.Load())
+        return ast.copy_location(ast.Call(function, [left, right], []), node)
+
+    def visit_Attribute(self, node: ast.Attribute):
+        return self.stat(node, False)
+
+    def visit_Name(self, node: ast.Name):
+        if node.id in self.roots:
+            raise self.error(node, f'{node.id} needs a stat, e.g. {node.id}.hp')
+        if node.id not in self.locals:
+            raise self.error(node, f'Unknown name {node.id}')
+        return ast.copy_location(ast.Name(f'v_{node.id}', ast.Load()), node)
+
+    def visit_Constant(self, node: ast.Constant):
+        if type(node.value) not in (int, float, bool):
+            raise self.error(node, f'{type(node.value).__name__} constants are not allowed')
+        return node
+
+    def visit_BinOp(self, node: ast.BinOp):
+        if not isinstance(node.op, _BINARY):
+            raise self.error(node, f'{type(node.op).__name__} is not allowed')
+        node.left, node.right = self.visit(node.left), self.visit(node.right)
+        if type(node.op) in GUARDED:
+            return self.guarded(node.op, node.left, node.right, node)
+        return node
+
+    def visit_UnaryOp(self, node: ast.UnaryOp):
+        if not isinstance(node.op, _UNARY):
+            raise self.error(node, f'{type(node.op).__name__} is not allowed')
+        node.operand = self.visit(node.operand)
+        return node
+
+    def visit_BoolOp(self, node: ast.BoolOp):
+        node.values = [self.visit(value) for value in node.values]
+        return node
+
+    def visit_Compare(self, node: ast.Compare):
+        if not all(isinstance(op, _COMPARE) for op in node.ops):
+            raise self.error(node, 'Only <, <=, >, >=, == and != comparisons are allowed')
+        node.left = self.visit(node.left)
+        node.comparators = [self.visit(comparator) for comparator in node.comparators]
+        return node
+
+    def visit_IfExp(self, node: ast.IfExp):
+        node.test, node.body, node.orelse = self.visit(node.test), self.visit(node.body), self.visit(node.orelse)
+        return node
+
+    def visit_Call(self, node: ast.Call):
+        name = node.func.id if isinstance(node.func, ast.Name) else None
+        if name not in FUNCTIONS and name not in RANDOM_FUNCTIONS:
+            raise self.error(node, f'Unknown function {ast.unparse(node.func)}')
+        if node.keywords:
+            raise self.error(node, 'Keyword arguments are not allowed')
+        node.args = [self.visit(arg) for arg in node.args]
+        if name in RANDOM_FUNCTIONS:
+            self.random = True
+            node.func = ast.copy_location(ast.Attribute(ast.Name('rng', ast.Load()), name, ast.Load()), node.func)
+        else:
+            node.func = ast.copy_location(ast.Name(f'f_{name}', ast.Load()), node.func)
+        return node
+
+
+def _indent(lines: List[str], depth: int) -> str:
+    return ''.join(f'{"    " * depth}{line}\n' for line in lines)
+
+
+class Formula:
+    def __init__(self, source: str, roots: Sequence[str] = ('user', 'target')):
+        self.source = source
+        self.roots = tuple(roots)
+        try:
+            tree = ast.parse(source.strip(), mode='exec')
+        except SyntaxError as e:
+            raise ValueError(f'Invalid formula {source!r}: {e.msg}') from None
+        compiler = _Compiler(source, self.roots)
+        tree = compiler.visit(tree)
+        # (root, stat) pairs, in order of first use
+        self.reads: Tuple[Tuple[str, str], ...] = tuple(compiler.reads)
+        self.writes: Tuple[Tuple[str, str], ...] = tuple(compiler.writes)
+        self.locals: Tuple[str, ...] = tuple(compiler.locals)
+        self.random = compiler.random
+        self.body = [ast.unparse(statement) for statement in tree.body]
+        self.python = self.generate()
+        namespace: Dict[str, Any] = {f'f_{name}': function for name, function in FUNCTIONS.items()}
+        namespace.update((f'g_{op.__name__}', function) for op, function in GUARDED.items())
+        exec(compile(self.python, f'<formula {source!r}>', 'exec'), namespace)
+        self.scalar: Callable = namespace['scalar']
+        self.batch: Callable = namespace['batch']
+
+    def __repr__(self):
+        return f'Formula({self.source!r})'
+
+    def uses(self, root: str) -> bool:
+        return any(key[0] == root for key in self.reads + self.writes)
+
+    # Source of both functions. scalar() takes each root's Stats and max hp and returns the locals,
+    # batch() does the same for every row of the roots' StatsBatch data, writing locals into `out`.
+    def generate(self) -> str:
+        arguments = ', '.join(f'{root}, {root}_max' for root in self.roots)
+        loads = [f'{root}_{stat} = {root}{"_max" if stat == "max_hp" else f".{stat}"}' for root, stat in self.reads]
+        stores = [f'{root}.{stat} = {root}_{stat}' for root, stat in self.writes]
+        result = f'return ({"".join(f"v_{name}, " for name in self.locals)})'
+        scalar = f'def scalar({arguments}, rng):\n' + _indent(loads + self.body + stores + [result], 1)
+
+        loads = [f'{root}_{stat} = {f"{root}_max[i]" if stat == "max_hp" else f"{root}[j + {STATS.index(stat)}]"}'
+                 for root, stat in self.reads]
+        stores = [f'{root}[j + {STATS.index(stat)}] = {root}_{stat}' for root, stat in self.writes]
+        outputs = [f'out[{k}][i] = v_{name}' for k, name in enumerate(self.locals)]
+        batch = (f'def batch({arguments}, rng, n, out):\n'
+                 f'    for i in range(n):\n'
+                 f'        j = i * {StatsBatch.width}\n' + _indent(loads + self.body + stores + outputs, 2))
+        return f'{scalar}\n{batch}'
+
+    # Runs the formula once; `characters` are given in the order of `roots`, their effective stats
+    # are read and written. Returns the formula's locals by name.
+    def __call__(self, *characters: Character, generator: Optional[random.Random] = None) -> Dict[str, float]:
+        arguments = []
+        for character in characters:
+            arguments += (character.effective_stats, character.stats.hp)
+        return dict(zip(self.locals, self.scalar(*arguments, generator or rng())))
+
+    # Runs the formula for every row of the batches at once (row i of each batch is one matchup, e.g.
+    # one simulated fight), updating the batches in place. `max_hp` holds one column per root and
+    # defaults to the current hp. Returns one column per local.
+    def run_batch(self, *batches: StatsBatch, max_hp: Sequence[Sequence[float]] = (),
+                  generator: Optional[random.Random] = None) -> Dict[str, array]:
+        n = len(batches[0])
+        arguments = []
+        for i, b in enumerate(batches):
+            if len(b) != n:
+                raise ValueError(f'Batch size mismatch ({n} != {len(b)})')
+            arguments += (b.data, max_hp[i] if i < len(max_hp) else b.column('hp'))
+        out = [array('d', bytes(8 * n)) for _ in self.locals]
+        self.batch(*arguments, generator or rng(), n, out)
+        return dict(zip(self.locals, out))
+
+
+# Formulas are immutable, so content reloads and repeated skills share the compiled code
+@lru_cache(maxsize=1024)
+def compile_formula(source: str, roots: Tuple[str, ...] = ('user', 'target')) -> Formula:
+    return Formula(source, roots)
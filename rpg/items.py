@@ -1,8 +1,14 @@
 from __future__ import annotations
 
 from abc import ABCMeta, abstractmethod
-from typing import Union, Any
+from typing import Union, Any, Dict, List, Optional, Iterable, Iterator, TypeVar, Generic, TYPE_CHECKING
 from .common import Stats
+from .util import shallow_copy
+
+if TYPE_CHECKING:
+    from .characters import Character
+
+I = TypeVar('I', bound='Item')
 
 
 class Item(metaclass=ABCMeta):
@@ -11,8 +17,13 @@ class Item(metaclass=ABCMeta):
         self.flavor_text = flavor_text
         self.equipped = False
 
-    @abstractmethod
-    def __eq__(self, other: Any): ...
+    def __eq__(self, other: Any):
+        if not isinstance(other, Item):
+            return NotImplemented
+        return type(other) is type(self) and other.name == self.name
+
+    def __hash__(self):
+        return hash((type(self), self.name))
 
     @abstractmethod
     def on_use(self, *args: Any): ...
@@ -25,11 +36,6 @@ class Weapon(Item):
 
     def on_use(self): ...
 
-    def __eq__(self, other: Union[str, Weapon]):
-        if isinstance(other, Weapon):
-            return other.name == self.name
-        return self.name == other
-
 
 class Armor(Item):
     def __init__(self, armor_name: str, flavor_text: str, piece_type: int,  stats: Stats):
@@ -37,18 +43,95 @@ class Armor(Item):
         self.piece_type = piece_type
         self.stats = stats
 
-    def __eq__(self, other: Union[str, Consumable]):
-        if isinstance(other, Weapon):
-            return other.name == self.name
-        return self.name == other
-
     def on_use(self): ...
 
 
 class Consumable(Item):
-    def __eq__(self, other: Union[str, Consumable]):
-        if isinstance(other, Weapon):
-            return other.name == self.name
-        return self.name == other
-
     def on_use(self): ...
+
+
+# Items keyed by name in insertion order. Adding an item that is already present stacks it (its count goes
+# up) instead of storing a duplicate. Iteration, len() and integer indexing see each distinct item once.
+class Inventory(Generic[I]):
+    def __init__(self, items: Iterable[I] = ()):
+        self.items: Dict[str, I] = {}
+        self.counts: Dict[str, int] = {}
+        self.ordered: Optional[List[I]] = None
+        # bumped on every add/remove, lets snapshots tell whether the contents changed
+        self.version = 0
+        for item in items:
+            self.add(item, items.count(item) if isinstance(items, Inventory) else 1)
+
+    def add(self, item: I, count: int = 1):
+        self.version += 1
+        if item.name in self.items:
+            self.counts[item.name] += count
+        else:
+            self.items[item.name] = item
+            self.counts[item.name] = count
+            self.ordered = None
+
+    append = add
+
+    def remove(self, item: Union[str, I], count: int = 1) -> I:
+        name = getattr(item, 'name', item)
+        if name not in self.items:
+            raise ValueError(f'Item {name} is not in the inventory')
+        self.version += 1
+        self.counts[name] -= count
+        removed = self.items[name]
+        if self.counts[name] <= 0:
+            del self.items[name]
+            del self.counts[name]
+            self.ordered = None
+        return removed
+
+    # Independent inventory: the items are shallow copies (sharing name, flavor text and Stats) so
+    # that their equipped flags don't leak between the two
+    def copy(self) -> Inventory[I]:
+        clone = shallow_copy(self)
+        clone.items = {name: shallow_copy(item) for name, item in self.items.items()}
+        clone.counts = self.counts.copy()
+        clone.ordered = None
+        return clone
+
+    def get(self, name: Union[str, I]) -> Optional[I]:
+        return self.items.get(getattr(name, 'name', name))
+
+    def count(self, name: Union[str, I]) -> int:
+        return self.counts.get(getattr(name, 'name', name), 0)
+
+    def __contains__(self, item: Union[str, I]):
+        return getattr(item, 'name', item) in self.items
+
+    def __getitem__(self, index: Union[int, str]) -> I:
+        if isinstance(index, str):
+            return self.items[index]
+        if self.ordered is None:
+            self.ordered = list(self.items.values())
+        return self.ordered[index]
+
+    def __iter__(self) -> Iterator[I]:
+        return iter(self.items.values())
+
+    def __len__(self):
+        return len(self.items)
+
+
+# Buys `item` for `player` out of `balance` and returns the balance left. Weapons and armor are only
+# bought if the player doesn't own one yet, consumables stack. The player gets a copy of the item.
+def buy_item(item: Item, price: int, player: Character, balance: int) -> int:
+    if balance < price:
+        return balance
+    if isinstance(item, Weapon):
+        inventory = player.weapons
+    elif isinstance(item, Armor):
+        inventory = player.armors
+    elif isinstance(item, Consumable):
+        inventory = player.consumables
+    else:
+        return balance
+    if not isinstance(item, Consumable) and item.name in inventory:
+        return balance
+    inventory.add(shallow_copy(item))
+    return balance - price
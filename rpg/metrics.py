@@ -0,0 +1,215 @@
+from __future__ import annotations
+
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+# Opt-in latency histograms and counters, grouped by session. Nothing here costs anything until
+# enable() is called: hooks are installed by patching the instrumented methods, and timed() hands out
+# a shared no-op context manager while disabled.
+
+# 1us, 2us, 4us, ... ~67s, plus an overflow bucket
+BUCKETS = tuple(1e-6 * 2 ** i for i in range(27))
+
+session: ContextVar[str] = ContextVar('metrics_session', default='')
+enabled = False
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.
+        self.max = 0.
+
+    def observe(self, seconds: float):
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q: float) -> float:
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(BUCKETS, self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return self.max
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'count': self.count, 'sum': self.sum, 'max': self.max,
+                'mean': self.sum / self.count if self.count else 0.,
+                'p50': self.quantile(.5), 'p90': self.quantile(.9), 'p99': self.quantile(.99),
+                'buckets': {f'{bound:g}': n for bound, n in zip(BUCKETS + (float('inf'),), self.counts) if n}}
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms: Dict[Tuple[str, str], Histogram] = {}
+        self.counters: Dict[Tuple[str, str], int] = {}
+
+    def observe(self, name: str, seconds: float):
+        key = (session.get(), name)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    def count(self, name: str, n: int = 1):
+        key = (session.get(), name)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + n
+
+    def clear(self):
+        with self.lock:
+            self.histograms.clear()
+            self.counters.clear()
+
+    def snapshot(self) -> Dict[str, Any]:
+        sessions: Dict[str, Dict[str, Any]] = {}
+        with self.lock:
+            for (label, name), histogram in self.histograms.items():
+                sessions.setdefault(label, {'latency': {}, 'counters': {}})['latency'][name] = histogram.to_dict()
+            for (label, name), n in self.counters.items():
+                sessions.setdefault(label, {'latency': {}, 'counters': {}})['counters'][name] = n
+        return {'time': time.time(), 'sessions': sessions}
+
+
+registry = Registry()
+
+# (owner, attribute, original) of every patched method, restored by disable()
+_patches: List[Tuple[Any, str, Any]] = []
+
+
+_off = nullcontext()
+
+
+def timed(name: str):
+    return _timer(name) if enabled else _off
+
+
+@contextmanager
+def _timer(name: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        registry.observe(name, time.perf_counter() - start)
+
+
+def count(name: str, n: int = 1):
+    if enabled:
+        registry.count(name, n)
+
+
+def instrument(owner: Any, attribute: str, name: str):
+    original = getattr(owner, attribute)
+    if inspect.iscoroutinefunction(original):
+        @functools.wraps(original)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await original(*args, **kwargs)
+            finally:
+                registry.observe(name, time.perf_counter() - start)
+    else:
+        @functools.wraps(original)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                registry.observe(name, time.perf_counter() - start)
+    _patches.append((owner, attribute, original))
+    setattr(owner, attribute, wrapper)
+
+
+# Runs `callback` with the session label set, for code that runs outside the session's own task
+def bind_session(callback: Callable, label: str) -> Callable:
+    if inspect.iscoroutinefunction(callback):
+        @functools.wraps(callback)
+        async def bound(*args, **kwargs):
+            token = session.set(label)
+            try:
+                return await callback(*args, **kwargs)
+            finally:
+                session.reset(token)
+    else:
+        @functools.wraps(callback)
+        def bound(*args, **kwargs):
+            token = session.set(label)
+            try:
+                return callback(*args, **kwargs)
+            finally:
+                session.reset(token)
+    return bound
+
+
+# Fight methods aren't patched here: policies fork and play fights to look ahead (in executor threads,
+# outside any session), and those calls would swamp the real turns. Callers time the real turns
+# themselves with timed().
+def enable(hooks: Callable[[], None] = lambda: None):
+    global enabled
+    if enabled:
+        return
+    hooks()
+    enabled = True
+
+
+def disable():
+    global enabled
+    while _patches:
+        owner, attribute, original = _patches.pop()
+        setattr(owner, attribute, original)
+    enabled = False
+
+
+def dump(path: str):
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(registry.snapshot(), f, indent=1)
+    os.replace(tmp, path)
+
+
+def dump_every(path: str, interval: float = 60.) -> threading.Event:
+    stop = threading.Event()
+
+    def run():
+        while not stop.wait(interval):
+            dump(path)
+        dump(path)
+
+    threading.Thread(target=run, name='metrics-dump', daemon=True).start()
+    return stop
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = json.dumps(registry.snapshot()).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Serves the snapshot as JSON on every path; meant for localhost only
+def serve(port: int, host: str = '127.0.0.1') -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), _Handler)
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    return server
@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import random
+import weakref
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Optional, Tuple, Union, Iterator
+
+Draw = Union[int, float]
+
+
+# Random that remembers every value it produced since the last take_draws(), so that a replay can
+# check it consumed randomness exactly like the recorded fight did.
+#
+# Forks are copy-on-write: a fork reads its state from the generator it was forked from until either of
+# them draws, which is when the state (625 words) is actually copied. Forks that never draw, like most
+# of the ones made while searching, never pay for it.
+class FightRandom(random.Random):
+    def __init__(self, seed=None):
+        self.draws: List[Draw] = []
+        self.source: Optional[FightRandom] = None
+        self.forks: weakref.WeakSet[FightRandom] = weakref.WeakSet()
+        super().__init__(seed)
+
+    # called before this generator's state changes
+    def own(self):
+        if self.source is not None:
+            super().setstate(self.source.getstate())
+            self.source = None
+        if self.forks:
+            state = super().getstate()
+            for fork in list(self.forks):
+                if fork.source is self:
+                    random.Random.setstate(fork, state)
+                    fork.source = None
+            self.forks.clear()
+
+    def seed(self, *args, **kwargs):
+        self.own()
+        super().seed(*args, **kwargs)
+
+    def getstate(self):
+        return self.source.getstate() if self.source is not None else super().getstate()
+
+    def setstate(self, state):
+        self.own()
+        super().setstate(state)
+
+    def getrandbits(self, k: int) -> int:
+        if self.source is not None or self.forks:
+            self.own()
+        x = super().getrandbits(k)
+        self.draws.append(x)
+        return x
+
+    def random(self) -> float:
+        if self.source is not None or self.forks:
+            self.own()
+        x = super().random()
+        self.draws.append(x)
+        return x
+
+    # keeps a second value between calls (gauss_next), which is part of the state
+    def gauss(self, mu: float = 0., sigma: float = 1.) -> float:
+        if self.source is not None or self.forks:
+            self.own()
+        return super().gauss(mu, sigma)
+
+    def take_draws(self) -> Tuple[Draw, ...]:
+        draws = tuple(self.draws)
+        self.draws.clear()
+        return draws
+
+    def fork(self) -> FightRandom:
+        clone = FightRandom.__new__(FightRandom)
+        clone.draws = list(self.draws)
+        # random.Random.__init__ isn't run, own() sets the real value from the source's state
+        clone.gauss_next = None
+        clone.source = self
+        clone.forks = weakref.WeakSet()
+        self.forks.add(clone)
+        return clone
+
+
+_fallback = random.Random()
+_current: ContextVar[random.Random] = ContextVar('rng')
+
+
+# The RNG skills and effects must draw from: the running fight's while it resolves a turn
+def rng() -> random.Random:
+    return _current.get(_fallback)
+
+
+@contextmanager
+def using_rng(generator: random.Random) -> Iterator[random.Random]:
+    token = _current.set(generator)
+    try:
+        yield generator
+    finally:
+        _current.reset(token)
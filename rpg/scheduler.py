@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import heapq
+import math
+from typing import Iterable, List, Tuple, Dict, Optional, Literal, TYPE_CHECKING
+
+from .util import shallow_copy
+
+if TYPE_CHECKING:
+    from .characters import Character
+
+Side = Literal['left', 'right']
+
+
+# Characters act in order of their next scheduled time; a character with speed s acts every 1/s time
+# units. Ties are broken by position in the fight, so equal speeds reproduce the plain round robin order.
+# A speed of 0 means never acting: such characters are scheduled at infinity.
+class TurnScheduler:
+    def __init__(self, left: Iterable[Character], right: Iterable[Character]):
+        self.heap: List[Tuple[float, int, Character]] = []
+        self.sides: Dict[int, Side] = {}
+        self.alive: Dict[Side, int] = {'left': 0, 'right': 0}
+        self.dead: set = set()
+        self.characters: List[Character] = []
+        for side, party in (('left', left), ('right', right)):
+            for character in party:
+                self.characters.append(character)
+                self.sides[id(character)] = side
+                self.alive[side] += 1
+                start = math.inf if self.interval(character) == math.inf else 0.
+                self.heap.append((start, len(self.heap), character))
+        heapq.heapify(self.heap)
+
+    # `mapping` maps id() of every character to its copy; sides and dead are keyed by id(), so they
+    # are remapped onto the copies
+    def fork(self, mapping: Dict[int, Character]) -> TurnScheduler:
+        clone = shallow_copy(self)
+        clone.characters = [mapping[id(character)] for character in self.characters]
+        clone.sides = {id(mapping[key]): side for key, side in self.sides.items()}
+        clone.dead = {id(mapping[key]) for key in self.dead}
+        clone.alive = dict(self.alive)
+        clone.heap = [(time, order, mapping[id(character)]) for time, order, character in self.heap]
+        return clone
+
+    @staticmethod
+    def interval(character: Character) -> float:
+        if character.speed < 0:
+            raise ValueError(f'{character.name} has negative speed {character.speed}')
+        return 1. / character.speed if character.speed else math.inf
+
+    @staticmethod
+    def is_alive(character: Character) -> bool:
+        return character.effective_stats is None or character.effective_stats.hp > 0
+
+    def side_of(self, character: Character) -> Side:
+        return self.sides[id(character)]
+
+    def __len__(self):
+        return self.alive['left'] + self.alive['right']
+
+    def finished(self) -> bool:
+        return not self.alive['left'] or not self.alive['right']
+
+    # Marks the character dead if its hp dropped to 0, its heap entry is discarded lazily on pop
+    def update(self, character: Character):
+        key = id(character)
+        if key in self.sides and key not in self.dead and not self.is_alive(character):
+            self.dead.add(key)
+            self.alive[self.sides[key]] -= 1
+
+    # The alive counts only see hp changes passed to update(). This confirms that `side` still has
+    # someone alive, marking the dead it walks past; it usually stops at the first character.
+    def has_alive(self, side: Side) -> bool:
+        for character in self.characters:
+            if self.sides[id(character)] != side:
+                continue
+            if id(character) not in self.dead and self.is_alive(character):
+                return True
+            self.update(character)
+        return False
+
+    def pop(self) -> Optional[Character]:
+        while self.heap:
+            time, order, character = self.heap[0]
+            if id(character) in self.dead:
+                heapq.heappop(self.heap)
+                continue
+            if not self.is_alive(character):
+                heapq.heappop(self.heap)
+                self.update(character)
+                continue
+            if time == math.inf:
+                # everyone left is at speed 0
+                return None
+            heapq.heapreplace(self.heap, (time + self.interval(character), order, character))
+            return character
+        return None
@@ -1,11 +1,13 @@
 from __future__ import annotations
 
-from typing import Union, Iterable, Literal
-from itertools import cycle, chain
+from typing import Union, Iterable, Literal, Any
+from itertools import chain
 import queue
+import random
 
-from operator import attrgetter
-from .util import as_gen
+from .util import as_gen, shallow_copy
+from .scheduler import TurnScheduler
+from .randomness import FightRandom, Draw, using_rng
 
 from .effects import *
 
@@ -13,7 +15,7 @@ from .effects import *
 class Script:
     def __init__(self):
         self.protagonists: List[Character] = []
-        self.story: List[Union[Dialogue, Choice]] = []
+        self.story: List[Union[Dialogue, Choice, Label, Jump, SetFlag]] = []
 
     def add_protagonist(self, protagonist: Character):
         self.protagonists.append(protagonist)
@@ -24,6 +26,16 @@ class Script:
     def add_choice(self, choice: Choice):
         self.story.append(choice)
 
+    def label(self, name: str):
+        self.story.append(Label(name))
+
+    # condition is a flag name, "!flag" or "flag=value", checked against the world state
+    def jump(self, label: str, condition: Optional[str] = None):
+        self.story.append(Jump(label, condition))
+
+    def set_flag(self, flag: str, value: Any = True):
+        self.story.append(SetFlag(flag, value))
+
     def __iter__(self):
         return iter(self.story)
 
@@ -31,6 +43,23 @@ class Script:
         return next(self)
 
 
+class Label:
+    def __init__(self, name: str):
+        self.name = name
+
+
+class Jump:
+    def __init__(self, label: str, condition: Optional[str] = None):
+        self.label = label
+        self.condition = condition
+
+
+class SetFlag:
+    def __init__(self, flag: str, value: Any = True):
+        self.flag = flag
+        self.value = value
+
+
 class Dialogue:
     def __init__(self, lines: Optional[List[Tuple[Character, str]]] = None):
         self.lines: List[Tuple[Character, str]] = lines or []
@@ -54,6 +83,11 @@ class Dialogue:
 class Choice:
     def __init__(self, dialogues: Optional[List[Tuple[str, Dialogue]]] = None):
         self.dialogues: List[Tuple[str, Dialogue]] = dialogues or []
+        self.lookup: Dict[str, Tuple[str, Dialogue]] = {}
+        # option -> (label to continue from, flags to set)
+        self.branches: Dict[str, Tuple[Optional[str], Dict[str, Any]]] = {}
+        for dialogue in self.dialogues:
+            self.lookup.setdefault(dialogue[0], dialogue)
 
     def __iter__(self):
         return iter(self.dialogues)
@@ -67,73 +101,200 @@ class Choice:
     def __getitem__(self, index: int):
         return self.dialogues[index]
 
-    def add_choice(self, choice: str, dialogue: Dialogue):
+    def add_choice(self, choice: str, dialogue: Dialogue, goto: Optional[str] = None,
+                   sets: Optional[Dict[str, Any]] = None):
         self.dialogues.append((choice, dialogue))
+        self.lookup.setdefault(choice, (choice, dialogue))
+        if goto or sets:
+            self.branches[choice] = (goto, sets or {})
 
     def select(self, choice: str):
-        return next((dialogue for dialogue in self.dialogues if dialogue[0] == choice), None)
+        return self.lookup.get(choice)
+
 
+# (turn, actor, skill name, targets, rng draws since the previous action), characters are given by
+# their position in Fight.lookup. A turn passed without acting has the skill name '' (see pass_turn).
+ActionRecord = Tuple[int, int, str, Tuple[int, ...], Tuple[Draw, ...]]
 
+
+# Skills and effects must draw randomness from rpg.rng(), which is the fight's seeded RNG while
+# it resolves a turn, so that a fight can be replayed from its seed and action log.
 class Fight:
-    def __init__(self, left: Iterable[Character], right: Iterable[Character]):
+    def __init__(self, left: Iterable[Character], right: Iterable[Character], seed: Optional[int] = None):
         self.left = list(left)
         self.right = list(right)
         self.lookup = tuple(chain.from_iterable([left, right]))
         self.name_lookup = {character.name: character for character in self.lookup}
-        self.turns = cycle(self.lookup)
+        self.scheduler = TurnScheduler(self.left, self.right)
         self.current: Optional[Character] = None
         self.effect_queue = queue.Queue()
+        # called with the fight after every turn_action, e.g. to checkpoint it
+        self.listeners: List[Callable[[Fight], Any]] = []
+        self.positions = {id(character): i for i, character in enumerate(self.lookup)}
+        self.seed = seed if seed is not None else random.getrandbits(64)
+        self.rng = FightRandom(self.seed)
+        self.turn = 0
+        self.log: List[ActionRecord] = []
+
+    # Branches the fight, e.g. to look ahead or to undo: combatants are forked (see Character.fork) and
+    # the turn order is copied. The fork starts with an empty effect queue and no listeners.
+    def fork(self) -> Fight:
+        mapping = {id(character): character.fork() for character in self.lookup}
+        clone = shallow_copy(self)
+        clone.left = [mapping[id(character)] for character in self.left]
+        clone.right = [mapping[id(character)] for character in self.right]
+        clone.lookup = tuple(chain(clone.left, clone.right))
+        clone.name_lookup = {character.name: character for character in clone.lookup}
+        clone.scheduler = self.scheduler.fork(mapping)
+        clone.current = mapping[id(self.current)] if self.current is not None else None
+        clone.effect_queue = queue.Queue()
+        clone.listeners = []
+        clone.positions = {id(character): i for i, character in enumerate(clone.lookup)}
+        clone.rng = self.rng.fork()
+        clone.log = list(self.log)
+        return clone
 
     def next_turn(self) -> Optional[Character]:
-        if not any(map(attrgetter('effective_stats.hp'), self.left)) or not any(
-                map(attrgetter('effective_stats.hp'), self.right)):
+        with using_rng(self.rng):
+            skipped = 0
+            while not self.scheduler.finished():
+                current = self.scheduler.pop()
+                if current is None:
+                    return None
+
+                self.current = current
+                skip = current.effects.has(TurnSkip)
+                self.update_effect(current)
+                if skip:
+                    skipped += 1
+                    # a full round went by without anyone acting, bail out unless someone is able to act again
+                    if skipped >= len(self.scheduler):
+                        if not self.can_act_again():
+                            return None
+                        skipped = 0
+                elif self.scheduler.is_alive(current):
+                    other = 'right' if self.scheduler.side_of(current) == 'left' else 'left'
+                    return current if self.scheduler.has_alive(other) else None
             return None
 
-        while current := next(turn for turn in self.turns if turn.effective_stats.hp):
-            self.current = current
-            if any(isinstance(effect, TurnSkip) for effect in current.effects):
-                self.update_effect(self.current)
-            else:
-                break
-
-        if self.current:
-            self.update_effect(self.current)
-
-        return self.current
+    # Whether a living character with speed is free of skips or only has skips that wear off. Checked after
+    # the skips of the round have ticked, so a skip that just ran out leaves its character free to act.
+    def can_act_again(self) -> bool:
+        return any(character.speed and all(effect.duration >= 0 for effect in character.effects.of_type(TurnSkip))
+                   for character in self.lookup if self.scheduler.is_alive(character))
 
     # should only be called if next_turn returns None
     def winner(self) -> Union[Literal['left'], Literal['right'], None]:
-        if not any(map(attrgetter('effective_stats.hp'), self.left)):
+        if not self.scheduler.alive['left']:
             return 'left'
-        elif not any(map(attrgetter('effective_stats.hp'), self.right)):
+        elif not self.scheduler.alive['right']:
             return 'right'
         return None
 
-    def turn_action(self, skill_name: str, target_names: Optional[str, List[str]]) -> str:
-        skill = next((skill for skill in self.current.skills if skill.name == skill_name), None)
-        targets = (self.name_lookup[target] for target in as_gen([target_names]))
+    def party(self, character: Character) -> List[Character]:
+        return self.left if self.scheduler.side_of(character) == 'left' else self.right
+
+    def enemies(self, character: Character) -> List[Character]:
+        return self.right if self.scheduler.side_of(character) == 'left' else self.left
+
+    # The characters `skill` hits when `user` picks `target_names`: single-target skills get the first
+    # named character (or None), area skills the living members of the whole group. Row skills hit the
+    # row of the first named character, or the front-most row if none is named.
+    def resolve_targets(self, skill: Skill, user: Character,
+                        target_names: Optional[str, Iterable[str]]) -> Union[Character, List[Character], None]:
+        named = [self.name_lookup[name] for name in as_gen(target_names)] if target_names is not None else []
+        if skill.targeting == 'single':
+            return named[0] if named else None
+        if skill.targeting == 'self':
+            return [user]
+        is_alive = self.scheduler.is_alive
+        if skill.targeting == 'allies':
+            return [character for character in self.party(user) if is_alive(character)]
+        enemies = [character for character in self.enemies(user) if is_alive(character)]
+        if skill.targeting == 'row':
+            row = named[0].row if named else min((character.row for character in enemies), default=0)
+            return [character for character in enemies if character.row == row]
+        return enemies
+
+    # What there is to choose from for `skill`, as (label, characters) pairs: every character for
+    # single-target skills, one entry per living enemy row for row skills, a single entry otherwise
+    def target_groups(self, skill: Skill, user: Character) -> List[Tuple[str, List[Character]]]:
+        if skill.targeting == 'single':
+            return [(character.name, [character]) for character in self.lookup]
+        if skill.targeting == 'row':
+            rows: Dict[int, List[Character]] = {}
+            for character in self.enemies(user):
+                if self.scheduler.is_alive(character):
+                    rows.setdefault(character.row, []).append(character)
+            return [(f'Row {row + 1}: {", ".join(c.name for c in members)}', members)
+                    for row, members in sorted(rows.items())]
+        label = {'self': user.name, 'allies': 'All allies', 'enemies': 'All enemies'}[skill.targeting]
+        return [(label, self.resolve_targets(skill, user, None))]
+
+    def turn_action(self, skill_name: str, target_names: Optional[str, Iterable[str]]) -> str:
+        skill = self.current.get_skill(skill_name)
         if not skill:
             raise ValueError(f'Skill name {skill_name} does not exist for character {self.current.name}')
-
-        if target_names is None:
-            targets = None
-        else:
-            targets = next(targets, None)
-
-        stat_modifiers = [effect for effect in self.current.effects if isinstance(effect, StatsMod)]
-        old_stats = self.current.effective_stats
-        for stat_modifier in stat_modifiers:
-            self.current.effective_stats = stat_modifier.trigger(self.current)
-
-        use_text = skill.use(self.current, targets)
-        self.current.effective_stats = old_stats
+        targets = self.resolve_targets(skill, self.current, target_names)
+
+        # StatsMods change the user's defense, atk and int for this action only. They are applied to the
+        # stats object in place, so the user keeps its current hp, and whatever the skill does to the user
+        # (heals, self-damage, buffs) sticks once the modifiers are taken off again.
+        modified_stats = self.current.effects.modified_stats(self.current)
+        stats = self.current.effective_stats
+        if modified_stats is not None:
+            saved = (stats.defense, stats.atk, stats.int)
+            stats.defense, stats.atk, stats.int = modified_stats.defense, modified_stats.atk, modified_stats.int
+
+        with using_rng(self.rng):
+            use_text = skill.use(self.current, targets)
+        if modified_stats is not None:
+            stats.defense = saved[0] + (stats.defense - modified_stats.defense)
+            stats.atk = saved[1] + (stats.atk - modified_stats.atk)
+            stats.int = saved[2] + (stats.int - modified_stats.int)
+        self._end_turn(skill.name, targets)
         return use_text
 
+    # Ends the current character's turn without an action, e.g. when a policy has nothing to do. The pass
+    # is logged like an action so that replays call next_turn in step with the original fight.
+    def pass_turn(self):
+        self._end_turn('', None)
+
+    def _end_turn(self, skill_name: str, targets: Optional[Character, Iterable[Character]]):
+        self.log.append((self.turn, self.positions[id(self.current)], skill_name,
+                         tuple(self.positions[id(target)] for target in as_gen(targets or ())),
+                         self.rng.take_draws()))
+        self.turn += 1
+        self.scheduler.update(self.current)
+        for target in as_gen(targets or ()):
+            self.scheduler.update(target)
+        for listener in self.listeners:
+            listener(self)
+
     def update_effect(self, character: Character):
         for effect in character.effects:
             e = effect.modify(character)
             if e:
                 self.effect_queue.put_nowait(e)
 
-            if effect.duration == 0:
-                character.effects.remove(effect)
+        character.effects.expire()
+        self.scheduler.update(character)
+
+
+# Replays a recorded fight at full speed without any UI. The characters must be in the state the
+# recorded ones were in when the fight started; raises ValueError as soon as the replay diverges.
+def replay(left: Iterable[Character], right: Iterable[Character], seed: int,
+           log: Iterable[ActionRecord]) -> Fight:
+    fight = Fight(left, right, seed)
+    for turn, actor, skill, targets, draws in log:
+        current = fight.next_turn()
+        if current is None or fight.positions[id(current)] != actor:
+            raise ValueError(f'Replay diverged on turn {turn}: expected {fight.lookup[actor].name} to act, '
+                             f'got {current.name if current else "nobody"}')
+        if skill:
+            fight.turn_action(skill, [fight.lookup[target].name for target in targets] if targets else None)
+        else:
+            fight.pass_turn()
+        if fight.log[-1][4] != tuple(draws):
+            raise ValueError(f'Replay diverged on turn {turn}: RNG draws differ')
+    return fight
@@ -0,0 +1,489 @@
+from __future__ import annotations
+
+import copy
+import heapq
+import json
+import logging
+import os
+import struct
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple, Iterable, Any, TypeVar
+
+from .common import Stats
+from .characters import Character, hands, nothing
+from .effects import Effect, SkillReplaceEffect, EffectSet
+from .items import Item, Inventory
+from .skills import Skill, SkillReplace, AreaSkill
+from .script import Fight
+from .randomness import Draw
+from .world import World
+
+T = TypeVar('T')
+
+log = logging.getLogger(__name__)
+
+MAGIC = b'DND\x05'
+
+
+# Skills, effects and items hold closures and can't be pickled, so snapshots refer to them by key
+# (their name by default) and restore copies of the registered templates.
+class Registry:
+    def __init__(self):
+        self.skills: Dict[str, Skill] = {}
+        self.effects: Dict[str, Effect] = {}
+        self.items: Dict[str, Item] = {}
+        # consulted for keys that were never registered explicitly, see Catalog.lookup
+        self.sources: List[Any] = []
+
+    def register_skill(self, skill: Skill, key: Optional[str] = None) -> Skill:
+        self.skills[key or skill.name] = skill
+        if isinstance(skill, SkillReplace):
+            self.register_effect(skill.replace_effect)
+        elif isinstance(skill, AreaSkill) and skill.effect is not None:
+            self.register_effect(skill.effect)
+        return skill
+
+    def register_effect(self, effect: Effect, key: Optional[str] = None) -> Effect:
+        self.effects[key or effect.name] = effect
+        if isinstance(effect, SkillReplaceEffect):
+            self.register_skill(effect.skill)
+        return effect
+
+    def register_item(self, item: Item, key: Optional[str] = None) -> Item:
+        self.items[key or item.name] = item
+        return item
+
+    def register_character(self, character: Character):
+        for item in (*character.weapons, *character.armors, *character.consumables):
+            self.register_item(item)
+        for skill in character.skills:
+            self.register_skill(skill)
+        for effect in character.effects:
+            self.register_effect(effect)
+
+    def get(self, table: Dict[str, T], key: str, kind: str) -> T:
+        try:
+            return table[key]
+        except KeyError:
+            for source in self.sources:
+                if (obj := source.lookup(kind, key)) is not None:
+                    table[key] = obj
+                    return obj
+            raise ValueError(f'{kind} {key} is not registered') from None
+
+
+registry = Registry()
+
+
+class Writer:
+    def __init__(self):
+        self.buf = bytearray()
+        self.strings: Dict[str, int] = {}
+
+    def varint(self, n: int):
+        while n >= 0x80:
+            self.buf.append(n & 0x7F | 0x80)
+            n >>= 7
+        self.buf.append(n)
+
+    def sint(self, n: int):
+        self.varint(n << 1 if n >= 0 else (-n << 1) - 1)
+
+    def double(self, x: float):
+        self.buf += struct.pack('<d', x)
+
+    def string(self, s: str):
+        index = self.strings.setdefault(s, len(self.strings))
+        self.varint(index)
+
+    # written inline instead of through the string table, for one-off text
+    def text(self, s: str):
+        data = s.encode()
+        self.varint(len(data))
+        self.buf += data
+
+    def stats(self, stats: Optional[Stats]):
+        if stats is None:
+            self.buf.append(0)
+        else:
+            self.buf.append(1)
+            self.buf += struct.pack('<4d', *stats)
+
+    def getvalue(self) -> bytes:
+        table = bytearray()
+        for s in self.strings:
+            data = s.encode()
+            table += _varint(len(data)) + data
+        return MAGIC + _varint(len(self.strings)) + bytes(table) + bytes(self.buf)
+
+
+def _varint(n: int) -> bytes:
+    w = Writer()
+    w.varint(n)
+    return bytes(w.buf)
+
+
+class Reader:
+    def __init__(self, data: bytes):
+        if data[:4] != MAGIC:
+            raise ValueError('Not a snapshot, or written by an incompatible version')
+        self.data = memoryview(data)
+        self.pos = 4
+        self.strings = []
+        for _ in range(self.varint()):
+            n = self.varint()
+            self.strings.append(str(self.data[self.pos:self.pos + n], 'utf-8'))
+            self.pos += n
+
+    def byte(self) -> int:
+        self.pos += 1
+        return self.data[self.pos - 1]
+
+    def varint(self) -> int:
+        n = shift = 0
+        while True:
+            b = self.byte()
+            n |= (b & 0x7F) << shift
+            if b < 0x80:
+                return n
+            shift += 7
+
+    def sint(self) -> int:
+        n = self.varint()
+        return n >> 1 if not n & 1 else -((n + 1) >> 1)
+
+    def double(self) -> float:
+        self.pos += 8
+        return struct.unpack_from('<d', self.data, self.pos - 8)[0]
+
+    def string(self) -> str:
+        return self.strings[self.varint()]
+
+    def text(self) -> str:
+        n = self.varint()
+        self.pos += n
+        return str(self.data[self.pos - n:self.pos], 'utf-8')
+
+    def stats(self) -> Optional[Stats]:
+        if not self.byte():
+            return None
+        self.pos += 32
+        return Stats(*struct.unpack_from('<4d', self.data, self.pos - 32))
+
+
+def _write_items(w: Writer, items: Inventory):
+    w.varint(len(items))
+    for item in items:
+        w.string(item.name)
+        w.buf.append(item.equipped)
+        w.varint(items.count(item))
+
+
+def _read_items(r: Reader, reg: Registry) -> Inventory:
+    items = Inventory()
+    for _ in range(r.varint()):
+        item = copy.copy(reg.get(reg.items, r.string(), 'Item'))
+        item.equipped = bool(r.byte())
+        items.add(item, r.varint())
+    return items
+
+
+def write_character(w: Writer, character: Character):
+    w.string(character.name)
+    w.stats(character.base_stats)
+    w.stats(character.effective_stats)
+    w.double(character.speed)
+    w.sint(character.row)
+    for items in (character.weapons, character.armors, character.consumables):
+        _write_items(w, items)
+    w.string('' if character.equipped_weapon is hands else character.equipped_weapon.name)
+    for armor in character.equipped_armors:
+        w.string('' if armor is nothing else armor.name)
+
+    w.varint(len(character.skills))
+    for skill in character.skills:
+        w.string(skill.name)
+
+    w.varint(len(character.effects))
+    for effect in character.effects:
+        w.string(effect.name)
+        w.sint(effect.duration)
+        if isinstance(effect, SkillReplaceEffect):
+            cached = effect.cached_skills
+            w.sint(-1 if cached is None else len(cached))
+            for skill in cached or ():
+                w.string(skill.name)
+
+
+def read_character(r: Reader, reg: Registry = registry) -> Character:
+    name = r.string()
+    base_stats = r.stats()
+    effective_stats = r.stats()
+    speed = r.double()
+    row = r.sint()
+    weapons, armors, consumables = (_read_items(r, reg) for _ in range(3))
+    character = Character(name, weapons, armors, consumables, base_stats)
+    character.effective_stats = effective_stats
+    character.speed = speed
+    character.row = row
+
+    def equipped(key: str, items: Inventory, default: Item):
+        if not key:
+            return default
+        return items.get(key) or copy.copy(reg.get(reg.items, key, 'Item'))
+
+    character.equipped_weapon = equipped(r.string(), weapons, hands)
+    character.equipped_armors = [equipped(r.string(), armors, nothing) for _ in range(3)]
+    character.skills = [reg.get(reg.skills, r.string(), 'Skill') for _ in range(r.varint())]
+
+    effects = []
+    for _ in range(r.varint()):
+        effect = copy.copy(reg.get(reg.effects, r.string(), 'Effect'))
+        effect.duration = r.sint()
+        if isinstance(effect, SkillReplaceEffect):
+            n = r.sint()
+            effect.cached_skills = None if n < 0 else tuple(reg.get(reg.skills, r.string(), 'Skill') for _ in range(n))
+        effects.append(effect)
+    character.effects = EffectSet(effects)
+    character.invalidate_stats()
+    return character
+
+
+def dump_fight(fight: Fight) -> bytes:
+    w = Writer()
+    w.varint(len(fight.left))
+    w.varint(len(fight.right))
+    for character in fight.lookup:
+        write_character(w, character)
+    _write_fight_state(w, fight)
+    return w.getvalue()
+
+
+def _write_fight_state(w: Writer, fight: Fight):
+    index = {id(character): i for i, character in enumerate(fight.lookup)}
+    w.sint(index[id(fight.current)] if fight.current else -1)
+    w.varint(len(fight.scheduler.heap))
+    for time, order, character in fight.scheduler.heap:
+        w.double(time)
+        w.varint(order)
+        w.varint(index[id(character)])
+    w.varint(len(fight.scheduler.dead))
+    for key in fight.scheduler.dead:
+        w.varint(index[key])
+    pending = list(fight.effect_queue.queue)
+    w.varint(len(pending))
+    for text in pending:
+        w.text(text)
+    _write_rng(w, fight)
+    w.varint(len(fight.log))
+    for turn, actor, skill, targets, draws in fight.log:
+        w.varint(turn)
+        w.varint(actor)
+        w.string(skill)
+        w.varint(len(targets))
+        for target in targets:
+            w.varint(target)
+        _write_draws(w, draws)
+
+
+def _write_draws(w: Writer, draws: Iterable[Draw]):
+    draws = list(draws)
+    w.varint(len(draws))
+    for draw in draws:
+        if isinstance(draw, float):
+            w.buf.append(0)
+            w.double(draw)
+        else:
+            w.buf.append(1)
+            w.varint(draw)
+
+
+def _read_draws(r: Reader) -> List[Draw]:
+    return [r.double() if not r.byte() else r.varint() for _ in range(r.varint())]
+
+
+def _write_rng(w: Writer, fight: Fight):
+    w.sint(fight.seed)
+    w.varint(fight.turn)
+    version, internal, gauss_next = fight.rng.getstate()
+    w.varint(version)
+    w.varint(len(internal))
+    w.buf += struct.pack(f'<{len(internal)}I', *internal)
+    w.buf.append(gauss_next is not None)
+    if gauss_next is not None:
+        w.double(gauss_next)
+    _write_draws(w, fight.rng.draws)
+
+
+def _read_rng(r: Reader, fight: Fight):
+    fight.seed = r.sint()
+    fight.turn = r.varint()
+    version, n = r.varint(), r.varint()
+    internal = struct.unpack_from(f'<{n}I', r.data, r.pos)
+    r.pos += 4 * n
+    gauss_next = r.double() if r.byte() else None
+    fight.rng.setstate((version, internal, gauss_next))
+    fight.rng.draws = _read_draws(r)
+
+
+def load_fight(data: bytes, reg: Registry = registry) -> Fight:
+    r = Reader(data)
+    n_left, n_right = r.varint(), r.varint()
+    characters = [read_character(r, reg) for _ in range(n_left + n_right)]
+    return _read_fight_state(r, Fight(characters[:n_left], characters[n_left:]))
+
+
+def _read_fight_state(r: Reader, fight: Fight) -> Fight:
+    current = r.sint()
+    fight.current = fight.lookup[current] if current >= 0 else None
+    scheduler = fight.scheduler
+    scheduler.heap = [(r.double(), r.varint(), fight.lookup[r.varint()]) for _ in range(r.varint())]
+    heapq.heapify(scheduler.heap)
+    for _ in range(r.varint()):
+        character = fight.lookup[r.varint()]
+        scheduler.dead.add(id(character))
+        scheduler.alive[scheduler.side_of(character)] -= 1
+    for _ in range(r.varint()):
+        fight.effect_queue.put_nowait(r.text())
+    _read_rng(r, fight)
+    for _ in range(r.varint()):
+        turn, actor, skill = r.varint(), r.varint(), r.string()
+        targets = tuple(r.varint() for _ in range(r.varint()))
+        fight.log.append((turn, actor, skill, targets, tuple(_read_draws(r))))
+    return fight
+
+
+# Flags set by scripts are always JSON scalars (see world.compile_script), but state can also be
+# filled in by hand
+def _write_state(w: Writer, world: World):
+    try:
+        w.text(json.dumps(world.state))
+    except (TypeError, ValueError) as e:
+        raise ValueError(f'World state can only hold JSON values: {e}') from None
+
+
+def dump_world(world: World) -> bytes:
+    w = Writer()
+    w.varint(world.position)
+    _write_state(w, world)
+    return w.getvalue()
+
+
+# The world keeps its graph and cast, only the position and flags come from the snapshot
+def load_world(data: bytes, world: World) -> World:
+    r = Reader(data)
+    position = r.varint()
+    world.state = json.loads(r.text())
+    world.seek(position)
+    return world
+
+
+# A story in progress: the world's position and flags plus the party travelling through it
+def dump_session(world: World, characters: Iterable[Character]) -> bytes:
+    w = Writer()
+    characters = list(characters)
+    w.varint(len(characters))
+    for character in characters:
+        write_character(w, character)
+    w.varint(world.position)
+    _write_state(w, world)
+    return w.getvalue()
+
+
+# Returns the saved characters and adds them to the world's cast
+def load_session(data: bytes, world: World, reg: Registry = registry) -> List[Character]:
+    r = Reader(data)
+    characters = [read_character(r, reg) for _ in range(r.varint())]
+    position = r.varint()
+    world.state = json.loads(r.text())
+    world.cast.update((character.name, character) for character in characters)
+    world.seek(position)
+    return characters
+
+
+# Writes snapshot files on a background thread, so checkpointing doesn't block the caller (e.g. the
+# bot's event loop) on disk I/O. Writes to the same path are coalesced: if a path is written again
+# before the thread got to it, only the newest data is written. Files are replaced atomically.
+class FileWriter:
+    def __init__(self):
+        self.lock = threading.Lock()
+        # None marks a pending removal
+        self.pending: Dict[str, Optional[bytes]] = {}
+        self.executor = ThreadPoolExecutor(1, thread_name_prefix='snapshots')
+
+    def write(self, path: str, data: Optional[bytes]):
+        with self.lock:
+            queued = path in self.pending
+            self.pending[path] = data
+        if not queued:
+            self.executor.submit(self._store, path)
+
+    def remove(self, path: str):
+        self.write(path, None)
+
+    # blocks until everything written so far is on disk
+    def flush(self):
+        self.executor.submit(lambda: None).result()
+
+    def _store(self, path: str):
+        with self.lock:
+            data = self.pending.pop(path)
+        try:
+            if data is None:
+                if os.path.exists(path):
+                    os.remove(path)
+                return
+            tmp = f'{path}.tmp'
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except OSError:
+            log.exception('Could not write snapshot %s', path)
+
+
+files = FileWriter()
+
+
+# Fight listener that rewrites a snapshot file after every action. Characters whose state hasn't
+# changed since the previous checkpoint are not re-encoded; the string table is kept across checkpoints
+# so their cached encodings stay valid. Only the encoding runs in the listener, the file is written by
+# a FileWriter.
+class Checkpointer:
+    def __init__(self, path: str, writer: Optional[FileWriter] = None):
+        self.path = path
+        self.writer = writer or files
+        self.strings: Dict[str, int] = {}
+        self.cache: Dict[int, Tuple[Any, bytes]] = {}
+
+    # equipping bumps stats_version, buying and using items bump the inventory versions
+    @staticmethod
+    def signature(character: Character):
+        return (tuple(character.effective_stats or ()), character.stats_version, character.effects.version,
+                character.effects.tick, tuple(skill.name for skill in character.skills), character.speed,
+                character.row, character.weapons.version, character.armors.version, character.consumables.version)
+
+    def encode(self, fight: Fight) -> bytes:
+        w = Writer()
+        w.strings = self.strings
+        w.varint(len(fight.left))
+        w.varint(len(fight.right))
+        for character in fight.lookup:
+            signature = self.signature(character)
+            cached = self.cache.get(id(character))
+            if not cached or cached[0] != signature:
+                part = Writer()
+                part.strings = self.strings
+                write_character(part, character)
+                cached = self.cache[id(character)] = (signature, bytes(part.buf))
+            w.buf += cached[1]
+        _write_fight_state(w, fight)
+        return w.getvalue()
+
+    def __call__(self, fight: Fight):
+        self.writer.write(self.path, self.encode(fight))
+
+    # drops the snapshot, e.g. once the fight is over
+    def clear(self):
+        self.writer.remove(self.path)
+        self.cache.clear()
@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+import os
+import random
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Iterable, List, Optional, Tuple, Literal
+
+from .characters import Character
+from .script import Fight
+
+# A policy picks (skill name, target name) for the character whose turn it is, or None to pass.
+# Policies and party factories are shipped to worker processes, so they have to be picklable
+# (module level functions or instances of module level classes).
+Decision = Optional[Tuple[str, Optional[str]]]
+Policy = Callable[[Fight, Character, random.Random], Decision]
+PartyFactory = Callable[[], Iterable[Character]]
+
+
+def alive(character: Character) -> bool:
+    return character.effective_stats.hp > 0
+
+
+def opponents(fight: Fight, character: Character) -> List[Character]:
+    return fight.right if character in fight.left else fight.left
+
+
+class RandomPolicy:
+    def __call__(self, fight: Fight, character: Character, rng: random.Random) -> Decision:
+        targets = [c for c in opponents(fight, character) if alive(c)]
+        if not character.skills or not targets:
+            return None
+        return rng.choice(character.skills).name, rng.choice(targets).name
+
+
+class WeakestTargetPolicy:
+    def __call__(self, fight: Fight, character: Character, rng: random.Random) -> Decision:
+        targets = [c for c in opponents(fight, character) if alive(c)]
+        if not character.skills or not targets:
+            return None
+        return character.skills[0].name, min(targets, key=lambda c: c.effective_stats.hp).name
+
+
+class SimulationResult:
+    def __init__(self):
+        self.runs = 0
+        self.wins: Counter = Counter()
+        self.turns: List[int] = []
+        self.damage = {'left': [], 'right': []}
+
+    def add(self, winner: Optional[Literal['left', 'right']], turns: int, left_damage: float,
+            right_damage: float):
+        self.runs += 1
+        self.wins[winner] += 1
+        self.turns.append(turns)
+        self.damage['left'].append(left_damage)
+        self.damage['right'].append(right_damage)
+
+    def merge(self, other: SimulationResult):
+        self.runs += other.runs
+        self.wins.update(other.wins)
+        self.turns.extend(other.turns)
+        self.damage['left'].extend(other.damage['left'])
+        self.damage['right'].extend(other.damage['right'])
+        return self
+
+    def win_rate(self, side: Optional[Literal['left', 'right']]) -> float:
+        return self.wins[side] / self.runs if self.runs else 0.
+
+    @property
+    def mean_turns(self) -> float:
+        return sum(self.turns) / len(self.turns) if self.turns else 0.
+
+    def turn_histogram(self) -> Counter:
+        return Counter(self.turns)
+
+    # damage dealt by `side` per fight, bucketed to multiples of `bucket`
+    def damage_histogram(self, side: Literal['left', 'right'], bucket: float = 10.) -> Counter:
+        return Counter(int(d // bucket * bucket) for d in self.damage[side])
+
+    def __repr__(self):
+        return f'SimulationResult(runs={self.runs}, left={self.win_rate("left"):.3f}, ' \
+               f'right={self.win_rate("right"):.3f}, draw={self.win_rate(None):.3f}, ' \
+               f'mean_turns={self.mean_turns:.2f})'
+
+
+def _side_hp(party: Iterable[Character]) -> float:
+    return sum(max(c.effective_stats.hp, 0) for c in party)
+
+
+def run_fight(left: Iterable[Character], right: Iterable[Character], policy: Policy,
+              rng: random.Random, max_turns: int = 1000) -> Tuple[Optional[str], int, float, float]:
+    fight = Fight(left, right, rng.getrandbits(64))
+    for character in fight.lookup:
+        character.update_effective_stats()
+    left_hp, right_hp = _side_hp(fight.left), _side_hp(fight.right)
+
+    turns = 0
+    while turns < max_turns and (current := fight.next_turn()):
+        turns += 1
+        decision = policy(fight, current, rng)
+        if decision is not None:
+            fight.turn_action(*decision)
+        else:
+            fight.pass_turn()
+
+    # Fight.winner() names the side that got wiped out
+    wiped = fight.winner() if fight.scheduler.finished() else None
+    winner = {'left': 'right', 'right': 'left'}.get(wiped)
+    return winner, turns, right_hp - _side_hp(fight.right), left_hp - _side_hp(fight.left)
+
+
+def _run_chunk(left: PartyFactory, right: PartyFactory, policy: Policy,
+               seeds: List[int], max_turns: int) -> SimulationResult:
+    result = SimulationResult()
+    for seed in seeds:
+        result.add(*run_fight(left(), right(), policy, random.Random(seed), max_turns))
+    return result
+
+
+def simulate(left: PartyFactory, right: PartyFactory, policy: Policy, n_runs: int,
+             *, seed: Optional[int] = None, processes: Optional[int] = None,
+             max_turns: int = 1000) -> SimulationResult:
+    base = random.Random(seed).getrandbits(32) if seed is None else seed
+    seeds = [base + i for i in range(n_runs)]
+    processes = processes if processes is not None else os.cpu_count() or 1
+
+    if processes <= 1 or n_runs < 2:
+        return _run_chunk(left, right, policy, seeds, max_turns)
+
+    # contiguous chunks, so that merging them in order lists the runs in seed order like a single process does
+    size = -(-n_runs // processes)
+    chunks = [seeds[i:i + size] for i in range(0, n_runs, size)]
+    result = SimulationResult()
+    with ProcessPoolExecutor(max_workers=len(chunks)) as pool:
+        futures = [pool.submit(_run_chunk, left, right, policy, chunk, max_turns) for chunk in chunks]
+        for future in futures:
+            result.merge(future.result())
+    return result
@@ -1,15 +1,28 @@
 from __future__ import annotations
 
+import copy
 from abc import ABCMeta, abstractmethod
-from typing import Union, Iterable, Callable, TYPE_CHECKING
+from array import array
+from typing import Union, Iterable, Callable, Dict, List, Literal, Optional, TYPE_CHECKING
 
-from .effects import SkillReplaceEffect
+from .common import StatsBatch
+from .effects import Effect, SkillReplaceEffect
+from .formula import Formula, compile_formula
+from .util import as_gen
 
 if TYPE_CHECKING:
     from .characters import Character
 
+# Who a skill hits, resolved by the fight: the one chosen character, every living enemy, every living
+# ally, the living enemies in the chosen character's row, or the user
+Targeting = Literal['single', 'enemies', 'allies', 'row', 'self']
+TARGETINGS = ('single', 'enemies', 'allies', 'row', 'self')
+
 
 class Skill(metaclass=ABCMeta):
+    # single-target skills are used with one Character (or None), all others with a list of them
+    targeting: Targeting = 'single'
+
     def __init__(self, name: str):
         self.name = name
 
@@ -44,5 +57,94 @@ class SkillReplace(Skill):
         self.replace_effect = SkillReplaceEffect(effect_name, '', duration, skill)
 
     def use(self, user: Character, target: Character):
-        target.effects.append(self.replace_effect)
+        target.effects.append(copy.copy(self.replace_effect))
         return self.text_func(user, target)
+
+
+# Hits (or heals) every target at once and produces a single log line for the whole action. The
+# amounts are simple enough that each target's hp is updated directly; gathering the targets into a
+# StatsBatch first only added copies (see the fight.area benchmark).
+# `text` is formatted with user, count, targets (comma separated names) and amount (the total).
+class AreaSkill(Skill):
+    def __init__(self, name: str, targeting: Targeting = 'enemies', scale: float = 1., stat: str = 'atk',
+                 heal: bool = False, effect: Optional[Effect] = None, text: Optional[str] = None):
+        super().__init__(name)
+        if targeting not in TARGETINGS:
+            raise ValueError(f'Unknown targeting {targeting}')
+        if stat not in StatsBatch.fields:
+            raise ValueError(f'Unknown stat {stat}')
+        self.targeting = targeting
+        self.scale = scale
+        self.stat = stat
+        self.heal = heal
+        self.effect = effect
+        self.text = text or ('{user} heals {count} for {amount:g} hp' if heal else
+                             '{user} hits {count} for {amount:g} total damage')
+
+    def use(self, user: Character, targets: Union[Character, Iterable[Character], None]) -> str:
+        targets = list(as_gen(targets)) if targets is not None else []
+        if not targets:
+            return f'{user.name} uses {self.name} but nobody is in reach'
+        # read once, the user may be among the targets
+        power = getattr(user.effective_stats, self.stat) * self.scale
+        total = 0.
+        for target in targets:
+            stats = target.effective_stats
+            if self.heal:
+                amount = max(0., min(power, target.stats.hp - stats.hp))
+                stats.hp += amount
+            else:
+                amount = max(0., power - stats.defense)
+                stats.hp -= amount
+            total += amount
+            if self.effect is not None:
+                target.effects.append(copy.copy(self.effect))
+        count = targets[0].name if len(targets) == 1 else f'{len(targets)} targets'
+        return self.text.format(user=user.name, count=count, targets=', '.join(t.name for t in targets),
+                                amount=total, skill=self.name)
+
+
+# Runs a formula (see rpg.formula) with the user and the target. Area skills run it over all targets
+# at once through the formula's batch kernel, unless it changes the user's stats, in which case the
+# targets are gone through one by one. `text` is formatted with user, target (or the number of targets),
+# skill and the formula's locals, which are summed over the targets.
+class FormulaSkill(Skill):
+    def __init__(self, name: str, formula: Union[str, Formula], text: Optional[str] = None,
+                 targeting: Targeting = 'single'):
+        super().__init__(name)
+        if targeting not in TARGETINGS:
+            raise ValueError(f'Unknown targeting {targeting}')
+        self.formula = compile_formula(formula) if isinstance(formula, str) else formula
+        self.text = text or '{user} uses {skill} on {target}'
+        self.targeting = targeting
+
+    def use(self, user: Character, targets: Union[Character, Iterable[Character], None]) -> str:
+        if self.targeting == 'single':
+            target = targets if targets is not None else user
+            values = self.formula(user, target)
+            return self.text.format(user=user.name, target=target.name, skill=self.name, **values)
+
+        targets = list(as_gen(targets)) if targets is not None else []
+        if not targets:
+            return f'{user.name} uses {self.name} but nobody is in reach'
+        if any(root == 'user' for root, _ in self.formula.writes):
+            totals = dict.fromkeys(self.formula.locals, 0.)
+            for target in targets:
+                for name, value in self.formula(user, target).items():
+                    totals[name] += value
+        else:
+            totals = {name: sum(column) for name, column in self.run_batch(user, targets).items()}
+        target = targets[0].name if len(targets) == 1 else f'{len(targets)} targets'
+        return self.text.format(user=user.name, target=target, skill=self.name, **totals)
+
+    def run_batch(self, user: Character, targets: List[Character]) -> Dict[str, array]:
+        formula = self.formula
+        users = StatsBatch.from_stats([user.effective_stats] * len(targets))
+        batch = StatsBatch.from_stats(target.effective_stats for target in targets)
+        max_hp = ([user.stats.hp] * len(targets), [target.stats.hp for target in targets]) \
+            if any(stat == 'max_hp' for _, stat in formula.reads) else ()
+        values = formula.run_batch(users, batch, max_hp=max_hp)
+        for root, stat in formula.writes:
+            for target, value in zip(targets, batch.column(stat)):
+                setattr(target.effective_stats, stat, value)
+        return values
@@ -1,6 +1,10 @@
+from __future__ import annotations
+
 from typing import TypeVar, Iterable, Iterator, overload, Union, Callable, TYPE_CHECKING
 from .common import Stats
-from .characters import Character
+
+if TYPE_CHECKING:
+    from .characters import Character
 
 T = TypeVar('T')
 mod_func = Callable[[float], float]
@@ -22,18 +26,50 @@ def as_gen(x: Union[T, Iterable[T]]) -> Iterator[T]:
         yield x
 
 
+# copy.copy without the __reduce_ex__ round trip, for plain (non-__slots__) objects copied in hot paths
+def shallow_copy(obj: T) -> T:
+    clone = object.__new__(type(obj))
+    clone.__dict__.update(obj.__dict__)
+    return clone
+
+
+class StatModifier:
+    __slots__ = ('hp', 'defense', 'atk', 'int')
+
+    def __init__(self,
+                 hp: mod_func = identity,
+                 defense: mod_func = identity,
+                 atk: mod_func = identity,
+                 intelligence: mod_func = identity):
+        self.hp = hp
+        self.defense = defense
+        self.atk = atk
+        self.int = intelligence
+
+    def apply(self, stats: Stats) -> Stats:
+        return Stats(self.hp(stats.hp), self.defense(stats.defense), self.atk(stats.atk), self.int(stats.int))
+
+    def __call__(self, character: Character) -> Stats:
+        return self.apply(character.stats)
+
+    # self first, then other
+    def then(self, other: StatModifier) -> StatModifier:
+        return StatModifier(compose(self.hp, other.hp), compose(self.defense, other.defense),
+                            compose(self.atk, other.atk), compose(self.int, other.int))
+
+
+def compose(first: mod_func, second: mod_func) -> mod_func:
+    if first is identity:
+        return second
+    if second is identity:
+        return first
+    return lambda x: second(first(x))
+
+
 def stat_mod(
         hp: mod_func = identity,
         defense: mod_func = identity,
         atk: mod_func = identity,
         intelligence: mod_func = identity,
-) -> Callable[[Character], Stats]:
-    def _wrap(character: Character):
-        return Stats(
-            hp(character.stats.hp),
-            defense(character.stats.defense),
-            atk(character.stats.atk),
-            intelligence(character.stats.int),
-        )
-
-    return _wrap
+) -> StatModifier:
+    return StatModifier(hp, defense, atk, intelligence)
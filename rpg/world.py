@@ -1,4 +1,11 @@
-from .script import Script
+from __future__ import annotations
+
+import shelve
+from collections import deque
+from typing import Optional, Union, Dict, List, Tuple, Any, Generator, Mapping, Sequence, Set
+
+from .characters import Character
+from .script import Script, Dialogue, Choice, Label, Jump, SetFlag
 
 
 # Script
@@ -7,9 +14,279 @@ from .script import Script
 # -> state
 
 
+# Nodes only hold plain data (speakers by name) so a graph can be stored on disk and loaded node by node
+class Node:
+    __slots__ = ('kind', 'payload', 'next')
+
+    def __init__(self, kind: str, payload: Any = None, next: Optional[int] = None):
+        self.kind = kind
+        self.payload = payload
+        self.next = next
+
+    def __getstate__(self):
+        return self.kind, self.payload, self.next
+
+    def __setstate__(self, state):
+        self.kind, self.payload, self.next = state
+
+    def edges(self) -> List[int]:
+        if self.kind == 'end':
+            return []
+        if self.kind == 'choice':
+            return [option[2] for option in self.payload]
+        if self.kind == 'jump':
+            condition, target = self.payload
+            return [target] if condition is None else [target, self.next]
+        return [self.next]
+
+
+class ShelfStore:
+    def __init__(self, path: str):
+        self.shelf = shelve.open(path, 'r')
+        self.length = self.shelf['len']
+
+    def __getitem__(self, index: int) -> Node:
+        return self.shelf[str(index)]
+
+    def __len__(self):
+        return self.length
+
+    def close(self):
+        self.shelf.close()
+
+
+class ScriptGraph:
+    def __init__(self, nodes: Sequence[Node], labels: Dict[str, int], entry: int = 0):
+        self.nodes = nodes
+        self.labels = labels
+        self.entry = entry
+
+    def __getitem__(self, index: int) -> Node:
+        return self.nodes[index]
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def reachable(self) -> Set[int]:
+        seen = {self.entry}
+        queue = deque(seen)
+        while queue:
+            for edge in self.nodes[queue.popleft()].edges():
+                if edge not in seen:
+                    seen.add(edge)
+                    queue.append(edge)
+        return seen
+
+    # Drops nodes that can't be reached from the entry (e.g. code after an unconditional jump)
+    def prune(self) -> ScriptGraph:
+        keep = sorted(self.reachable())
+        remap = {old: new for new, old in enumerate(keep)}
+
+        def target(index: Optional[int]) -> Optional[int]:
+            return remap.get(index) if index is not None else None
+
+        nodes = []
+        for old in keep:
+            node = self.nodes[old]
+            payload = node.payload
+            if node.kind == 'choice':
+                payload = tuple((text, lines, remap[dest], sets) for text, lines, dest, sets in payload)
+            elif node.kind == 'jump':
+                payload = (payload[0], remap[payload[1]])
+            nodes.append(Node(node.kind, payload, target(node.next)))
+        return ScriptGraph(nodes, {label: remap[i] for label, i in self.labels.items() if i in remap},
+                           remap[self.entry])
+
+    # closes the backing store of a graph from open()
+    def close(self):
+        if hasattr(self.nodes, 'close'):
+            self.nodes.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def save(self, path: str):
+        with shelve.open(path, 'n') as shelf:
+            shelf['len'] = len(self.nodes)
+            shelf['labels'] = self.labels
+            shelf['entry'] = self.entry
+            for i, node in enumerate(self.nodes):
+                shelf[str(i)] = node
+
+    @classmethod
+    def open(cls, path: str) -> ScriptGraph:
+        store = ShelfStore(path)
+        return cls(store, store.shelf['labels'], store.shelf['entry'])
+
+
+def _lines(dialogue: Dialogue) -> Tuple[Tuple[str, str], ...]:
+    return tuple((author.name, line) for author, line in dialogue)
+
+
+# World state is saved as JSON (see serialization.dump_world), so flags must hold JSON scalars
+def _check_flag(flag: str, value: Any):
+    if value is not None and type(value) not in (str, int, float, bool):
+        raise ValueError(f'Flag {flag} must be a string, number, bool or None, not {type(value).__name__}')
+
+
+# Everyone who appears in the script: its protagonists and the authors of its lines
+def speakers(script: Script) -> Dict[str, Character]:
+    cast = {character.name: character for character in script.protagonists}
+    for item in script.story:
+        if isinstance(item, Dialogue):
+            dialogues = [item]
+        elif isinstance(item, Choice):
+            dialogues = [dialogue for _, dialogue in item]
+        else:
+            continue
+        for dialogue in dialogues:
+            for author, _ in dialogue:
+                cast.setdefault(author.name, author)
+    return cast
+
+
+def compile_script(script: Script, prune: bool = True) -> ScriptGraph:
+    labels: Dict[str, int] = {}
+    count = 0
+    for item in script.story:
+        if isinstance(item, Label):
+            if item.name in labels:
+                raise ValueError(f'Duplicate label {item.name}')
+            labels[item.name] = count
+        else:
+            count += 1
+
+    def resolve(label: str) -> int:
+        try:
+            return labels[label]
+        except KeyError:
+            raise ValueError(f'Jump to unknown label {label}') from None
+
+    nodes: List[Node] = []
+    for item in script.story:
+        if isinstance(item, Label):
+            continue
+        after = len(nodes) + 1
+        if isinstance(item, Dialogue):
+            nodes.append(Node('dialogue', _lines(item), after))
+        elif isinstance(item, Choice):
+            options = []
+            for text, dialogue in item:
+                goto, sets = item.branches.get(text, (None, {}))
+                for flag, value in sets.items():
+                    _check_flag(flag, value)
+                options.append((text, _lines(dialogue), resolve(goto) if goto else after, sets))
+            nodes.append(Node('choice', tuple(options), after))
+        elif isinstance(item, Jump):
+            nodes.append(Node('jump', (item.condition, resolve(item.label)), after))
+        elif isinstance(item, SetFlag):
+            _check_flag(item.flag, item.value)
+            nodes.append(Node('set', (item.flag, item.value), after))
+        else:
+            raise ValueError(f'Cannot compile story item {item!r}')
+    nodes.append(Node('end'))
+
+    graph = ScriptGraph(nodes, labels)
+    return graph.prune() if prune else graph
+
+
+def check_condition(condition: Optional[str], state: Mapping[str, Any]) -> bool:
+    if not condition:
+        return True
+    if condition.startswith('!'):
+        return not state.get(condition[1:])
+    if '=' in condition:
+        key, value = condition.split('=', 1)
+        return str(state.get(key)) == value
+    return bool(state.get(condition))
+
+
+# Cursor over a script graph. Nodes are fetched from the graph one at a time as the story advances,
+# and `position` names the dialogue or choice on screen until the next one is requested (the next node to
+# run otherwise), so a world resumed from a saved position shows the node the player was at again.
+# Graphs only name speakers, `cast` maps those names to characters (a Script brings its own speakers);
+# unknown speakers get a blank Character.
 class World:
-    def __init__(self, script: Script):
-        self.script = iter(script)
+    def __init__(self, script: Union[Script, ScriptGraph], position: Optional[int] = None,
+                 cast: Optional[Mapping[str, Character]] = None, state: Optional[Dict[str, Any]] = None):
+        if isinstance(script, Script):
+            self.cast = speakers(script)
+            script = compile_script(script)
+        else:
+            self.cast = {}
+        self.cast.update(cast or {})
+        self.graph = script
+        self.state: Dict[str, Any] = state if state is not None else {}
+        self.seek(self.graph.entry if position is None else position)
+
+    def seek(self, position: int):
+        self.position = position
+        self.cursor = self.nodes()
+        self.started = False
+
+    def jump(self, label: str):
+        self.seek(self.graph.labels[label])
+
+    def speaker(self, name: str) -> Character:
+        if name not in self.cast:
+            self.cast[name] = Character(name)
+        return self.cast[name]
+
+    def dialogue(self, lines: Tuple[Tuple[str, str], ...]) -> Dialogue:
+        return Dialogue([(self.speaker(name), line) for name, line in lines])
+
+    def close(self):
+        self.graph.close()
+
+    # Raises ValueError if jumps and flags loop forever without showing anything. Such a loop can only
+    # revisit a node with the state unchanged, which is what `seen` (cleared whenever something is
+    # shown) catches.
+    def nodes(self) -> Generator[Union[Dialogue, Choice], Optional[str], None]:
+        seen: Set[Tuple[int, str]] = set()
+        while True:
+            node = self.graph[self.position]
+            if node.kind in ('jump', 'set'):
+                key = (self.position, repr(sorted(self.state.items())))
+                if key in seen:
+                    raise ValueError(f'Script loops forever without dialogue at node {self.position}')
+                seen.add(key)
+            else:
+                seen.clear()
+            if node.kind == 'end':
+                return
+            if node.kind == 'dialogue':
+                yield self.dialogue(node.payload)
+                self.position = node.next
+            elif node.kind == 'choice':
+                options = {text: (dest, sets) for text, _, dest, sets in node.payload}
+                picked = None
+                while picked not in options:
+                    choice = Choice()
+                    for text, lines, _, _ in node.payload:
+                        choice.add_choice(text, self.dialogue(lines))
+                    picked = yield choice
+                dest, sets = options[picked]
+                self.state.update(sets)
+                self.state['last_choice'] = picked
+                self.position = dest
+            elif node.kind == 'jump':
+                condition, target = node.payload
+                self.position = target if check_condition(condition, self.state) else node.next
+            elif node.kind == 'set':
+                flag, value = node.payload
+                self.state[flag] = value
+                self.position = node.next
 
-    def advance(self):
-        ...
+    # Returns the next dialogue or choice, or None once the story is over. After a choice,
+    # pass the picked option to continue.
+    def advance(self, choice: Optional[str] = None) -> Optional[Union[Dialogue, Choice]]:
+        try:
+            if self.started:
+                return self.cursor.send(choice)
+            self.started = True
+            return next(self.cursor)
+        except StopIteration:
+            return None
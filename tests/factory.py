@@ -0,0 +1,23 @@
+from typing import Iterable
+
+import rpg
+from rpg.content import attack_skill
+
+
+def character(name: str, hp: float = 100., atk: float = 10., defense: float = 0., speed: float = 1.,
+              skills: Iterable[rpg.Skill] = ()) -> rpg.Character:
+    c = rpg.Character(name, stats=rpg.Stats(hp, defense, atk, 5))
+    c.skills = list(skills) or [attack_skill('Hit')]
+    c.speed = speed
+    c.update_effective_stats()
+    return c
+
+
+def order(fight: rpg.Fight, turns: int):
+    names = []
+    for _ in range(turns):
+        current = fight.next_turn()
+        if current is None:
+            break
+        names.append(current.name)
+    return names
@@ -0,0 +1,96 @@
+import pytest
+
+import rpg
+from rpg.content import attack_skill
+from factory import character
+
+
+def test_skills_can_only_change_through_assignment():
+    hit, kick = attack_skill('Hit'), attack_skill('Kick')
+    c = character('A', skills=[hit])
+    with pytest.raises((TypeError, AttributeError)):
+        c.skills[0] = kick
+    c.skills = [kick]
+    assert c.get_skill('Kick') is kick
+    assert c.get_skill('Hit') is None
+
+
+def test_skill_replace_restores_the_index():
+    hit, wait = attack_skill('Hit'), rpg.DummySkill('Wait', lambda user, target: '')
+    c = character('A', skills=[hit])
+    effect = rpg.SkillReplaceEffect('Stunned', '', 2, wait)
+    effect.modify(c)
+    assert c.get_skill('Hit') is None
+    assert c.get_skill('Wait') is wait
+    effect.modify(c)
+    assert c.get_skill('Hit') is hit
+
+
+def armed(name: str) -> rpg.Character:
+    sword, axe = rpg.Weapon('Sword', '', rpg.Stats(atk=5)), rpg.Weapon('Axe', '', rpg.Stats(atk=8))
+    boots = rpg.Armor('Boots', '', 1, rpg.Stats(defense=2))
+    c = rpg.Character(name, [sword, axe], [boots], [rpg.Consumable('Potion', '')], rpg.Stats(100, 0, 10, 0))
+    c.equip_weapon('Sword')
+    c.equip_armor('Boots')
+    c.update_effective_stats()
+    return c
+
+
+def test_fork_doesnt_share_equipment_or_inventories():
+    original = armed('A')
+    clone = original.fork()
+
+    clone.equip_weapon('Axe')
+    clone.unequip_armor(1)
+    clone.consumables.remove('Potion')
+    clone.armors.add(rpg.Armor('Helmet', '', 0, rpg.Stats()))
+
+    assert original.equipped_weapon.name == 'Sword'
+    assert original.weapons['Sword'].equipped and not original.weapons['Axe'].equipped
+    assert original.equipped_armors[1] is original.armors['Boots']
+    assert original.armors['Boots'].equipped
+    assert original.consumables.count('Potion') == 1
+    assert 'Helmet' not in original.armors
+    assert original.stats.atk == 15 and original.stats.defense == 2
+
+    assert clone.weapons['Axe'].equipped and not clone.weapons['Sword'].equipped
+    assert not clone.armors['Boots'].equipped
+    assert clone.stats.atk == 18 and clone.stats.defense == 0
+
+
+def test_fork_equipment_points_into_the_forked_inventories():
+    clone = armed('A').fork()
+    assert clone.equipped_weapon is clone.weapons['Sword']
+    assert clone.equipped_armors[1] is clone.armors['Boots']
+
+
+def test_stats_are_cached_between_reads():
+    c = armed('A')
+    assert c.stats is c.stats
+    assert c.get_item_stats() is c.get_item_stats()
+
+
+@pytest.mark.parametrize('change, atk, defense', [
+    (lambda c: c.equip_weapon('Axe'), 18, 2),
+    (lambda c: c.unequip_weapon(), 10, 2),
+    (lambda c: c.unequip_armor(1), 15, 0),
+    (lambda c: c.armors.add(rpg.Armor('Helmet', '', 0, rpg.Stats(defense=3))) or c.equip_armor('Helmet'), 15, 5),
+    (lambda c: setattr(c, 'base_stats', rpg.Stats(100, 1, 20, 0)), 25, 3),
+])
+def test_changes_bump_the_stats_version(change, atk, defense):
+    c = armed('A')
+    cached, version = c.stats, c.stats_version
+    change(c)
+    assert c.stats_version > version
+    assert c.stats is not cached
+    assert (c.stats.atk, c.stats.defense) == (atk, defense)
+
+
+def test_in_place_edits_need_invalidate_stats():
+    c = armed('A')
+    version = c.stats_version
+    c.weapons['Sword'].stats.atk = 7
+    assert c.stats.atk == 15
+    c.invalidate_stats()
+    assert c.stats_version == version + 1
+    assert c.stats.atk == 17
@@ -0,0 +1,77 @@
+import json
+import os
+
+import pytest
+
+import rpg
+from rpg.content import Catalog
+
+BOT_CONTENT = os.path.join(os.path.dirname(__file__), '..', 'bot', 'content.json')
+
+
+@pytest.fixture
+def content(tmp_path):
+    path = tmp_path / 'content.json'
+    with open(BOT_CONTENT, encoding='utf-8') as f:
+        path.write_text(f.read(), encoding='utf-8')
+    return str(path)
+
+
+def test_cache_reads_back_the_same_content(content):
+    fresh = Catalog.load(content)
+    cached = Catalog.load(content)
+    assert cached.data == fresh.data
+    with open(f'{content}.cache', encoding='utf-8') as f:
+        assert json.load(f)['content'] == fresh.data
+
+
+def test_corrupt_cache_is_rebuilt(content):
+    fresh = Catalog.load(content, cache=False)
+    for garbage in (b'\x80\x04K\x01.', b'{"key": 1}', b'{}'):
+        with open(f'{content}.cache', 'wb') as f:
+            f.write(garbage)
+        assert Catalog.load(content).data == fresh.data
+
+
+def test_bot_characters_have_skills():
+    catalog = Catalog.load(BOT_CONTENT, cache=False)
+    for name in catalog.names('characters'):
+        character = catalog.character(name)
+        assert character.skills, name
+        for skill in character.skills:
+            assert character.get_skill(skill.name) is skill
+
+
+@pytest.mark.parametrize('edit', [
+    lambda text: text.replace('user.atk * (1 + user.int / 10)', 'open()'),
+    lambda text: text[:-10],
+])
+def test_broken_reload_keeps_the_last_good_catalog(content, edit, caplog):
+    catalog = Catalog.load(content)
+    with open(content, encoding='utf-8') as f:
+        text = f.read()
+    with open(content, 'w', encoding='utf-8') as f:
+        f.write(edit(text) + ' ' * 10)
+    assert catalog.reloaded() is catalog
+    assert 'Could not reload' in caplog.text
+
+
+def test_reload_picks_up_a_good_edit_and_a_missing_file_is_kept(content):
+    catalog = Catalog.load(content)
+    with open(content, encoding='utf-8') as f:
+        data = json.load(f)
+    data['shops']['default'].append(['A fish', 3])
+    with open(content, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    fresh = catalog.reloaded()
+    assert fresh is not catalog and len(fresh.shop('default')) == 2
+    os.remove(content)
+    assert fresh.reloaded() is fresh
+
+
+def test_formula_content_skill():
+    catalog = Catalog.load(BOT_CONTENT, cache=False)
+    formulas = [name for name in catalog.names('skills') if catalog.entry('skills', name).get('kind') == 'formula']
+    assert formulas
+    for name in formulas:
+        assert isinstance(catalog.skill(name), rpg.FormulaSkill)
@@ -0,0 +1,78 @@
+import rpg
+from rpg.util import stat_mod
+from factory import character
+
+
+def dummy(name: str, duration: int) -> rpg.DummyEffect:
+    return rpg.DummyEffect(name, '', duration, lambda c: f'{name} ticks')
+
+
+def round_of(effects: rpg.EffectSet, character: rpg.Character):
+    for effect in effects:
+        effect.modify(character)
+    return effects.expire()
+
+
+def test_index_by_type():
+    effects = rpg.EffectSet([dummy('a', 2), rpg.TurnSkip('stun', '', 1, lambda c: '')])
+    assert effects.has(rpg.TurnSkip)
+    assert [e.name for e in effects.of_type(rpg.Effect)] == ['a', 'stun']
+    assert [e.name for e in effects.of_type(rpg.DummyEffect)] == ['a']
+
+
+def test_effects_expire_when_their_duration_runs_out():
+    c = character('A')
+    short, long = dummy('short', 1), dummy('long', 3)
+    effects = rpg.EffectSet([short, long])
+    assert round_of(effects, c) == [short]
+    assert round_of(effects, c) == []
+    assert round_of(effects, c) == [long]
+    assert len(effects) == 0
+
+
+def test_negative_duration_never_expires():
+    c = character('A')
+    effects = rpg.EffectSet([dummy('aura', -1)])
+    for _ in range(5):
+        round_of(effects, c)
+    assert len(effects) == 1
+
+
+def test_removed_effects_do_not_expire_twice():
+    c = character('A')
+    effect = dummy('a', 1)
+    effects = rpg.EffectSet([effect])
+    effects.remove(effect)
+    assert round_of(effects, c) == []
+
+
+def test_fork_copies_durations():
+    c = character('A')
+    effects = rpg.EffectSet([dummy('a', 2)])
+    fork = effects.fork()
+    round_of(fork, c)
+    assert [e.duration for e in effects] == [2]
+    assert [e.duration for e in fork] == [1]
+
+
+def test_stat_mods_compose_and_follow_stat_changes():
+    c = character('A', atk=10.)
+    c.effects.append(rpg.StatsMod('double', '', 3, stat_mod(atk=lambda x: x * 2), lambda _: ''))
+    c.effects.append(rpg.StatsMod('plus', '', 3, stat_mod(atk=lambda x: x + 1), lambda _: ''))
+    assert c.effects.modified_stats(c).atk == 21
+    c.base_stats = rpg.Stats(100, 0, 20, 5)
+    assert c.effects.modified_stats(c).atk == 41
+
+
+def test_callable_stat_mods_see_current_effective_stats():
+    c = character('A', hp=100., atk=10.)
+
+    def rage(character):
+        stats = character.stats.copy()
+        stats.atk += 100 - character.effective_stats.hp
+        return stats
+
+    c.effects.append(rpg.StatsMod('rage', '', 3, rage, lambda _: ''))
+    assert c.effects.modified_stats(c).atk == 10
+    c.effective_stats.hp = 40
+    assert c.effects.modified_stats(c).atk == 70
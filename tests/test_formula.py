@@ -0,0 +1,127 @@
+import random
+
+import pytest
+
+import rpg
+from rpg.formula import Formula
+from factory import character
+
+
+@pytest.mark.parametrize('source', [
+    'import os',
+    '__import__("os")',
+    'target.hp = user.__class__',
+    'target.hp = open("x")',
+    'target.hp = (lambda: 1)()',
+    'target.hp = "a"',
+    'target.hp = [1][0]',
+    'target.hp = user',
+    'target.hp = other.hp',
+    'target.max_hp = 1',
+    'target.speed = 1',
+    'x += 1',
+    'x = y = 1',
+    'target.hp **= 2',
+    'target.hp = max(1, key=1)',
+    'target.hp - 1',
+    'target.hp = 1 if user.hp in (1, 2) else 0',
+    '',
+    'target.hp =',
+])
+def test_rejected(source):
+    with pytest.raises(ValueError):
+        Formula(source)
+
+
+def test_locals_are_returned_in_order():
+    a, b = character('A', atk=12.), character('B', defense=2.)
+    values = Formula('raw = user.atk * 2; damage = raw - target.defense; target.hp -= damage')(a, b)
+    assert values == {'raw': 24., 'damage': 22.}
+    assert b.effective_stats.hp == 78.
+
+
+def test_max_hp_is_readable():
+    a = character('A', hp=50.)
+    a.effective_stats.hp = 10.
+    Formula('target.hp += (target.max_hp - target.hp) / 2', ('target',))(a)
+    assert a.effective_stats.hp == 30.
+
+
+def test_division_by_zero_gives_zero():
+    a, b = character('A', atk=10.), character('B', defense=0.)
+    values = Formula('ratio = user.atk / target.defense; rest = 7 % target.defense; '
+                     'whole = 7 // target.defense; root = sqrt(-1); target.hp /= target.defense')(a, b)
+    assert values == {'ratio': 0., 'rest': 0., 'whole': 0., 'root': 0.}
+    assert b.effective_stats.hp == 0.
+
+
+def test_random_draws_from_the_fight_rng():
+    swing = rpg.FormulaSkill('Swing', 'damage = uniform(5, 15); target.hp -= damage', '{damage}')
+
+    def fight(seed: int):
+        a, b = character('A', skills=[swing]), character('B')
+        f = rpg.Fight([a], [b], seed=seed)
+        f.current = a
+        return f, [float(f.turn_action('Swing', 'B')) for _ in range(3)]
+
+    first, hits = fight(4)
+    _, again = fight(4)
+    _, other = fight(5)
+    assert hits == again != other
+    assert all(5 <= hit <= 15 for hit in hits)
+    # every draw is recorded, so the fight can be replayed
+    assert [len(record[4]) for record in first.log] == [1, 1, 1]
+
+
+@pytest.mark.parametrize('source', [
+    'damage = max(0, user.atk * 1.5 - target.defense); target.hp -= damage',
+    'heal = min(target.max_hp - target.hp, user.int * 2); target.hp += heal',
+    'bonus = 2 if target.hp < target.max_hp / 2 else 1; target.hp -= user.atk * bonus / (target.defense + 1)',
+    'roll = random(); target.hp -= roll * user.atk; user.hp -= 1',
+])
+def test_scalar_and_batch_agree(source):
+    rng = random.Random(0)
+    users = [character(f'U{i}', hp=rng.uniform(1, 100), atk=rng.uniform(0, 20)) for i in range(20)]
+    targets = [character(f'T{i}', hp=rng.uniform(1, 100), defense=rng.uniform(0, 5)) for i in range(20)]
+    for c in users + targets:
+        c.effective_stats.hp *= rng.random()
+    formula = Formula(source)
+
+    user_batch = rpg.StatsBatch.from_stats(c.effective_stats for c in users)
+    target_batch = rpg.StatsBatch.from_stats(c.effective_stats for c in targets)
+    max_hp = ([c.stats.hp for c in users], [c.stats.hp for c in targets])
+    columns = formula.run_batch(user_batch, target_batch, max_hp=max_hp, generator=random.Random(1))
+
+    generator = random.Random(1)
+    for i, (user, target) in enumerate(zip(users, targets)):
+        values = formula(user, target, generator=generator)
+        assert values == {name: columns[name][i] for name in formula.locals}
+        assert user_batch[i] == user.effective_stats
+        assert target_batch[i] == target.effective_stats
+
+
+def test_formula_effect_ticks():
+    a = character('A')
+    a.effects.append(rpg.FormulaEffect('Poison', '', 2, 'target.hp -= 5', '{target} takes poison damage'))
+    fight = rpg.Fight([a], [character('B')])
+    fight.update_effect(a)
+    fight.update_effect(a)
+    fight.update_effect(a)
+    assert a.effective_stats.hp == 90.
+
+
+
+@pytest.mark.parametrize('source, expected', [
+    ('target.hp = target.defense ** -1', 0.),
+    ('target.hp = (target.hp - 200) ** 0.5', 0.),
+    ('target.hp = 1e300 ** user.atk', 0.),
+    ('target.hp = 10 ** user.atk', 1e64),
+    ('target.hp = 2 ** -user.atk', 2. ** -64),
+    ('target.hp = user.int ** 2', 25.),
+    ('target.hp = round(1e308 * 10) + floor(1e308 * 10) + ceil(-1e308 * 10)', 0.),
+])
+def test_power_and_rounding_never_raise(source, expected):
+    a, b = character('A', atk=1000.), character('B', defense=0.)
+    Formula(source)(a, b)
+    assert b.effective_stats.hp == expected
+    assert type(b.effective_stats.hp) is float
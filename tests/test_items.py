@@ -0,0 +1,41 @@
+import pytest
+
+import rpg
+
+
+def test_identical_items_stack():
+    potion = rpg.Consumable('Potion', '')
+    items = rpg.Inventory([potion, rpg.Consumable('Potion', ''), rpg.Consumable('Ether', '')])
+    assert len(items) == 2
+    assert [item.name for item in items] == ['Potion', 'Ether']
+    assert items.count('Potion') == 2
+    assert items['Potion'] is potion and items[0] is potion
+    # copies keep the counts
+    assert rpg.Inventory(items).count('Potion') == 2
+
+
+def test_removing_from_a_stack():
+    items = rpg.Inventory([rpg.Consumable('Potion', '')])
+    items.add(rpg.Consumable('Potion', ''), 2)
+    items.remove('Potion')
+    assert items.count('Potion') == 2 and 'Potion' in items
+    items.remove('Potion', 2)
+    assert 'Potion' not in items and len(items) == 0
+    with pytest.raises(ValueError):
+        items.remove('Potion')
+
+
+def test_buying_from_the_shop():
+    sword, potion = rpg.Weapon('Sword', '', rpg.Stats(atk=5)), rpg.Consumable('Potion', '')
+    c = rpg.Character('A')
+    balance = rpg.buy_item(sword, 10, c, 25)
+    assert balance == 15
+    assert c.weapons['Sword'] == sword and c.weapons['Sword'] is not sword
+    # a second sword isn't bought, potions stack
+    assert rpg.buy_item(sword, 10, c, balance) == 15
+    balance = rpg.buy_item(potion, 5, c, rpg.buy_item(potion, 5, c, balance))
+    assert balance == 5
+    assert c.consumables.count('Potion') == 2
+    # not enough money
+    assert rpg.buy_item(rpg.Armor('Boots', '', 1, rpg.Stats()), 10, c, balance) == 5
+    assert 'Boots' not in c.armors
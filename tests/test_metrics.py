@@ -0,0 +1,43 @@
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import rpg
+from rpg import metrics
+from rpg.ai import SearchPolicy
+from factory import character
+
+
+@pytest.fixture
+def enabled():
+    metrics.registry.clear()
+    metrics.enable()
+    yield metrics.registry
+    metrics.disable()
+    metrics.registry.clear()
+
+
+def test_lookahead_is_not_counted(enabled):
+    fight = rpg.Fight([character('A')], [character('B')], seed=1)
+    current = fight.next_turn()
+    with ThreadPoolExecutor(1) as executor:
+        assert executor.submit(SearchPolicy(depth=3), fight, current, random.Random(0)).result() is not None
+    assert not any(name.startswith('fight.') for _, name in enabled.histograms)
+
+
+def test_timed_is_labelled_with_the_session(enabled):
+    token = metrics.session.set('42')
+    try:
+        with metrics.timed('fight.turn_action'):
+            pass
+    finally:
+        metrics.session.reset(token)
+    assert enabled.histograms[('42', 'fight.turn_action')].count == 1
+
+
+def test_disabled_metrics_record_nothing():
+    metrics.registry.clear()
+    with metrics.timed('fight.next_turn'):
+        pass
+    assert not metrics.registry.histograms
@@ -0,0 +1,80 @@
+import random
+
+import pytest
+
+import rpg
+from rpg.ai import SearchPolicy
+from rpg.serialization import Registry, dump_fight, load_fight
+from rpg.simulation import RandomPolicy
+from factory import character
+
+
+def wild_swing() -> rpg.Skill:
+    def use(user: rpg.Character, target: rpg.Character) -> str:
+        damage = rpg.rng().uniform(5, 15)
+        target.effective_stats.hp -= damage
+        return f'{user.name} swings for {damage}'
+
+    return rpg.GenericSkill('Wild swing', use)
+
+
+def cast():
+    hero = character('Hero', hp=80., speed=1.5, skills=[wild_swing()])
+    dummy = character('Dummy', hp=120.)
+    # nothing to do on its turns, so every one of them is a pass
+    dummy.skills = ()
+    return [hero], [dummy]
+
+
+def play(fight: rpg.Fight, policy, rng: random.Random):
+    while current := fight.next_turn():
+        decision = policy(fight, current, rng)
+        if decision is None:
+            fight.pass_turn()
+        else:
+            fight.turn_action(*decision)
+    return fight
+
+
+def test_passes_are_logged():
+    fight = play(rpg.Fight(*cast(), seed=3), RandomPolicy(), random.Random(0))
+    passes = [record for record in fight.log if record[2] == '']
+    assert passes and all(fight.lookup[actor].name == 'Dummy' for _, actor, _, _, _ in passes)
+    assert [record[0] for record in fight.log] == list(range(len(fight.log)))
+
+
+@pytest.mark.parametrize('policy', [RandomPolicy(), SearchPolicy(depth=2)])
+def test_replay_with_passes_matches_the_original(policy):
+    original = play(rpg.Fight(*cast(), seed=11), policy, random.Random(1))
+    replayed = rpg.replay(*cast(), 11, original.log)
+    assert replayed.log == original.log
+    assert [c.effective_stats for c in replayed.lookup] == [c.effective_stats for c in original.lookup]
+    assert replayed.winner() == original.winner()
+
+
+def test_replay_of_a_restored_log():
+    original = play(rpg.Fight(*cast(), seed=5), RandomPolicy(), random.Random(2))
+    reg = Registry()
+    for c in original.lookup:
+        reg.register_character(c)
+    log = load_fight(dump_fight(original), reg).log
+    assert rpg.replay(*cast(), 5, log).log == original.log
+
+
+def test_diverging_replay_is_an_error():
+    original = play(rpg.Fight(*cast(), seed=5), RandomPolicy(), random.Random(2))
+    log = list(original.log)
+    first_pass = next(i for i, record in enumerate(log) if record[2] == '')
+    del log[first_pass]
+    with pytest.raises(ValueError, match='diverged'):
+        rpg.replay(*cast(), 5, log)
+
+
+def test_forked_rng_draws_like_the_original():
+    for warm_up in (0, 1):
+        original = rpg.FightRandom(1)
+        for _ in range(warm_up):
+            # leaves the second value of the pair cached in gauss_next
+            original.gauss(0, 1)
+        fork = original.fork()
+        assert [fork.gauss(0, 1) for _ in range(3)] == [original.gauss(0, 1) for _ in range(3)]
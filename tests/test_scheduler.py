@@ -0,0 +1,85 @@
+import pytest
+
+import rpg
+from factory import character, order
+
+
+def test_equal_speeds_round_robin():
+    fight = rpg.Fight([character('A'), character('B')], [character('C')], seed=0)
+    assert order(fight, 6) == ['A', 'B', 'C', 'A', 'B', 'C']
+
+
+def test_faster_characters_act_more_often():
+    fight = rpg.Fight([character('A', speed=2.)], [character('B')], seed=0)
+    assert order(fight, 6) == ['A', 'B', 'A', 'A', 'B', 'A']
+
+
+def test_speed_zero_never_acts():
+    fight = rpg.Fight([character('A', speed=0.)], [character('B')], seed=0)
+    assert order(fight, 3) == ['B', 'B', 'B']
+
+
+def test_everyone_at_speed_zero_ends_the_fight():
+    fight = rpg.Fight([character('A', speed=0.)], [character('B', speed=0.)], seed=0)
+    assert fight.next_turn() is None
+
+
+def test_negative_speed_is_rejected():
+    with pytest.raises(ValueError):
+        rpg.Fight([character('A', speed=-1.)], [character('B')])
+
+
+def test_dead_characters_are_skipped():
+    a, b, c = character('A'), character('B'), character('C')
+    fight = rpg.Fight([a, b], [c], seed=0)
+    b.effective_stats.hp = 0
+    assert order(fight, 4) == ['A', 'C', 'A', 'C']
+
+
+def test_side_wiped_outside_of_a_turn_finishes_the_fight():
+    a, c = character('A'), character('C')
+    fight = rpg.Fight([a], [c], seed=0)
+    assert fight.next_turn() is a
+    # e.g. killed by something other than the actor's skill
+    c.effective_stats.hp = 0
+    assert fight.next_turn() is None
+    assert fight.scheduler.finished()
+    assert fight.winner() == 'right'
+
+
+def test_fight_ends_when_a_side_is_killed_by_a_skill():
+    a, c = character('A', atk=200.), character('C')
+    fight = rpg.Fight([a], [c], seed=0)
+    fight.next_turn()
+    fight.turn_action('Hit', 'C')
+    assert fight.next_turn() is None
+    assert fight.winner() == 'right'
+
+
+def stun(*characters: rpg.Character, duration: int):
+    for c in characters:
+        c.effects.append(rpg.TurnSkip('Stun', '', duration, lambda character: f'{character.name} is stunned'))
+
+
+@pytest.mark.parametrize('duration', [1, 2, 3])
+def test_everyone_stunned_acts_again_once_the_stuns_wear_off(duration):
+    a, b = character('A'), character('B')
+    fight = rpg.Fight([a], [b], seed=0)
+    stun(a, b, duration=duration)
+    assert order(fight, 2) == ['A', 'B']
+    assert not fight.scheduler.finished()
+
+
+def test_one_side_stunned_for_good_lets_the_other_act():
+    a, b = character('A'), character('B')
+    fight = rpg.Fight([a], [b], seed=0)
+    stun(a, duration=-1)
+    assert order(fight, 3) == ['B', 'B', 'B']
+
+
+def test_everyone_stunned_for_good_ends_the_fight():
+    a, b = character('A'), character('B')
+    fight = rpg.Fight([a], [b], seed=0)
+    stun(a, b, duration=-1)
+    assert fight.next_turn() is None
+    assert fight.winner() is None
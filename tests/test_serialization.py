@@ -0,0 +1,126 @@
+import rpg
+from rpg.serialization import (
+    Registry, Checkpointer, FileWriter, dump_fight, load_fight, dump_session, load_session,
+)
+from factory import character, order
+
+
+def setup():
+    a, b = character('A', speed=2.), character('B', hp=60.)
+    reg = Registry()
+    for c in (a, b):
+        reg.register_character(c)
+    return rpg.Fight([a], [b], seed=7), reg
+
+
+def play(fight: rpg.Fight, turns: int):
+    for _ in range(turns):
+        current = fight.next_turn()
+        target = fight.right[0] if current in fight.left else fight.left[0]
+        fight.turn_action(current.skills[0].name, target.name)
+
+
+def test_fight_snapshot_round_trip():
+    fight, reg = setup()
+    play(fight, 3)
+    restored = load_fight(dump_fight(fight), reg)
+    assert [c.effective_stats for c in restored.lookup] == [c.effective_stats for c in fight.lookup]
+    assert restored.log == fight.log
+    # the turn order and the RNG carry on where the original left off
+    assert order(restored, 4) == order(fight, 4)
+    assert restored.rng.random() == fight.rng.random()
+
+
+def test_checkpointer_writes_in_the_background(tmp_path):
+    fight, reg = setup()
+    writer = FileWriter()
+    path = str(tmp_path / 'fight')
+    fight.listeners.append(Checkpointer(path, writer))
+    play(fight, 2)
+    writer.flush()
+    with open(path, 'rb') as f:
+        restored = load_fight(f.read(), reg)
+    assert restored.log == fight.log
+
+
+def test_checkpointer_sees_inventory_changes():
+    fight, reg = setup()
+    checkpoint = Checkpointer('unused')
+    a = fight.left[0]
+    checkpoint.encode(fight)
+    potion = rpg.Consumable('Potion', '')
+    reg.register_item(potion)
+    a.consumables.add(potion)
+    restored = load_fight(checkpoint.encode(fight), reg)
+    assert restored.left[0].consumables.count('Potion') == 1
+    a.consumables.remove('Potion')
+    assert len(load_fight(checkpoint.encode(fight), reg).left[0].consumables) == 0
+
+
+def test_file_writer_keeps_the_newest_data_and_removes(tmp_path):
+    writer = FileWriter()
+    path = str(tmp_path / 'file')
+    for i in range(20):
+        writer.write(path, bytes([i]))
+    writer.flush()
+    with open(path, 'rb') as f:
+        assert f.read() == bytes([19])
+    writer.remove(path)
+    writer.flush()
+    assert not (tmp_path / 'file').exists()
+
+
+def test_session_round_trip():
+    a, b = character('A'), character('B')
+    reg = Registry()
+    for c in (a, b):
+        reg.register_character(c)
+    script = rpg.Script()
+    script.add_dialogue(rpg.Dialogue([(a, 'one')]))
+    script.set_flag('met')
+    script.add_dialogue(rpg.Dialogue([(b, 'two')]))
+    world = rpg.World(script)
+    world.advance()
+    world.advance()
+    a.effective_stats.hp = 42.
+
+    fresh = rpg.World(script)
+    characters = load_session(dump_session(world, [a, b]), fresh, reg)
+    assert [c.name for c in characters] == ['A', 'B']
+    assert characters[0].effective_stats.hp == 42.
+    assert fresh.state == {'met': True}
+    assert fresh.cast['A'] is characters[0]
+    # the dialogue on screen when the session was saved is shown again
+    assert fresh.advance()[0][1] == 'two'
+    assert fresh.advance() is None
+
+
+def test_session_saved_while_a_dialogue_is_shown_resumes_on_it():
+    a = character('A')
+    reg = Registry()
+    reg.register_character(a)
+    script = rpg.Script()
+    for line in ('one', 'two', 'three'):
+        script.add_dialogue(rpg.Dialogue([(a, line)]))
+    world = rpg.World(script)
+    assert world.advance()[0][1] == 'one'
+    data = dump_session(world, [a])
+
+    fresh = rpg.World(script)
+    load_session(data, fresh, reg)
+    assert [fresh.advance()[0][1] for _ in range(3)] == ['one', 'two', 'three']
+    assert fresh.advance() is None
+
+
+def test_negative_seed_and_row_round_trip():
+    a, b = character('A'), character('B')
+    a.row = -1
+    reg = Registry()
+    for c in (a, b):
+        reg.register_character(c)
+    fight = rpg.Fight([a], [b], seed=-5)
+    play(fight, 2)
+    restored = load_fight(Checkpointer('unused').encode(fight), reg)
+    assert restored.seed == -5
+    assert restored.left[0].row == -1
+    assert restored.rng.random() == fight.rng.random()
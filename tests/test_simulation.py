@@ -0,0 +1,34 @@
+import rpg
+from rpg.simulation import RandomPolicy, simulate
+from factory import character
+
+
+def swing() -> rpg.Skill:
+    return rpg.FormulaSkill('Swing', 'damage = uniform(5, 15); target.hp -= damage', '{damage}')
+
+
+# party factories are pickled for the worker processes, so they live at module level
+def heroes():
+    return [character('Hero', hp=60., speed=1.5, skills=[swing()]), character('Squire', hp=40., skills=[swing()])]
+
+
+def monsters():
+    return [character('Ogre', hp=120., skills=[swing()])]
+
+
+def summary(result):
+    return result.runs, dict(result.wins), result.turns, result.damage
+
+
+def test_simulation_is_the_same_in_one_or_more_processes():
+    single = simulate(heroes, monsters, RandomPolicy(), 30, seed=11, processes=1)
+    parallel = simulate(heroes, monsters, RandomPolicy(), 30, seed=11, processes=4)
+    assert summary(parallel) == summary(single)
+    assert single.runs == 30
+    assert sum(single.wins.values()) == 30
+
+
+def test_simulation_depends_on_the_seed():
+    first = simulate(heroes, monsters, RandomPolicy(), 10, seed=1, processes=1)
+    assert summary(simulate(heroes, monsters, RandomPolicy(), 10, seed=1, processes=1)) == summary(first)
+    assert simulate(heroes, monsters, RandomPolicy(), 10, seed=2, processes=1).damage != first.damage
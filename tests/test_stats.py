@@ -0,0 +1,42 @@
+from rpg import Stats, StatsBatch
+
+
+def test_stats_in_place_operators():
+    s = Stats(10, 2, 3, 4)
+    s += Stats(1, 1, 1, 1)
+    s -= Stats(2, 0, 0, 0)
+    s *= 2
+    assert s == Stats(18, 6, 8, 10)
+
+
+def test_stats_sum():
+    assert sum([Stats(1, 2, 3, 4), Stats(1, 1, 1, 1)]) == Stats(2, 3, 4, 5)
+
+
+def test_batch_round_trip():
+    stats = [Stats(1, 2, 3, 4), Stats(5, 6, 7, 8)]
+    batch = StatsBatch.from_stats(stats)
+    assert len(batch) == 2
+    assert batch.to_stats() == stats
+    assert batch[-1] == stats[1]
+    assert list(batch.column('atk')) == [3, 7]
+
+
+def test_batch_arithmetic():
+    batch = StatsBatch.from_stats([Stats(1, 1, 1, 1), Stats(2, 2, 2, 2)])
+    batch += Stats(1, 0, 0, 0)
+    batch *= 2
+    assert batch.to_stats() == [Stats(4, 2, 2, 2), Stats(6, 4, 4, 4)]
+
+
+def test_batch_sum():
+    a = StatsBatch.from_stats([Stats(1, 2, 3, 4)])
+    b = StatsBatch.from_stats([Stats(1, 1, 1, 1)])
+    assert sum([a, b]).to_stats() == [Stats(2, 3, 4, 5)]
+    assert a.to_stats() == [Stats(1, 2, 3, 4)]
+
+
+def test_batch_set_column():
+    batch = StatsBatch.from_stats([Stats(1, 2, 3, 4), Stats(5, 6, 7, 8)])
+    batch.set_column('hp', [0, 9])
+    assert list(batch.column('hp')) == [0, 9]
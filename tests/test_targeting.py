@@ -0,0 +1,80 @@
+import rpg
+from rpg.util import stat_mod
+from factory import character
+
+
+def party():
+    healer = character('Healer', hp=100., atk=10., skills=[rpg.AreaSkill('Mend', 'allies', stat='int', heal=True)])
+    knight = character('Knight', hp=100.)
+    front, back = character('Front', defense=2.), character('Back')
+    back.row = 1
+    fight = rpg.Fight([healer, knight], [front, back], seed=0)
+    fight.current = healer
+    return fight, healer, knight, front, back
+
+
+def test_resolve_targets():
+    fight, healer, knight, front, back = party()
+    assert fight.resolve_targets(rpg.AreaSkill('Quake', 'enemies'), healer, None) == [front, back]
+    assert fight.resolve_targets(rpg.AreaSkill('Rally', 'allies'), healer, None) == [healer, knight]
+    assert fight.resolve_targets(rpg.AreaSkill('Focus', 'self'), healer, None) == [healer]
+    assert fight.resolve_targets(rpg.AreaSkill('Sweep', 'row'), healer, None) == [front]
+    assert fight.resolve_targets(rpg.AreaSkill('Sweep', 'row'), healer, ['Back']) == [back]
+    assert fight.resolve_targets(healer.skills[0], healer, None) == [healer, knight]
+    hit = knight.skills[0]
+    assert fight.resolve_targets(hit, knight, ['Back', 'Front']) is back
+    assert fight.resolve_targets(hit, knight, None) is None
+
+
+def test_dead_characters_are_not_hit():
+    fight, healer, knight, front, back = party()
+    front.effective_stats.hp = 0
+    assert fight.resolve_targets(rpg.AreaSkill('Quake', 'enemies'), healer, None) == [back]
+    assert [label for label, _ in fight.target_groups(rpg.AreaSkill('Sweep', 'row'), healer)] == ['Row 2: Back']
+
+
+def test_target_groups():
+    fight, healer, knight, front, back = party()
+    assert [label for label, _ in fight.target_groups(knight.skills[0], knight)] == \
+        ['Healer', 'Knight', 'Front', 'Back']
+    assert fight.target_groups(rpg.AreaSkill('Sweep', 'row'), healer) == \
+        [('Row 1: Front', [front]), ('Row 2: Back', [back])]
+    assert fight.target_groups(rpg.AreaSkill('Quake', 'enemies'), healer) == [('All enemies', [front, back])]
+
+
+def test_area_damage_and_heal_cap():
+    fight, healer, knight, front, back = party()
+    fight.current = knight
+    knight.skills = [rpg.AreaSkill('Quake', 'enemies', scale=.5)]
+    fight.turn_action('Quake', None)
+    assert (front.effective_stats.hp, back.effective_stats.hp) == (97., 95.)
+
+    fight.current = healer
+    healer.effective_stats.hp, knight.effective_stats.hp = 99., 50.
+    fight.turn_action('Mend', None)
+    assert (healer.effective_stats.hp, knight.effective_stats.hp) == (100., 55.)
+
+
+def test_stats_mod_doesnt_swallow_a_self_heal():
+    fight, healer, knight, front, back = party()
+    healer.effects.append(rpg.StatsMod('Inspired', '', 5, stat_mod(intelligence=lambda x: x * 4),
+                                       lambda c: ''))
+    healer.effective_stats.hp = 40.
+    knight.effective_stats.hp = 40.
+    fight.turn_action('Mend', None)
+    # int 5 * 4 while the mod is active, and the heal lands on the real stats of both
+    assert healer.effective_stats.hp == 60.
+    assert knight.effective_stats.hp == 60.
+    assert healer.effective_stats.int == 5.
+
+
+def test_stats_mod_applies_for_the_action_only():
+    fight, healer, knight, front, back = party()
+    fight.current = knight
+    knight.effects.append(rpg.StatsMod('Rage', '', 5, stat_mod(atk=lambda x: x * 2), lambda c: ''))
+    knight.effective_stats.hp = 30.
+    fight.turn_action('Hit', 'Back')
+    assert back.effective_stats.hp == 80.
+    assert knight.effective_stats.atk == 10.
+    # the user keeps its current hp rather than the modified (max) hp
+    assert knight.effective_stats.hp == 30.
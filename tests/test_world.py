@@ -0,0 +1,90 @@
+import pytest
+
+import rpg
+from rpg.content import Catalog
+from rpg.serialization import dump_world, load_world
+from test_content import BOT_CONTENT
+
+
+def lines(world: rpg.World):
+    said = []
+    node = world.advance()
+    while node is not None:
+        said += [(author.name, line) for author, line in node]
+        node = world.advance()
+    return said
+
+
+def test_speakers_are_the_scripts_characters():
+    a = rpg.Character('A')
+    script = rpg.Script()
+    script.add_dialogue(rpg.Dialogue([(a, 'hi')]))
+    world = rpg.World(script)
+    assert world.advance()[0][0] is a
+
+
+def test_catalog_scripts_use_the_given_cast():
+    catalog = Catalog.load(BOT_CONTENT, cache=False)
+    cast = {name: catalog.character(name) for name in ('Najim', 'RoaR', 'Chicken God')}
+    script = catalog.script('intro', cast)
+    assert {c.name: c for c in script.protagonists} == cast
+    world = rpg.World(script)
+    assert world.advance()[0][0] is cast['Chicken God']
+
+
+def test_jump_cycle_without_dialogue_is_an_error():
+    script = rpg.Script()
+    script.label('top')
+    script.jump('top')
+    script.add_dialogue(rpg.Dialogue([(rpg.Character('A'), 'unreachable')]))
+    with pytest.raises(ValueError, match='loops forever'):
+        rpg.World(script).advance()
+
+
+def test_loop_that_sets_its_exit_flag_terminates():
+    a = rpg.Character('A')
+    script = rpg.Script()
+    script.label('top')
+    script.jump('end', 'done')
+    script.set_flag('done')
+    script.jump('top')
+    script.label('end')
+    script.add_dialogue(rpg.Dialogue([(a, 'out')]))
+    assert lines(rpg.World(script)) == [('A', 'out')]
+
+
+def test_flags_must_be_json_scalars():
+    script = rpg.Script()
+    script.set_flag('items', ['a'])
+    with pytest.raises(ValueError, match='items'):
+        rpg.World(script)
+    world = rpg.World(rpg.Script(), state={'obj': object()})
+    with pytest.raises(ValueError):
+        dump_world(world)
+
+
+def test_world_snapshot_round_trip():
+    a = rpg.Character('A')
+    script = rpg.Script()
+    script.set_flag('mood', 'happy')
+    script.add_dialogue(rpg.Dialogue([(a, 'one')]))
+    script.add_dialogue(rpg.Dialogue([(a, 'two')]))
+    world = rpg.World(script)
+    world.advance()
+    world.advance()
+    resumed = load_world(dump_world(world), rpg.World(script))
+    assert resumed.state == {'mood': 'happy'}
+    # 'two' was on screen when the snapshot was taken
+    assert lines(resumed) == [('A', 'two')]
+
+
+def test_shelved_graph_is_closed(tmp_path):
+    a = rpg.Character('A')
+    script = rpg.Script()
+    script.add_dialogue(rpg.Dialogue([(a, 'stored')]))
+    path = str(tmp_path / 'graph')
+    rpg.compile_script(script).save(path)
+    with rpg.ScriptGraph.open(path) as graph:
+        assert lines(rpg.World(graph, cast={'A': a})) == [('A', 'stored')]
+    with pytest.raises(ValueError):
+        graph[0]